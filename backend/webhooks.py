@@ -9,6 +9,8 @@ import sys
 import json
 import csv
 import os
+import threading
+import time
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -31,6 +33,21 @@ DB_SETTINGS: Dict[str, Any] = {
 }
 POSTGRES_TABLE: str = os.getenv("DB_TABLE", "parking")
 
+# Pedestrians go to their own table (migration 006), so the vehicle queries
+# never scan them; they still count toward footfall through its rollup.
+DETECTIONS_TABLE: str = os.getenv("DB_DETECTIONS_TABLE", "parking_detections")
+DETECTION_CATEGORIES: Tuple[str, ...] = ("pedestrian",)
+
+# Color, gate and description are stored as ids into these dimension tables
+# (migration 007), keyed by the position of the column in a Record.
+DIMENSION_TABLES: Tuple[Tuple[int, str], ...] = ((3, "parking_colors"), (5, "parking_gates"),
+                                                 (7, "parking_descriptions"))
+
+# Gate registry (JSON): the direction ("in" or "out") and vehicle class of
+# every webhook gate, stored with each row it receives.
+GATE_REGISTRY_PATH: str = os.getenv("GATE_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  "gates.json"))
+
 # TIMESTAMP_MODE determines how we log the source timestamp:
 #   "vehicle" - use each vehicle's "Trajectory end" for logging reference.
 #   "top"     - use the top-level "data_end_timestamp" for logging reference.
@@ -38,6 +55,13 @@ POSTGRES_TABLE: str = os.getenv("DB_TABLE", "parking")
 # The actual DB insertion always uses the current system UTC timestamp.
 TIMESTAMP_MODE: str = os.getenv("TIMESTAMP_MODE", "system").lower()
 
+# Monthly partitions of the parking table (migration 004): how many months
+# ahead to create, how many months of data to keep attached (0 = keep all)
+# and how often to run the maintenance, in seconds.
+PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+PARKING_RETENTION_MONTHS: int = int(os.getenv("PARKING_RETENTION_MONTHS", 0))
+PARTITION_MAINTENANCE_INTERVAL: int = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", 6 * 3600))
+
 # In-memory storage for logged IDs to avoid duplicate processing.
 LOGGED_IDS: Dict[str, set] = {
     "ganajan_car_in": set(),
@@ -46,6 +70,14 @@ LOGGED_IDS: Dict[str, set] = {
     "ganajan_bike_out": set(),
 }
 
+# A row for the parking table: (insertion_id, license_plate, category, color,
+# timestamp, gate, zone, description, direction, vehicle_class).
+Record = Tuple[str, str, str, str, datetime, str, str, str, Optional[str], Optional[str]]
+# The same row as stored (migration 007): color, gate and description as
+# dimension ids, zone as an integer.
+Row = Tuple[str, str, str, Optional[int], datetime, Optional[int], Optional[int], Optional[int], Optional[str],
+            Optional[str]]
+
 # ---------------------------------------------------------------------
 # LOGGING CONFIGURATION
 # ---------------------------------------------------------------------
@@ -103,6 +135,51 @@ class PrefixFilter(logging.Filter):
 
 logging.getLogger().addFilter(PrefixFilter())
 
+# ---------------------------------------------------------------------
+# GATE REGISTRY
+# ---------------------------------------------------------------------
+GATE_DIRECTIONS: Tuple[str, ...] = ("in", "out")
+
+def load_gate_registry(path: str) -> Dict[str, Dict[str, str]]:
+    """
+    Read the gate registry: {gate: {"direction": "in" | "out", "vehicle_class": ...}}.
+    
+    A missing file leaves the registry empty, so every gate falls back to its name.
+    Raises ValueError for an entry without a valid direction.
+    """
+    try:
+        with open(path) as f:
+            registry: Dict[str, Dict[str, str]] = json.load(f)
+    except FileNotFoundError:
+        log_with_prefix(logging.WARNING, "GATES", f"No gate registry at {path}; using gate names.")
+        return {}
+    for gate, entry in registry.items():
+        if entry.get("direction") not in GATE_DIRECTIONS:
+            raise ValueError(f"Gate {gate} in {path}: direction must be one of {', '.join(GATE_DIRECTIONS)}")
+    return registry
+
+GATE_REGISTRY: Dict[str, Dict[str, str]] = load_gate_registry(GATE_REGISTRY_PATH)
+UNREGISTERED_GATES: set = set()
+
+def gate_attributes(gate: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    The (direction, vehicle_class) of a gate from the registry.
+    
+    A gate missing from the registry falls back to the old naming convention,
+    <site>_<vehicle_class>_<in|out>, with a warning; when its name does not
+    follow it either, both are None.
+    """
+    entry = GATE_REGISTRY.get(gate)
+    if entry is not None:
+        return entry["direction"], entry.get("vehicle_class")
+    if gate not in UNREGISTERED_GATES:
+        UNREGISTERED_GATES.add(gate)
+        log_with_prefix(logging.WARNING, "GATES", f"Gate {gate} is not in the gate registry.")
+    parts = gate.rsplit("_", 2)
+    if len(parts) == 3 and parts[2] in GATE_DIRECTIONS:
+        return parts[2], parts[1]
+    return None, None
+
 # ---------------------------------------------------------------------
 # CSV DEBUG LOGGING
 # ---------------------------------------------------------------------
@@ -138,27 +215,131 @@ def get_db_connection() -> psycopg2.extensions.connection:
     """Establish a connection to the PostgreSQL database."""
     return psycopg2.connect(**DB_SETTINGS)
 
-def insert_data_to_db(records: List[Tuple[str, str, str, str, datetime, str, str, str]]) -> None:
+# name -> id of every dimension table, loaded on first use. Ids a transaction
+# adds are cached once it commits, so a value that is already known never
+# costs a round-trip.
+DIMENSION_IDS: Dict[str, Dict[str, int]] = {}
+DIMENSION_LOCK = threading.Lock()
+
+def dimension_ids(cur: psycopg2.extensions.cursor, table: str,
+                  names: set) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    The ids of names in a dimension table, inserting the names it does not have yet.
+    
+    Returns (ids of all the names, ids added in this transaction).
+    """
+    with DIMENSION_LOCK:
+        known: Optional[Dict[str, int]] = DIMENSION_IDS.get(table)
+    if known is None:
+        cur.execute(f"SELECT name, id FROM {table}")
+        known = dict(cur.fetchall())
+        with DIMENSION_LOCK:
+            DIMENSION_IDS[table] = known
+    missing: List[str] = sorted(name for name in names if name not in known)
+    added: Dict[str, int] = {}
+    if missing:
+        # ON CONFLICT waits for a concurrent writer inserting the same name;
+        # the SELECT, a new statement, then sees its row too.
+        cur.execute(f"INSERT INTO {table} (name) SELECT unnest(%s::text[]) ON CONFLICT (name) DO NOTHING",
+                    (missing,))
+        cur.execute(f"SELECT name, id FROM {table} WHERE name = ANY(%s::text[])", (missing,))
+        added = dict(cur.fetchall())
+    return {**known, **added}, added
+
+def zone_number(zone: Optional[str]) -> Optional[int]:
+    """The integer zone (cube id) of a record; None when it is not a number."""
+    zone = str(zone) if zone is not None else ""
+    return int(zone) if zone.isdigit() and len(zone) <= 9 else None
+
+def encode_records(cur: psycopg2.extensions.cursor,
+                   records: List[Record]) -> Tuple[List[Row], Dict[str, Dict[str, int]]]:
     """
-    Insert records into the PostgreSQL database.
+    The rows to store for records: color, gate and description as dimension
+    ids and zone as an integer.
+    
+    Returns the rows and, per dimension table, the ids this transaction added.
+    """
+    ids: Dict[str, Dict[str, int]] = {}
+    added: Dict[str, Dict[str, int]] = {}
+    for column, table in DIMENSION_TABLES:
+        names = {record[column] for record in records if record[column] is not None}
+        ids[table], added[table] = dimension_ids(cur, table, names)
+    colors, gates, descriptions = (ids[table] for _, table in DIMENSION_TABLES)
+    rows: List[Row] = [
+        (insertion_id, license_plate, category, colors.get(color), timestamp, gates.get(gate),
+         zone_number(zone), descriptions.get(description), direction, vehicle_class)
+        for (insertion_id, license_plate, category, color, timestamp, gate, zone, description,
+             direction, vehicle_class) in records
+    ]
+    return rows, added
+
+def route_records(records: List[Row]) -> Dict[str, List[Row]]:
+    """Split rows by table: DETECTION_CATEGORIES to DETECTIONS_TABLE, vehicles to POSTGRES_TABLE."""
+    routed: Dict[str, List[Row]] = {POSTGRES_TABLE: [], DETECTIONS_TABLE: []}
+    for record in records:
+        table: str = DETECTIONS_TABLE if record[2] in DETECTION_CATEGORIES else POSTGRES_TABLE
+        routed[table].append(record)
+    return routed
+
+def insert_data_to_db(records: List[Record]) -> None:
+    """
+    Insert records into the PostgreSQL database, encoded by encode_records and
+    routed by route_records, in one transaction.
     
     Each record is:
-      (insertion_id, license_plate, category, color, timestamp, gate, zone, description)
+      (insertion_id, license_plate, category, color, timestamp, gate, zone, description,
+       direction, vehicle_class)
     """
-    query: str = f"""
-    INSERT INTO {POSTGRES_TABLE}
-    (insertion_id, license_plate, category, color, timestamp, gate, zone, description)
+    query: str = """
+    INSERT INTO {table}
+    (insertion_id, license_plate, category, color_id, timestamp, gate_id, zone, description_id, direction,
+     vehicle_class)
     VALUES %s
     """
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                execute_values(cur, query, records)
+                rows, added = encode_records(cur, records)
+                for table, routed in route_records(rows).items():
+                    if routed:
+                        execute_values(cur, query.format(table=table), routed)
                 conn.commit()
+        with DIMENSION_LOCK:
+            for table, ids in added.items():
+                DIMENSION_IDS[table] = {**DIMENSION_IDS[table], **ids}
         log_with_prefix(logging.INFO, "DB_HAND", "Data inserted successfully.")
     except Exception as e:
         log_with_prefix(logging.ERROR, "DB_HAND", f"Database insertion failed: {e}")
 
+def maintain_partitions() -> None:
+    """
+    Create the upcoming monthly partitions and apply the retention policy.
+    
+    Expired partitions are detached into the `archive` schema by the database
+    function rather than deleted row by row.
+    """
+    try:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT parking_maintain_partitions(%s, %s)",
+                            (PARTITION_MONTHS_AHEAD, PARKING_RETENTION_MONTHS))
+                archived: List[str] = [row[0] for row in cur.fetchall()]
+            conn.commit()
+        finally:
+            conn.close()
+        log_with_prefix(logging.INFO, "DB_HAND", f"Partitions ensured {PARTITION_MONTHS_AHEAD} months ahead.")
+        for name in archived:
+            log_with_prefix(logging.INFO, "DB_HAND", f"Detached expired partition to {name}.")
+    except Exception as e:
+        log_with_prefix(logging.ERROR, "DB_HAND", f"Partition maintenance failed: {e}")
+
+def partition_maintenance_loop() -> None:
+    """Run maintain_partitions now and then every PARTITION_MAINTENANCE_INTERVAL seconds."""
+    while True:
+        maintain_partitions()
+        time.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
 # ---------------------------------------------------------------------
 # TIMESTAMP PROCESSING (for logging/reference only)
 # ---------------------------------------------------------------------
@@ -196,7 +377,7 @@ def process_new_entries(
     webhook_data: Dict[str, Any],
     webhook_uri: str,
     webhook_name: str
-) -> Tuple[List[Tuple[str, str, str, str, datetime, str, str, str]], List[str]]:
+) -> Tuple[List[Record], List[str]]:
     """
     Process the vehicle rows and prepare them for DB insertion.
     
@@ -207,7 +388,7 @@ def process_new_entries(
     The actual timestamp inserted into the DB is always generated as the current system UTC time.
     TIMESTAMP_MODE only affects the "source" string shown in logs.
     """
-    new_entries: List[Tuple[str, str, str, str, datetime, str, str, str]] = []
+    new_entries: List[Record] = []
     inserted_ids_with_timestamps: List[str] = []
 
     headers: List[str] = webhook_data['data'].get('header', [])
@@ -215,6 +396,7 @@ def process_new_entries(
 
     cube_id: str = webhook_data.get('cube_id', 'N/A')
     name: str = webhook_data.get('name', webhook_name)
+    direction, vehicle_class = gate_attributes(webhook_uri)
 
     for row in rows:
         vehicle: Dict[str, str] = dict(zip(headers, row))
@@ -257,13 +439,15 @@ def process_new_entries(
             db_timestamp,   # Always system UTC timestamp.
             gate,
             zone,
-            description
+            description,
+            direction,
+            vehicle_class
         ))
         inserted_ids_with_timestamps.append(f"{insertion_id} {formatted_db_ts} (SRC={source_str})")
 
     return new_entries, inserted_ids_with_timestamps
 
-def insert_new_entries(new_entries: List[Tuple[str, str, str, str, datetime, str, str, str]]) -> None:
+def insert_new_entries(new_entries: List[Record]) -> None:
     """Insert new vehicle entries into the database if any exist."""
     if new_entries:
         insert_data_to_db(new_entries)
@@ -369,5 +553,6 @@ def ganajan_bike_out() -> Any:
 # ---------------------------------------------------------------------
 if __name__ == '__main__':
     ensure_csv_file_exists()  # Ensure the CSV file is created if needed.
+    threading.Thread(target=partition_maintenance_loop, name="partitions", daemon=True).start()
     log_with_prefix(logging.INFO, "STARTUP", "Flask app starting on 0.0.0.0:5000")
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,434 @@
+# api_bench.py
+"""
+API benchmark: the dashboard's request mixes against synthetic databases.
+
+For every --sizes entry, a database <prefix>_<size> is created from the schema
+of --template (CREATE DATABASE ... TEMPLATE, so the template must be idle) and
+filled by generate_parking.py with that many rows ending today, so the "today"
+statistics have data. It is kept for later runs and reloaded only when its
+row count, seed or date range no longer match (--reuse accepts a stale date
+range, since 100M rows take a while to load). The endpoint (app.py, or
+asgi.py with --server asgi) is started against it and every mix is replayed:
+
+- dashboard: the Dashboard page polling /dashboard/summary, recent entries,
+  filter options and the dashboard search,
+- database: Database page searches (/data1) with date ranges, filters and
+  paging,
+- analytics: /stats/enhanced-stats over today/week/month/custom ranges,
+  category and duration statistics,
+- export: record counts and CSV exports of a day or a week.
+
+Requests are drawn from the mix weights with --seed, so every run sends the
+same requests, --concurrency at a time after --warmup unrecorded ones. Per
+mix and per endpoint the results hold p50/p95/p99 latency and throughput,
+plus the database's buffer hits, reads and temp bytes from pg_stat_database
+over the mix. They are written as JSON to --out and, when --baseline exists,
+compared with it: an endpoint (with enough requests) whose p95 grew by more than --tolerance (and
+--min-delta-ms), or a mix whose throughput fell by more than --tolerance, is
+a regression and the exit status is 1. --save-baseline stores the results as
+the new baseline. Baselines only compare runs on the same machine.
+
+Usage (database settings come from the usual DB_* environment variables):
+    python bench/api_bench.py --sizes 100000 10000000 100000000
+    python bench/api_bench.py --sizes 100000 --mixes dashboard database --save-baseline
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from generate_parking import TrafficGenerator, learn, load, SAMPLE_CSV
+
+load_dotenv()
+
+ENDPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "endpoint")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+SERVERS = {
+    "flask": lambda port: [sys.executable, "-c",
+                           f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    "asgi": lambda port: [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                          "--log-level", "warning"],
+}
+
+Request = Tuple[str, str, Dict[str, Any]]  # (endpoint label, path, query parameters)
+
+CATEGORIES = ["car", "motorcycle", "pedestrian", "bus", "van"]
+COLORS = ["white", "black", "silver", "red"]
+PREFIXES = ["MH30", "MH28", "MH27", "MH12", "MH2", "MH"]
+SEARCHES = ["MH12", "MH30", "car", "white"]
+
+# Endpoints with fewer recorded requests are not compared with the baseline (their p95 is noise).
+MIN_SAMPLES = 10
+
+
+def gmt(ts: datetime) -> str:
+    """Dates as the frontend sends them (Date.toUTCString())."""
+    return ts.strftime("%a, %d %b %Y %H:%M:%S GMT")
+
+
+def utc_label(ts: datetime) -> str:
+    """Dates as the Database page sends them."""
+    return ts.strftime("%a, %d %b %Y %H:%M:%S UTC")
+
+
+def _range(rng: random.Random, span: Tuple[datetime, datetime], days: Sequence[int]) -> Tuple[datetime, datetime]:
+    """A range of one of the given lengths (whole days) inside span."""
+    first, last = span
+    length = timedelta(days=rng.choice(days))
+    latest = max(first, last - length)
+    start = first + timedelta(seconds=rng.randrange(int((latest - first).total_seconds()) + 1))
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + length - timedelta(seconds=1)
+
+
+def _dashboard(rng: random.Random, span: Tuple[datetime, datetime]) -> Request:
+    choice = rng.choices(["summary", "recent", "filters", "search"], weights=[6, 2, 1, 1])[0]
+    if choice == "summary":
+        return "/dashboard/summary", "/dashboard/summary", {"page": 1, "page_size": 10}
+    if choice == "recent":
+        return "/stats/recent-entries", "/stats/recent-entries", {}
+    if choice == "filters":
+        name = rng.choice(["categories", "colors", "gates"])
+        return f"/filters/{name}", f"/filters/{name}", {}
+    return "/dashboard/data?search", "/dashboard/data", {"page": rng.randint(1, 3), "page_size": 10,
+                                                         "search": rng.choice(SEARCHES)}
+
+
+def _database(rng: random.Random, span: Tuple[datetime, datetime]) -> Request:
+    start, end = _range(rng, span, [1, 7, 30])
+    params: Dict[str, Any] = {"page": rng.choice([1, 1, 1, 2, 5, 20]), "page_size": rng.choice([10, 25, 50]),
+                              "start_date": utc_label(start), "end_date": utc_label(end)}
+    filter_kind = rng.choice(["none", "category", "color", "prefix", "search"])
+    if filter_kind == "category":
+        params["categories"] = ",".join(rng.sample(CATEGORIES, rng.randint(1, 2)))
+    elif filter_kind == "color":
+        params["colors"] = rng.choice(COLORS)
+    elif filter_kind == "prefix":
+        params["license_prefix"] = rng.choice(PREFIXES)
+    elif filter_kind == "search":
+        params["search"] = rng.choice(SEARCHES)
+    return f"/data1 ({filter_kind})", "/data1", params
+
+
+def _analytics(rng: random.Random, span: Tuple[datetime, datetime]) -> Request:
+    choice = rng.choices(["enhanced", "category", "duration"], weights=[6, 2, 1])[0]
+    if choice == "enhanced":
+        time_range = rng.choice(["today", "week", "month", "custom"])
+        if time_range != "custom":
+            return f"/stats/enhanced-stats ({time_range})", "/stats/enhanced-stats", {"time_range": time_range}
+        start, end = _range(rng, span, [7, 30, 90])
+        return ("/stats/enhanced-stats (custom)", "/stats/enhanced-stats",
+                {"time_range": "custom", "start_date": gmt(start), "end_date": gmt(end)})
+    if choice == "category":
+        start, end = _range(rng, span, [1, 7, 30])
+        return "/stats/category-stats", "/stats/category-stats", {"start_date": gmt(start), "end_date": gmt(end)}
+    start, _ = _range(rng, span, [1, 7])
+    return "/stats/duration-stats", "/stats/duration-stats", {"start_time": start.isoformat(), "mode": "percentiles"}
+
+
+def _export(rng: random.Random, span: Tuple[datetime, datetime]) -> Request:
+    start, end = _range(rng, span, [1, 7])
+    params: Dict[str, Any] = {"start_date": gmt(start), "end_date": gmt(end)}
+    if rng.random() < 0.5:
+        params["categories"] = rng.choice(CATEGORIES)
+    if rng.random() < 0.6:
+        return "/count", "/count", {**params, "scope": "export"}
+    if (end - start) > timedelta(days=1):
+        return "/export (csv, week)", "/export", {**params, "file_format": "csv"}
+    return "/export (csv, day)", "/export", {**params, "file_format": "csv"}
+
+
+MIXES: Dict[str, Callable[[random.Random, Tuple[datetime, datetime]], Request]] = {
+    "dashboard": _dashboard,
+    "database": _database,
+    "analytics": _analytics,
+    "export": _export,
+}
+
+
+def admin_connect(dbname: str) -> Any:
+    conn = psycopg2.connect(
+        dbname=dbname,
+        user=os.environ.get("DB_USER", "postgres"),
+        password=os.environ.get("DB_PASSWORD"),
+        host=os.environ.get("DB_HOST", "localhost"),
+        port=os.environ.get("DB_PORT", 5432),
+    )
+    conn.autocommit = True
+    return conn
+
+
+def prepare_database(size: int, args: argparse.Namespace) -> Tuple[str, Tuple[datetime, datetime]]:
+    """The benchmark database for size, (re)loaded when needed, and the time span of its rows."""
+    dbname = f"{args.db_prefix}_{size}"
+    start = date.today() - timedelta(days=args.days - 1)
+    wanted = {"rows": size, "seed": args.seed, "days": args.days, "start": start.isoformat()}
+    conn = admin_connect("postgres")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbname,))
+            if cur.fetchone() is None:
+                cur.execute(f'CREATE DATABASE "{dbname}" TEMPLATE "{args.template}"')
+    finally:
+        conn.close()
+    loaded: Optional[Dict[str, Any]] = None
+    conn = admin_connect(dbname)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CREATE TABLE IF NOT EXISTS bench_dataset (rows BIGINT, seed BIGINT, days INT, start DATE)")
+            cur.execute("SELECT rows, seed, days, start FROM bench_dataset")
+            row = cur.fetchone()
+            if row:
+                loaded = {"rows": row[0], "seed": row[1], "days": row[2], "start": row[3].isoformat()}
+        stale = loaded is None or any(loaded[key] != wanted[key] for key in ("rows", "seed", "days"))
+        if not stale and loaded["start"] != wanted["start"] and not args.reuse:
+            stale = True
+        if stale:
+            print(f"Loading {size} rows into {dbname}...", file=sys.stderr)
+            model = learn(args.sample)
+            generator = TrafficGenerator(model, size, start, args.days, args.seed)
+            load(generator.batches(), start, args.days, truncate=True, dbname=dbname)
+            with conn.cursor() as cur:
+                cur.execute("TRUNCATE bench_dataset")
+                cur.execute("INSERT INTO bench_dataset VALUES (%(rows)s, %(seed)s, %(days)s, %(start)s)", wanted)
+                cur.execute("VACUUM (ANALYZE) parking")
+                cur.execute("SELECT to_regclass('parking_detections') IS NOT NULL")
+                if cur.fetchone()[0]:
+                    cur.execute("VACUUM (ANALYZE) parking_detections")
+        with conn.cursor() as cur:
+            cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM parking")
+            first, last = cur.fetchone()
+    finally:
+        conn.close()
+    return dbname, (first, min(last, datetime.now(timezone.utc)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """The endpoint service running against dbname, in a subprocess."""
+
+    def __init__(self, kind: str, dbname: str, log_path: str) -> None:
+        self.port = free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        env = {**os.environ, "DB_NAME": dbname, "QUERY_STATS": os.environ.get("QUERY_STATS", "false")}
+        self.log = open(log_path, "w")
+        self.process = subprocess.Popen(SERVERS[kind](self.port), cwd=ENDPOINT_DIR, env=env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout: float = 60) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"The endpoint exited with status {self.process.returncode}; see {self.log.name}")
+            try:
+                urllib.request.urlopen(f"{self.base}/filters/gates", timeout=5).read()
+                return
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.2)
+        raise RuntimeError(f"The endpoint did not answer within {timeout}s; see {self.log.name}")
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def send(base: str, request: Request) -> Tuple[str, float, bool, int]:
+    """One request: (endpoint label, seconds, ok, response bytes)."""
+    label, path, params = request
+    url = f"{base}{path}?{urllib.parse.urlencode(params)}" if params else f"{base}{path}"
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=300) as response:
+            body = response.read()
+        return label, time.perf_counter() - started, True, len(body)
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return label, time.perf_counter() - started, False, 0
+
+
+def db_counters(dbname: str) -> Dict[str, int]:
+    conn = admin_connect(dbname)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT blks_hit, blks_read, temp_bytes FROM pg_stat_database "
+                        "WHERE datname = current_database()")
+            hit, read, temp = cur.fetchone()
+    finally:
+        conn.close()
+    return {"blks_hit": hit, "blks_read": read, "temp_bytes": temp}
+
+
+def summarize(latencies: List[float]) -> Dict[str, Any]:
+    ms = np.array(latencies) * 1000
+    if not len(ms):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"count": len(ms), "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3), "mean_ms": round(float(ms.mean()), 3), "max_ms": round(float(ms.max()), 3)}
+
+
+def run_mix(server: Server, dbname: str, mix: str, span: Tuple[datetime, datetime],
+            args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(f"{args.seed}:{mix}")
+    requests = [MIXES[mix](rng, span) for _ in range(args.warmup + args.requests)]
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(lambda r: send(server.base, r), requests[:args.warmup]))
+        # Statistics reach pg_stat_database when a backend goes idle (within a second).
+        time.sleep(1.5)
+        before = db_counters(dbname)
+        started = time.perf_counter()
+        results = list(pool.map(lambda r: send(server.base, r), requests[args.warmup:]))
+        elapsed = time.perf_counter() - started
+    time.sleep(1.5)
+    after = db_counters(dbname)
+    buffers = {key: after[key] - before[key] for key in after}
+    total = buffers["blks_hit"] + buffers["blks_read"]
+    buffers["hit_ratio"] = round(buffers["blks_hit"] / total, 4) if total else None
+    by_endpoint: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for label, seconds, ok, _ in results:
+        if ok:
+            by_endpoint.setdefault(label, []).append(seconds)
+        else:
+            errors[label] = errors.get(label, 0) + 1
+    succeeded = [seconds for _, seconds, ok, _ in results if ok]
+    return {
+        "requests": len(results),
+        "errors": sum(errors.values()),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(succeeded) / elapsed, 2) if elapsed else None,
+        "response_bytes": sum(nbytes for _, _, _, nbytes in results),
+        "latency": summarize(succeeded),
+        "endpoints": {label: {**summarize(values), "errors": errors.get(label, 0)}
+                      for label, values in sorted(by_endpoint.items())},
+        "db": buffers,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """Regressions of results against baseline, as readable lines."""
+    regressions = []
+    for size, mixes in results["sizes"].items():
+        for mix, current in mixes.items():
+            base = baseline.get("sizes", {}).get(size, {}).get(mix)
+            if base is None:
+                continue
+            if base.get("throughput_rps") and current["throughput_rps"] is not None \
+                    and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+                regressions.append(f"{size} {mix}: throughput {current['throughput_rps']} req/s, "
+                                   f"baseline {base['throughput_rps']}")
+            for label, stats in current["endpoints"].items():
+                old = base.get("endpoints", {}).get(label)
+                if not old or min(old.get("count", 0), stats["count"]) < MIN_SAMPLES:
+                    continue
+                if stats["p95_ms"] > old["p95_ms"] * (1 + tolerance) and stats["p95_ms"] - old["p95_ms"] > min_delta_ms:
+                    regressions.append(f"{size} {mix} {label}: p95 {stats['p95_ms']} ms, baseline {old['p95_ms']} ms")
+    return regressions
+
+
+def print_table(results: Dict[str, Any]) -> None:
+    print(f"{'size':>10} {'mix':<10} {'endpoint':<34} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for size, mixes in results["sizes"].items():
+        for mix, result in mixes.items():
+            for label, stats in result["endpoints"].items():
+                print(f"{size:>10} {mix:<10} {label:<34} {stats['count']:>5} {stats['p50_ms']:>9.1f} "
+                      f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+            db = result["db"]
+            print(f"{size:>10} {mix:<10} {'= ' + str(result['throughput_rps']) + ' req/s':<34} "
+                  f"{result['requests']:>5} errors {result['errors']}, buffers hit {db['blks_hit']} "
+                  f"read {db['blks_read']} temp {db['temp_bytes']} bytes")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ENDPOINT_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Sequence[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--mixes", nargs="+", default=list(MIXES), choices=list(MIXES))
+    parser.add_argument("--server", default="flask", choices=list(SERVERS))
+    parser.add_argument("--requests", type=int, default=200, help="recorded requests per mix")
+    parser.add_argument("--warmup", type=int, default=20, help="unrecorded requests before each mix")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="days of data, ending today")
+    parser.add_argument("--sample", default=SAMPLE_CSV)
+    parser.add_argument("--template", default=os.environ.get("DB_NAME", "flow"),
+                        help="database whose schema the benchmark databases copy")
+    parser.add_argument("--db-prefix", default="parking_bench")
+    parser.add_argument("--reuse", action="store_true", help="keep a loaded database even if its dates are stale")
+    parser.add_argument("--out", default=None, help="results file (default bench/results/api-<time>.json)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown (default 0.2)")
+    parser.add_argument("--min-delta-ms", type=float, default=5, help="ignore p95 changes smaller than this")
+    args = parser.parse_args(argv)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    results: Dict[str, Any] = {
+        "meta": {"time": stamp, "commit": git_commit(), "server": args.server, "concurrency": args.concurrency,
+                 "requests": args.requests, "seed": args.seed, "days": args.days, "host": socket.gethostname()},
+        "sizes": {},
+    }
+    for size in args.sizes:
+        dbname, span = prepare_database(size, args)
+        server = Server(args.server, dbname, os.path.join(RESULTS_DIR, f"server-{stamp}-{size}.log"))
+        try:
+            server.wait_ready()
+            results["sizes"][str(size)] = {mix: run_mix(server, dbname, mix, span, args) for mix in args.mixes}
+        finally:
+            server.stop()
+
+    out = args.out or os.path.join(RESULTS_DIR, f"api-{stamp}.json")
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print_table(results)
+    print(f"Results written to {out}")
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        status = 1 if regressions else 0
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
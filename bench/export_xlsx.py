@@ -0,0 +1,116 @@
+# export_xlsx.py
+"""
+Benchmark for the XLSX export path: rows/s and peak RSS.
+
+Compares the previous in-memory approach (full Workbook, strftime per
+timestamp, saved to BytesIO) with the streaming write-only writer in
+endpoint/exporters.py. Each run happens in a fresh subprocess so the peak RSS
+figures do not bleed into each other. No database is needed; rows are
+synthesised in-process with the same shape as the parking table.
+
+Usage:
+    python bench/export_xlsx.py --rows 100000 200000
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import Iterator, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "endpoint"))
+
+from exporters import EXPORT_FIELDNAMES, write_xlsx  # noqa: E402
+
+CATEGORIES = ["car", "motorcycle", "light", "van", "bus", "bicycle"]
+COLORS = ["white", "black", "silver", "red", "blue", "undefined"]
+GATES = ["ganajan_car_in", "ganajan_car_out", "ganajan_bike_in", "ganajan_bike_out"]
+
+
+def synthetic_rows(n: int) -> Iterator[tuple]:
+    """Yield rows in EXPORT_FIELDNAMES order."""
+    rnd = random.Random(42)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(n):
+        yield (
+            start + timedelta(seconds=i * 7),
+            f"MH{rnd.randint(10, 99)}CX{rnd.randint(1000, 9999)}",
+            rnd.choice(CATEGORIES),
+            rnd.choice(COLORS),
+            rnd.choice(GATES),
+            "50",
+            "ZONE 2 - Table",
+            str(6000000 + i),
+        )
+
+
+def run_legacy(n: int) -> None:
+    """The previous /export XLSX branch, kept here for comparison only."""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Parking Data"
+    ws.append(EXPORT_FIELDNAMES)
+    for row in synthetic_rows(n):
+        row_data = []
+        for value in dict(zip(EXPORT_FIELDNAMES, row)).values():
+            if isinstance(value, datetime):
+                value = value.strftime('%Y-%m-%d %H:%M:%S')
+            row_data.append(value)
+        ws.append(row_data)
+    output = BytesIO()
+    wb.save(output)
+
+
+def run_streaming(n: int) -> None:
+    """The write-only writer used by /export."""
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        write_xlsx(synthetic_rows(n), path)
+    finally:
+        os.remove(path)
+
+
+MODES = {"legacy": run_legacy, "streaming": run_streaming}
+
+
+def child(mode: str, n: int) -> None:
+    """Run one benchmark in this process and print 'seconds peak_rss_kb'."""
+    t0 = time.perf_counter()
+    MODES[mode](n)
+    elapsed = time.perf_counter() - t0
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{elapsed} {peak_kb}")
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return
+
+    print(f"{'mode':<10} {'rows':>10} {'seconds':>9} {'rows/s':>10} {'peak RSS MB':>12}")
+    for n in args.rows:
+        for mode in args.modes:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", mode, str(n)],
+                check=True, capture_output=True, text=True
+            ).stdout.split()
+            elapsed, peak_kb = float(out[0]), int(out[1])
+            print(f"{mode:<10} {n:>10} {elapsed:>9.2f} {n / elapsed:>10.0f} {peak_kb / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,487 @@
+# generate_parking.py
+"""
+Synthetic parking traffic for scale testing, learned from parking_export.csv.
+
+The sample export holds about 25k camera events from a couple of days, too few
+to show how a query scales. This learns from it:
+
+- the arrival rate for every hour of the week (hours the sample does not
+  cover fall back to the same hour of the other days),
+- the category mix, the colors of each category, the entry gate of each
+  category, and the (zone, description) pairs,
+- the plate formats of each category (letters as A, digits as 9, e.g.
+  AA99AA9999 for MH40CX7965) with the region prefixes they start with
+  (MH40) and how often a plate comes back,
+- dwell times, from entries matched with a later exit of the same plate. The
+  sample only has entries, so DEFAULT_DWELL_MINUTES is used where no exit
+  matches.
+
+and synthesises matched visits: an entry at the learned rate, and an exit of
+the same plate after a dwell time, at the category's exit gate (the entry gate
+with _in turned into _out when the sample has no exits). Returning visitors
+keep their plate and color. Rows come out in timestamp order with sequential
+insertion ids from --first-id, and are loaded into `parking` with COPY in
+batches (creating the monthly partitions first), or written as CSV with
+--csv. The output depends only on the sample, the seed and the options, so a
+benchmark database can be rebuilt exactly.
+
+Usage (database settings come from the usual DB_* environment variables):
+    python bench/generate_parking.py --rows 1000000 --seed 42 --truncate
+    python bench/generate_parking.py --rows 100000000 --days 730 --start 2024-01-01
+    python bench/generate_parking.py --rows 100000 --csv /tmp/parking.csv
+"""
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "parking_export.csv")
+
+COLUMNS = ["insertion_id", "license_plate", "category", "color", "timestamp", "gate", "direction", "vehicle_class",
+           "zone", "description"]
+
+# Columns stored as ids into a dimension table where migration 007 ran, with
+# the id column and the table.
+DIMENSION_COLUMNS = {"color": ("color_id", "parking_colors"), "gate": ("gate_id", "parking_gates"),
+                     "description": ("description_id", "parking_descriptions")}
+
+# The vehicle class in a gate name, as the webhook ingester and migration 005
+# derive it for gates outside the registry (ganajan_car_in -> car).
+VEHICLE_CLASS_PATTERN = r"([^_]+)_(?:in|out)$"
+
+# Median dwell in minutes per category when the sample has no matching exits
+# (log-normal with DWELL_SIGMA), and the longest stay generated.
+DEFAULT_DWELL_MINUTES = {"pedestrian": 20, "bicycle": 60, "motorcycle": 90, "car": 120, "light": 120,
+                         "van": 60, "bus": 30, "tractor": 45, "heavy": 45}
+DEFAULT_DWELL_FALLBACK = 90
+DWELL_SIGMA = 1.0
+MAX_DWELL = timedelta(days=3)
+
+NO_PLATE = "-"
+US_PER_HOUR = 3_600_000_000
+US_PER_DAY = 24 * US_PER_HOUR
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+LETTERS = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+DIGITS = np.array(list("0123456789"))
+
+_REGION = re.compile(r"[A-Z]+[0-9]+(?=.)|[A-Z]+")
+
+
+def plate_mask(plate: str) -> str:
+    """A plate's format: letters as A, digits as 9, anything else kept."""
+    return "".join("A" if c.isalpha() else "9" if c.isdigit() else c for c in plate)
+
+
+def plate_region(plate: str) -> str:
+    """The region code a plate starts with (MH40 for MH40CX7965, E for E37555)."""
+    match = _REGION.match(plate)
+    return match.group(0) if match else ""
+
+
+def _distribution(counts: Counter) -> Tuple[List[Any], np.ndarray]:
+    values = sorted(counts, key=lambda value: (-counts[value], str(value)))
+    p = np.array([counts[value] for value in values], dtype=float)
+    return values, p / p.sum()
+
+
+class TrafficModel:
+    """The distributions learned from a sample export (see learn())."""
+
+    def __init__(self) -> None:
+        self.hourly_rate = np.zeros((7, 24))  # entries per hour, by (weekday, hour)
+        self.categories: Tuple[List[str], np.ndarray] = ([], np.array([]))
+        self.colors: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self.entry_gates: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self.exit_gates: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self.places: Tuple[List[Tuple[str, str]], np.ndarray] = ([], np.array([]))
+        self.masks: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self.regions: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self.dwell_minutes: Dict[str, np.ndarray] = {}  # observed dwell times, when there are any
+        self.returning = 0.0  # share of plated entries whose plate was seen before
+
+    def describe(self) -> Dict[str, Any]:
+        def dist(d: Tuple[List[Any], np.ndarray], top: int = 10) -> Dict[str, float]:
+            return {str(v): round(float(p), 4) for v, p in list(zip(*d))[:top]}
+
+        return {
+            "entries_per_day": round(float(self.hourly_rate.sum() / 7), 1),
+            "hourly_rate": [[round(float(r), 2) for r in day] for day in self.hourly_rate],
+            "categories": dist(self.categories),
+            "colors": {c: dist(d) for c, d in self.colors.items()},
+            "entry_gates": {c: dist(d) for c, d in self.entry_gates.items()},
+            "exit_gates": {c: dist(d) for c, d in self.exit_gates.items()},
+            "plate_formats": {c: dist(d) for c, d in self.masks.items()},
+            "regions": {m: dist(d, 5) for m, d in self.regions.items()},
+            "learned_dwell_categories": sorted(self.dwell_minutes),
+            "returning": round(self.returning, 4),
+        }
+
+
+def learn(path: str) -> TrafficModel:
+    """Fit a TrafficModel to a parking export (the columns of COLUMNS, timestamps in UTC)."""
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    df["ts"] = pd.to_datetime(df["timestamp"], utc=True, format="mixed")
+    df = df.sort_values("ts")
+    is_exit = df["direction"].eq("out") if "direction" in df else df["gate"].str.endswith("_out")
+    entries = df[~is_exit] if (~is_exit).any() else df
+    model = TrafficModel()
+
+    # Rate = entries in each hour of the week / hours of that kind the sample spans.
+    hours = pd.date_range(entries["ts"].min().floor("h"), entries["ts"].max().floor("h"), freq="h")
+    exposure = np.zeros((7, 24))
+    np.add.at(exposure, (hours.weekday, hours.hour), 1)
+    counts = np.zeros((7, 24))
+    np.add.at(counts, (entries["ts"].dt.weekday.to_numpy(), entries["ts"].dt.hour.to_numpy()), 1)
+    by_hour = np.divide(counts.sum(axis=0), exposure.sum(axis=0),
+                        out=np.full(24, counts.sum() / max(exposure.sum(), 1)), where=exposure.sum(axis=0) > 0)
+    model.hourly_rate = np.where(exposure > 0, counts / np.maximum(exposure, 1), by_hour)
+
+    model.categories = _distribution(Counter(entries["category"]))
+    model.places = _distribution(Counter(zip(entries["zone"], entries["description"])))
+    for category, rows in entries.groupby("category"):
+        model.colors[category] = _distribution(Counter(rows["color"]))
+        model.entry_gates[category] = _distribution(Counter(rows["gate"]))
+        model.masks[category] = _distribution(Counter(plate_mask(p) for p in rows["license_plate"]))
+    for category, rows in df[is_exit].groupby("category"):
+        model.exit_gates[category] = _distribution(Counter(rows["gate"]))
+    for category, (gates, p) in model.entry_gates.items():
+        if category not in model.exit_gates:
+            model.exit_gates[category] = ([gate.replace("_in", "_out") for gate in gates], p)
+
+    plated = entries[entries["license_plate"] != NO_PLATE]["license_plate"]
+    regions: Dict[str, Counter] = defaultdict(Counter)
+    for plate in plated:
+        regions[plate_mask(plate)][plate_region(plate)] += 1
+    model.regions = {mask: _distribution(c) for mask, c in regions.items()}
+    model.returning = 1 - plated.nunique() / len(plated) if len(plated) else 0.0
+
+    # Dwell: each exit closes the latest open entry of its plate.
+    open_entries: Dict[str, datetime] = {}
+    dwell: Dict[str, List[float]] = defaultdict(list)
+    for plate, category, ts, out in zip(df["license_plate"], df["category"], df["ts"], is_exit):
+        if plate == NO_PLATE:
+            continue
+        if not out:
+            open_entries[plate] = ts
+        elif plate in open_entries:
+            minutes = (ts - open_entries.pop(plate)).total_seconds() / 60
+            if 0 < minutes <= MAX_DWELL.total_seconds() / 60:
+                dwell[category].append(minutes)
+    model.dwell_minutes = {c: np.sort(np.array(m)) for c, m in dwell.items() if len(m) >= 20}
+    return model
+
+
+def visitor_pool(visits: int, returning: float) -> int:
+    """
+    Number of visitors n such that `visits` uniform draws from them hit
+    (1 - returning) * visits distinct ones: n * (1 - exp(-visits / n)).
+    """
+    target = visits * (1 - returning)
+    if returning <= 0 or target >= visits - 0.5:
+        return visits * 1000
+    low, high = target, visits * 1000.0
+    for _ in range(100):
+        n = (low + high) / 2
+        if n * -np.expm1(-visits / n) < target:
+            low = n
+        else:
+            high = n
+    return max(1, int(round(high)))
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64's finaliser: a well-spread 64-bit hash of each element."""
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def _index(p: np.ndarray, uniform: np.ndarray) -> np.ndarray:
+    """Indexes into a distribution's values at quantiles uniform (in [0, 1))."""
+    return np.minimum(np.searchsorted(np.cumsum(p), uniform, side="right"), len(p) - 1)
+
+
+def _pick(choices: Tuple[List[Any], np.ndarray], uniform: np.ndarray) -> np.ndarray:
+    """Values of a distribution at quantiles uniform (in [0, 1))."""
+    values, p = choices
+    table = np.empty(len(values), dtype=object)
+    table[:] = values
+    return table[_index(p, uniform)]
+
+
+def _unit(h: np.ndarray) -> np.ndarray:
+    return (h >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+class TrafficGenerator:
+    """
+    Visits following a TrafficModel, as parking rows in timestamp order.
+
+    Args:
+        model: The learned distributions.
+        rows: Rows to produce (entries and exits; visits still parked at the
+            end of the range have no exit).
+        start: First day of the range (UTC).
+        days: Length of the range.
+        seed: Seeds every random choice.
+        first_id: insertion_id of the first row.
+    """
+
+    def __init__(self, model: TrafficModel, rows: int, start: date, days: int, seed: int,
+                 first_id: int = 100_000_000) -> None:
+        self.model = model
+        self.rows = rows
+        self.start_us = int((datetime(start.year, start.month, start.day, tzinfo=timezone.utc) - EPOCH)
+                            / timedelta(microseconds=1))
+        self.days = days
+        self.seed = seed
+        self.first_id = first_id
+        self.rng = np.random.Generator(np.random.PCG64(seed))
+        # Visits per hour of the range: the learned weekly profile, scaled to the row count.
+        weekday = (start.weekday() + np.arange(days * 24) // 24) % 7
+        rate = model.hourly_rate[weekday, np.arange(days * 24) % 24]
+        self.visits_per_hour = self.rng.multinomial((rows + 1) // 2, rate / rate.sum())
+        # Distinct visitors per category, sized so that the share of visits by a
+        # returning plate over the whole range matches the sample's.
+        categories, p = model.categories
+        self.pool = {c: visitor_pool(int((rows + 1) // 2 * pc) + 1, model.returning) for c, pc in zip(categories, p)}
+        self.category_keys = {c: i for i, c in enumerate(categories)}
+
+    def _plates(self, category: str, visitor: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Plate and color of each visitor id of category (a pure function of seed, category and id)."""
+        key = np.uint64((self.seed * 1_000_003 + self.category_keys[category] * 7919) & 0xFFFFFFFFFFFFFFFF)
+        h = _mix(visitor.astype(np.uint64) ^ _mix(np.array([key], dtype=np.uint64)))
+        colors = _pick(self.model.colors[category], _unit(h))
+        h = _mix(h)
+        masks = _pick(self.model.masks[category], _unit(h))
+        plates = np.empty(len(visitor), dtype=object)
+        for mask in np.unique(masks):
+            rows = masks == mask
+            if NO_PLATE in mask and not any(c in mask for c in "A9"):
+                plates[rows] = mask
+                continue
+            hm = _mix(h[rows])
+            chars = np.empty((rows.sum(), len(mask)), dtype="U1")
+            for i, c in enumerate(mask):
+                hm = _mix(hm)
+                if c == "A":
+                    chars[:, i] = LETTERS[(hm % np.uint64(26)).astype(np.intp)]
+                elif c == "9":
+                    chars[:, i] = DIGITS[(hm % np.uint64(10)).astype(np.intp)]
+                else:
+                    chars[:, i] = c
+            # The region code replaces the first characters.
+            regions = _pick(self.model.regions.get(mask, ([""], np.array([1.0]))), _unit(_mix(hm)))
+            for region in np.unique(regions):
+                if region:
+                    chars[regions == region, :len(region)] = list(region)
+            plates[rows] = np.ascontiguousarray(chars).view(f"U{len(mask)}").ravel()
+        return plates, colors
+
+    def _dwell_us(self, category: str, n: int) -> np.ndarray:
+        observed = self.model.dwell_minutes.get(category)
+        if observed is not None:
+            minutes = observed[self.rng.integers(0, len(observed), n)]
+        else:
+            median = DEFAULT_DWELL_MINUTES.get(category, DEFAULT_DWELL_FALLBACK)
+            minutes = self.rng.lognormal(np.log(median), DWELL_SIGMA, n)
+        us = (minutes * 60_000_000).astype(np.int64)
+        return np.clip(us, 60_000_000, int(MAX_DWELL / timedelta(microseconds=1)))
+
+    def _day(self, day: int) -> pd.DataFrame:
+        """The entries of one day and their exits (which may fall on later days)."""
+        counts = self.visits_per_hour[day * 24:(day + 1) * 24]
+        n = int(counts.sum())
+        hour_start = self.start_us + (day * 24 + np.repeat(np.arange(24), counts)) * US_PER_HOUR
+        entry_us = hour_start + self.rng.integers(0, US_PER_HOUR, n)
+        category = _pick(self.model.categories, self.rng.random(n))
+        places, p = self.model.places
+        place = _index(p, self.rng.random(n))
+        zones = np.array([zone for zone, _ in places], dtype=object)
+        descriptions = np.array([description for _, description in places], dtype=object)
+        columns: Dict[str, List[np.ndarray]] = defaultdict(list)
+        for c in np.unique(category):
+            rows = np.flatnonzero(category == c)
+            visitor = self.rng.integers(0, self.pool[c], len(rows))
+            plates, colors = self._plates(c, visitor)
+            exit_us = entry_us[rows] + self._dwell_us(c, len(rows))
+            for ts, gates, direction in ((entry_us[rows], self.model.entry_gates[c], "in"),
+                                         (exit_us, self.model.exit_gates[c], "out")):
+                columns["ts"].append(ts)
+                columns["license_plate"].append(plates)
+                columns["category"].append(np.full(len(rows), c, dtype=object))
+                columns["color"].append(colors)
+                columns["gate"].append(_pick(gates, self.rng.random(len(rows))))
+                columns["direction"].append(np.full(len(rows), direction, dtype=object))
+                columns["zone"].append(zones[place[rows]])
+                columns["description"].append(descriptions[place[rows]])
+        if not columns:
+            return pd.DataFrame(columns=["ts"])
+        return pd.DataFrame({name: np.concatenate(parts) for name, parts in columns.items()})
+
+    def batches(self) -> Iterator[pd.DataFrame]:
+        """The rows, a day at a time, in timestamp order with COLUMNS."""
+        pending = pd.DataFrame(columns=["ts"])
+        emitted = 0
+        for day in range(self.days + int(MAX_DWELL / timedelta(days=1)) + 1):
+            if day < self.days:
+                pending = pd.concat([pending, self._day(day)], ignore_index=True) if len(pending) else self._day(day)
+            day_end = self.start_us + (day + 1) * US_PER_DAY
+            pending = pending.sort_values("ts", kind="stable", ignore_index=True)
+            ready = int(np.searchsorted(pending["ts"].to_numpy(np.int64), day_end))
+            ready = min(ready, self.rows - emitted)
+            if ready:
+                batch, pending = pending.iloc[:ready].copy(), pending.iloc[ready:]
+                batch.insert(0, "insertion_id", np.arange(self.first_id + emitted, self.first_id + emitted + ready))
+                stamps = np.datetime_as_string(batch["ts"].to_numpy(np.int64).astype("datetime64[us]"), unit="us")
+                batch["timestamp"] = np.char.add(np.char.replace(stamps, "T", " "), "+00")
+                batch["vehicle_class"] = batch["gate"].str.extract(VEHICLE_CLASS_PATTERN, expand=False)
+                emitted += ready
+                yield batch[COLUMNS]
+            if emitted >= self.rows:
+                return
+
+
+def month_starts(start: date, days: int) -> List[date]:
+    """First day of every month the range (plus the longest dwell) touches."""
+    last = start + timedelta(days=days) + MAX_DWELL
+    months, month = [], date(start.year, start.month, 1)
+    while month <= last:
+        months.append(month)
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return months
+
+
+def encode(cur: Any, batch: pd.DataFrame, ids: Dict[str, Dict[str, int]]) -> pd.DataFrame:
+    """
+    The batch as migration 007 stores it: DIMENSION_COLUMNS as ids (cached in
+    ids, adding the names their tables do not have yet) and zone as an
+    integer.
+    """
+    batch = batch.copy()
+    for column, (id_column, table) in DIMENSION_COLUMNS.items():
+        if table not in ids:
+            cur.execute(f"SELECT name, id FROM {table}")
+            ids[table] = dict(cur.fetchall())
+        known = ids[table]
+        missing = sorted(set(batch[column].dropna()) - known.keys())
+        if missing:
+            cur.execute(f"INSERT INTO {table} (name) SELECT unnest(%s::text[]) ON CONFLICT (name) DO NOTHING",
+                        (missing,))
+            cur.execute(f"SELECT name, id FROM {table} WHERE name = ANY(%s::text[])", (missing,))
+            known.update(cur.fetchall())
+        batch[column] = batch[column].map(known).astype("Int16")
+    batch["zone"] = pd.to_numeric(batch["zone"], errors="coerce").astype("Int32")
+    return batch.rename(columns={column: id_column for column, (id_column, _) in DIMENSION_COLUMNS.items()})
+
+
+def load(batches: Iterator[pd.DataFrame], start: date, days: int, truncate: bool,
+         dbname: Optional[str] = None) -> int:
+    """
+    COPY the batches into parking (in dbname, default DB_NAME), one transaction
+    per batch. Pedestrians go to parking_detections where migration 006 created
+    it, as the webhook ingester routes them, and the rows are encoded where
+    migration 007 ran.
+    """
+    conn = psycopg2.connect(
+        dbname=dbname or os.environ.get("DB_NAME", "flow"),
+        user=os.environ.get("DB_USER", "postgres"),
+        password=os.environ.get("DB_PASSWORD"),
+        host=os.environ.get("DB_HOST", "localhost"),
+        port=os.environ.get("DB_PORT", 5432),
+    )
+    loaded = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('parking_detections') IS NOT NULL")
+            split = cur.fetchone()[0]
+            tables = ["parking", "parking_detections"] if split else ["parking"]
+            cur.execute("SELECT to_regclass('parking_colors') IS NOT NULL")
+            encoded = cur.fetchone()[0]
+            ids: Dict[str, Dict[str, int]] = {}
+            if truncate:
+                cur.execute(f"TRUNCATE {', '.join(tables)}")
+                # TRUNCATE fires no DELETE trigger, so the option counts and
+                # the footfall are reset here.
+                for rollup in ("parking_dimension_counts", "parking_footfall"):
+                    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (rollup,))
+                    if cur.fetchone()[0]:
+                        cur.execute(f"TRUNCATE {rollup}")
+            cur.execute("SELECT to_regproc('parking_create_partition') IS NOT NULL")
+            if cur.fetchone()[0]:
+                for month in month_starts(start, days):
+                    cur.execute("SELECT parking_create_partition(%s)", (month,))
+            conn.commit()
+            for batch in batches:
+                if encoded:
+                    batch = encode(cur, batch, ids)
+                pedestrian = batch["category"].eq("pedestrian").to_numpy() if split else np.zeros(len(batch), bool)
+                for table, rows in (("parking", batch[~pedestrian]), ("parking_detections", batch[pedestrian])):
+                    if rows.empty:
+                        continue
+                    buffer = io.StringIO()
+                    rows.to_csv(buffer, header=False, index=False)
+                    buffer.seek(0)
+                    cur.copy_expert(f"COPY {table} ({', '.join(rows.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+                conn.commit()
+                loaded += len(batch)
+                if sys.stderr.isatty():
+                    print(f"\r{loaded} rows", end="", file=sys.stderr, flush=True)
+            for table in tables:
+                cur.execute(f"ANALYZE {table}")
+            conn.commit()
+    finally:
+        conn.close()
+    return loaded
+
+
+def main(argv: Sequence[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows to generate (default 1M)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2025, 1, 1), help="first day (UTC)")
+    parser.add_argument("--days", type=int, default=365, help="days of traffic (default 365)")
+    parser.add_argument("--first-id", type=int, default=100_000_000, help="insertion_id of the first row")
+    parser.add_argument("--sample", default=SAMPLE_CSV, help="export to learn from (default parking_export.csv)")
+    parser.add_argument("--csv", metavar="PATH", help="write CSV (with a header) instead of loading the database")
+    parser.add_argument("--truncate", action="store_true", help="empty parking before loading")
+    parser.add_argument("--describe", action="store_true", help="print the learned distributions and exit")
+    args = parser.parse_args(argv)
+
+    model = learn(args.sample)
+    if args.describe:
+        print(json.dumps(model.describe(), indent=2))
+        return
+    generator = TrafficGenerator(model, args.rows, args.start, args.days, args.seed, args.first_id)
+    t0 = time.perf_counter()
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            f.write(",".join(COLUMNS) + "\n")
+            n = 0
+            for batch in generator.batches():
+                batch.to_csv(f, header=False, index=False)
+                n += len(batch)
+    else:
+        n = load(generator.batches(), args.start, args.days, args.truncate)
+    elapsed = time.perf_counter() - t0
+    print(f"\r{n} rows in {elapsed:.1f}s ({n / elapsed:.0f} rows/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
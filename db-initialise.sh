@@ -32,4 +32,7 @@ docker-compose exec -e PGPASSWORD="$DB_PASSWORD" db \
   );
 "
 
-echo "Table 'parking' has been ensured in database '$DB_NAME'."
\ No newline at end of file
+echo "Table 'parking' has been ensured in database '$DB_NAME'."
+
+# 5) Apply schema migrations (indexes, later schema changes)
+./db-migrate.sh
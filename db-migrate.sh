@@ -0,0 +1,39 @@
+#!/usr/bin/env bash
+set -e
+
+# Apply pending SQL migrations from ./migrations in filename order.
+# Applied migrations are recorded in the schema_migrations table, so the
+# script can be re-run safely on an existing database.
+
+# 1) Load environment variables from .env
+if [ -f .env ]; then
+    export $(grep -v '^#' .env | xargs)
+fi
+
+psql_db() {
+    docker-compose exec -T -e PGPASSWORD="$DB_PASSWORD" db \
+      psql -U "$DB_USER" -d "$DB_NAME" -v ON_ERROR_STOP=1 -q "$@"
+}
+
+# 2) Make sure the bookkeeping table exists
+psql_db -c "
+  CREATE TABLE IF NOT EXISTS schema_migrations (
+    name TEXT PRIMARY KEY,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+  );
+"
+
+# 3) Apply each migration that has not been recorded yet.
+#    Files run outside a transaction so they may use CREATE INDEX CONCURRENTLY.
+for file in migrations/*.sql; do
+    name=$(basename "$file")
+    applied=$(psql_db -tAc "SELECT 1 FROM schema_migrations WHERE name = '$name'")
+    if [ "$applied" = "1" ]; then
+        continue
+    fi
+    echo "Applying migration $name..."
+    psql_db < "$file"
+    psql_db -c "INSERT INTO schema_migrations (name) VALUES ('$name');"
+done
+
+echo "Database '$DB_NAME' is up to date."
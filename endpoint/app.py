@@ -1,15 +1,18 @@
 
 # app.py
 import os
+import itertools
 import logging
+import threading
 import traceback
 from typing import Any, Optional, Tuple, Dict
 from datetime import datetime,timedelta,timezone  # Added import for datetime
 import psycopg2.extras
-from flask import Flask, request, jsonify, send_file, make_response  # type: ignore
+from flask import Flask, request, jsonify, send_file, make_response, has_request_context, g  # type: ignore
 
 from psycopg2.extras import RealDictCursor, DictCursor
 from psycopg2.extensions import connection as Connection  # type: ignore
+from psycopg2.extensions import cursor as TupleCursor  # type: ignore
 from dotenv import load_dotenv
 from flask_cors import CORS
 import math
@@ -17,11 +20,41 @@ import logging
 import pandas as pd
 import csv 
 from io import StringIO, BytesIO
-from openpyxl import Workbook
 import json
 
 load_dotenv()  # Load environment variables from .env file
 
+# Local modules read their settings from the environment at import time.
+from exporters import (  # noqa: E402
+    EXPORT_FILTER_KEYS, EXPORT_MIMETYPES, EXPORT_WRITERS, build_export_query,
+    export_to_tempfile, iter_query_rows
+)
+from batch import BatchPlan, dashboard_summary, run_batch  # noqa: E402
+from archive import ParkingArchive, merge_counts, merge_enhanced_stats, start_archiver  # noqa: E402
+from columnar import COLUMNAR_CACHE_DAYS, ColumnarStore  # noqa: E402
+from replicas import Replica, ReplicaRouter, replica_settings  # noqa: E402
+from export_jobs import ExportJobManager  # noqa: E402
+from export_log_store import ExportLogStore  # noqa: E402
+from counts import COUNT_SCOPES, RecordCounter  # noqa: E402
+from db import ConnectionPool, PooledConnection, execute_prepared  # noqa: E402
+from querylog import QUERY_STATS_TOKEN, InstrumentedConnection, check_token, pool_wait, query_log  # noqa: E402
+from profiling import (  # noqa: E402
+    PROFILING, check_profile_token, list_profiles, profile_file, requested_mode, start_profile
+)
+from dimensions import DimensionCache  # noqa: E402
+from filters import FILTER_KEYS, Where, compile_filters  # noqa: E402
+from tabular import (  # noqa: E402
+    ARROW, ARROW_STREAM_MIMETYPE, RECORDS, Table, arrow_stream, fetch_table, response_format
+)
+from stats import (  # noqa: E402
+    CATEGORY_STATS_SQL, DASHBOARD_DATA_SQL, DURATION_BUCKET_EDGES, DURATION_HISTOGRAM_SQL,
+    DURATION_PERCENTILES_SQL, DURATION_RAW_SQL, ENHANCED_STATS_SQL, RECENT_ENTRIES_SQL, TODAY_ENTRIES_SQL, TODAY_EXITS_SQL, TRENDS_SQL,
+    TIMELINE_BUCKETS, TIMELINE_MAX_POINTS, build_enhanced_stats, category_counts, downsample_timeline,
+    duration_histogram, duration_percentiles, calculate_percentage_changes, calculate_previous_period,
+    enhanced_stats_period, entry_exit_queries, parse_bucket_edges, timeline_bucket_seconds, today_params,
+    trend_params
+)
+
 # Initialize the Flask app
 app: Flask = Flask(__name__)
 
@@ -46,28 +79,151 @@ logging.basicConfig(
 )
 app.logger.info("Parking Dashboard App is starting...")
 
+DB_SETTINGS: Dict[str, Any] = {
+    "dbname": os.environ.get("DB_NAME", "flow"),
+    "user": os.environ.get("DB_USER", "postgres"),
+    "password": os.environ.get("DB_PASSWORD"),
+    "host": os.environ.get("DB_HOST", "db"),
+    "port": os.environ.get("DB_PORT", 5432),
+}
+
+def _connect(**settings: Any) -> PooledConnection:
+    """Open a connection to the primary, or to the server given by settings (replicas)."""
+    connection: PooledConnection = psycopg2.connect(
+        **{**DB_SETTINGS, **settings},
+        cursor_factory=RealDictCursor,
+        connection_factory=InstrumentedConnection
+    )
+    app.logger.info("Database connection established successfully.")
+    return connection
+
+db_pool = ConnectionPool(_connect)
+
+# Reads can be served by the replicas in DB_REPLICAS (see replicas.py).
+read_router = ReplicaRouter(db_pool, [Replica(settings, _connect)
+                                      for settings in replica_settings(defaults=DB_SETTINGS)])
+
+# Closed months moved to Parquet (see archive.py); endpoints whose date range
+# reaches past the live data merge these rows in.
+parking_archive = ParkingArchive()
+start_archiver(_connect, parking_archive)
+
 def get_db_connection() -> Connection:
     """
-    Establish a connection to the PostgreSQL database using credentials from environment variables.
+    Take a connection to the PostgreSQL database from the pool (credentials come
+    from environment variables). Calling close() on it returns it to the pool.
     
     Returns:
         A psycopg2 connection object.
     """
     try:
-        connection: Connection = psycopg2.connect(
-            dbname=os.environ.get("DB_NAME", "flow"),
-            user=os.environ.get("DB_USER", "postgres"),
-            password=os.environ.get("DB_PASSWORD"),
-            host=os.environ.get("DB_HOST", "db"),
-            port=os.environ.get("DB_PORT", 5432),
-            cursor_factory=RealDictCursor
-        )
-        app.logger.info("Database connection established successfully.")
-        return connection
+        with pool_wait():
+            return db_pool.getconn()
     except Exception as e:
         app.logger.error(f"Database connection error: {e}")
         raise
 
+# Route and query timings (querylog.py); registered first so that requests
+# rejected by the other hooks are timed as well.
+@app.before_request
+def start_query_timing() -> None:
+    if query_log is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "(unmatched)"
+        g.query_timing = query_log.start_request(f"{request.method} {route}")
+
+@app.after_request
+def finish_query_timing(response: Any) -> Any:
+    timing = g.pop("query_timing", None)
+    if timing is not None:
+        query_log.finish_request(timing, response.content_length, response.status_code)
+    return response
+
+# Opt-in profiling (profiling.py): X-Profile: <mode> or ?profile=<mode>, or
+# a sampled fraction of requests.
+@app.before_request
+def start_profiling() -> Any:
+    try:
+        mode = requested_mode(request.headers.get("X-Profile"), request.args.get("profile"),
+                              request.headers.get("X-Profile-Token"))
+    except ValueError as ve:
+        return jsonify({"error": "Invalid input", "details": str(ve)}), 400
+    except PermissionError as pe:
+        return jsonify({"error": "Forbidden", "details": str(pe)}), 403
+    if mode is not None:
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        on_demand = bool(request.headers.get("X-Profile") or request.args.get("profile"))
+        g.profile = start_profile(f"{request.method} {route}", mode, {threading.get_ident()}, on_demand)
+    return None
+
+@app.after_request
+def finish_profiling(response: Any) -> Any:
+    profile = g.pop("profile", None)
+    if profile is not None:
+        description = profile.finish(response.status_code)
+        if profile.on_demand:
+            response.headers["X-Profile-Id"] = description["id"]
+            response.headers["X-Profile-Peak-Memory"] = str(description["peak_memory_bytes"])
+    return response
+
+@app.teardown_request
+def abandon_profiling(_: Optional[BaseException]) -> None:
+    """Save the profile of a request that raised before after_request ran."""
+    profile = g.pop("profile", None)
+    if profile is not None:
+        profile.finish(500)
+
+@app.before_request
+def validate_read_options() -> Any:
+    """Reject an unparsable max_lag before any route reads it."""
+    try:
+        float(request.args.get("max_lag") or 0)
+    except ValueError as ve:
+        return jsonify({"error": "Invalid input", "details": str(ve)}), 400
+    return None
+
+def get_read_connection() -> Connection:
+    """
+    Take a connection for reading: from a replica when one is healthy and
+    within REPLICA_MAX_LAG seconds, otherwise from the primary pool.
+
+    Within a request, ?fresh=true reads from the primary (to see writes made
+    just before) and ?max_lag=<seconds> tightens the lag threshold.
+    """
+    fresh, max_lag = False, None
+    if has_request_context():
+        fresh = request.args.get("fresh", "false").lower() == "true"
+        if request.args.get("max_lag"):
+            max_lag = float(request.args["max_lag"])
+    try:
+        with pool_wait():
+            return read_router.getconn(fresh=fresh, max_lag=max_lag)
+    except Exception as e:
+        app.logger.error(f"Database connection error: {e}")
+        raise
+
+# Filter options, cached until parking's triggers send NOTIFY (dimensions.py).
+# NOTIFY is not replicated, so the options are loaded from the primary.
+dimension_cache = DimensionCache(get_db_connection, listen_connect=_connect)
+
+# Optional in-memory copy of the recent days for the statistics endpoints
+# (columnar.py); None unless COLUMNAR_CACHE_DAYS is set.
+columnar_store: Optional[ColumnarStore] = (
+    ColumnarStore(get_read_connection, dimension_cache) if COLUMNAR_CACHE_DAYS > 0 else None
+)
+
+
+def table_format() -> str:
+    """The response format (tabular.py) asked for by ?format= and the Accept header."""
+    return response_format(request.args.get("format"), request.headers.get("Accept"))
+
+
+def table_response(table: Table, fmt: str, envelope: Optional[Dict[str, Any]] = None) -> Any:
+    """A table in the given format; with an envelope, the rows go in its "data" field."""
+    if fmt == ARROW:
+        return app.response_class(arrow_stream(table, envelope), mimetype=ARROW_STREAM_MIMETYPE)
+    rows = table.records() if fmt == RECORDS else table.columnar()
+    return jsonify(rows if envelope is None else {"data": rows, **envelope})
+
 # ---------------------------------------
 # 1. /data Endpoint
 # ---------------------------------------
@@ -78,70 +234,93 @@ def data() -> Any:
     
     Query parameters include:
     - start_date, end_date: Filter by timestamp range.
-    - license_prefix: Filter for license_plate starting with the given prefix.
+    - license_prefix: Filter for license_plate starting with any of the given
+      comma-separated prefixes.
     - categories, colors, gates: Comma-separated values to filter respective fields.
     - search: Search term to match across several fields.
     - page_size, page: Pagination settings.
+    - format: "records" (default) or "columnar" ({"columns": [...], "rows": [[...]]});
+      an Accept of application/vnd.apache.arrow.stream returns an Arrow IPC stream.
     """
     try:
-        # Retrieve query parameters (all optional)
-        start_date: Optional[str] = request.args.get("start_date")
-        end_date: Optional[str] = request.args.get("end_date")
-        license_prefix: Optional[str] = request.args.get("license_prefix")
-        categories: Optional[str] = request.args.get("categories")
-        colors: Optional[str] = request.args.get("colors")
-        gates: Optional[str] = request.args.get("gates")
-        search: Optional[str] = request.args.get("search")
+        fmt: str = table_format()
+    except ValueError as ve:
+        return jsonify({"error": "Invalid input", "details": str(ve)}), 400
+    try:
+        # Filters (all optional) compile to a WHERE clause holding only the
+        # predicates that apply.
+        filters: Dict[str, Optional[str]] = {key: request.args.get(key) for key in FILTER_KEYS}
+        where: Where = compile_filters(filters)
         page_size: int = int(request.args.get("page_size", 10))
         page: int = int(request.args.get("page", 1))
         offset: int = (page - 1) * page_size
 
-        # SQL query with placeholders for safe parameter substitution.
-        query: str = """
+        query: str = f"""
             SELECT *
-            FROM parking
-            WHERE
-              (timestamp >= COALESCE(%s::timestamptz, timestamp))
-              AND (timestamp <= COALESCE(%s::timestamptz, timestamp))
-              AND (%s IS NULL OR license_plate ILIKE (%s || '%%'))
-              AND (%s IS NULL OR category IN (SELECT UNNEST(string_to_array(%s, ',')) ))
-              AND (%s IS NULL OR color IN (SELECT UNNEST(string_to_array(%s, ',')) ))
-              AND (%s IS NULL OR gate IN (SELECT UNNEST(string_to_array(%s, ',')) ))
-              AND (
-                   %s IS NULL OR 
-                   license_plate ILIKE ('%%' || %s || '%%') OR
-                   category ILIKE ('%%' || %s || '%%') OR
-                   color ILIKE ('%%' || %s || '%%') OR
-                   gate ILIKE ('%%' || %s || '%%') OR
-                   zone ILIKE ('%%' || %s || '%%') OR
-                   description ILIKE ('%%' || %s || '%%')
-              )
+            FROM parking_events
+            {where}
             ORDER BY timestamp DESC
             LIMIT %s
             OFFSET %s;
         """
-        # Prepare parameters tuple
-        params: Tuple[Any, ...] = (
-            start_date, end_date,
-            license_prefix, license_prefix,
-            categories, categories,
-            colors, colors,
-            gates, gates,
-            search, search, search, search, search, search, search,
-            page_size, offset
-        )
-        conn: Connection = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(query, params)
-        results = cur.fetchall()
+        conn: Connection = get_read_connection()
+        cur = conn.cursor(cursor_factory=TupleCursor)
+        execute_prepared(cur, query, where.params + [page_size, offset])
+        table = fetch_table(cur)
+
+        # A short page means the live rows ran out; continue into the archive
+        # (which only holds older months) if the date range reaches it.
+        archived = []
+        if len(table.rows) < page_size and parking_archive.reaches(filters["start_date"]):
+            if table.rows:
+                skip = 0
+            else:
+                execute_prepared(cur, f"SELECT COUNT(*) AS count FROM parking_events {where}", where.params)
+                skip = max(0, offset - cur.fetchone()[0])
+            archived = parking_archive.page(filters, skip, page_size - len(table.rows))
         cur.close()
         conn.close()
-        return jsonify(results)
+        if fmt == RECORDS:
+            return jsonify(table.records() + archived)
+        table.add_records(archived)
+        return table_response(table, fmt)
     except Exception as e:
         app.logger.error(f"Error in /data endpoint: {e}")
         app.logger.error(traceback.format_exc())
         return jsonify({"error": "Could not load data", "details": f"{e}"}), 500
 
+# ---------------------------------------
+# 1b. /count Endpoint
+# ---------------------------------------
+record_counter = RecordCounter(get_read_connection, dimension_cache, parking_archive)
+
+@app.route("/count", methods=["GET"])
+def count() -> Any:
+    """
+    Endpoint to count parking records matching the /data filters.
+
+    Counts are exact and served from an incrementally maintained cache where
+    possible; a large count that is not cached yet is answered with the
+    planner's estimate ("exact": false) while the exact count is computed in
+    the background. Matching rows in the Parquet archive are added for the
+    "all" and "export" scopes, like /data and /export return them.
+
+    Query parameters:
+    - start_date, end_date, license_prefix, categories, colors, gates, search.
+    - scope: "all" (default), "export" (pedestrians excluded) or "entries"
+      (vehicle entries with a plate, as listed by /data1).
+    """
+    try:
+        scope: str = request.args.get("scope", "all")
+        if scope not in COUNT_SCOPES:
+            return jsonify({"error": f"Invalid scope. Use one of: {', '.join(COUNT_SCOPES)}."}), 400
+        filters: Dict[str, Optional[str]] = {key: request.args.get(key) for key in FILTER_KEYS}
+        return jsonify(record_counter.count(scope, filters))
+    except Exception as e:
+        app.logger.error(f"Error in /count endpoint: {e}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({"error": "Could not count records", "details": f"{e}"}), 500
+
 # ---------------------------------------
 # 2. /dashboard/data Endpoint
 # ---------------------------------------
@@ -160,30 +339,10 @@ def dashboard_data() -> Any:
         page: int = int(request.args.get("page", 1))
         offset: int = (page - 1) * page_size
 
-        query: str = """
-            SELECT *
-            FROM parking
-            WHERE (
-              %s IS NULL OR
-              license_plate ILIKE ('%%' || %s || '%%') OR
-              category ILIKE ('%%' || %s || '%%') OR
-              color ILIKE ('%%' || %s || '%%') OR
-              gate ILIKE ('%%' || %s || '%%') OR
-              zone ILIKE ('%%' || %s || '%%') OR
-              description ILIKE ('%%' || %s || '%%')
-            )
-            AND category != 'pedestrian'
-            ORDER BY timestamp DESC
-            LIMIT %s
-            OFFSET %s;
-        """
-        params: Tuple[Any, ...] = (
-            search, search, search, search, search, search, search,
-            page_size, offset
-        )
-        conn: Connection = get_db_connection()
+        params: Dict[str, Any] = {"search": search, "limit": page_size, "offset": offset}
+        conn: Connection = get_read_connection()
         cur = conn.cursor()
-        cur.execute(query, params)
+        cur.execute(DASHBOARD_DATA_SQL, params)
         results = cur.fetchall()
         cur.close()
         conn.close()
@@ -201,6 +360,59 @@ def dashboard_data_alias() -> Any:
     """
     return dashboard_data()
 
+# ---------------------------------------
+# 2b. Batched queries (/dashboard/summary, /batch)
+# ---------------------------------------
+@app.route("/dashboard/summary", methods=["GET"])
+def dashboard_summary_endpoint() -> Any:
+    """
+    One refresh of the dashboard: the /dashboard/data page plus today's entries,
+    today's exits and the trends, from one consistent snapshot.
+
+    Query parameters:
+    - search, page_size, page: As for /dashboard/data.
+    """
+    try:
+        plan = BatchPlan(dashboard_summary(
+            page=int(request.args.get("page", 1)),
+            page_size=int(request.args.get("page_size", 10)),
+            search=request.args.get("search")
+        ))
+        conn = get_read_connection()
+        try:
+            return jsonify(run_batch(conn, plan))
+        finally:
+            conn.close()
+    except ValueError as ve:
+        return jsonify({"error": "Invalid input", "details": str(ve)}), 400
+    except Exception as e:
+        app.logger.error(f"Error in /dashboard/summary endpoint: {e}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({"error": "Could not load dashboard summary", "details": f"{e}"}), 500
+
+@app.route("/batch", methods=["POST"])
+def batch() -> Any:
+    """
+    Run several named sub-queries in one read-only snapshot.
+
+    The JSON body maps names to {"query": ..., "params": {...}}, where query is
+    one of dashboard_data, today_entries, today_exits, trends, recent_entries
+    or category_stats; the response maps the same names to their results.
+    """
+    try:
+        plan = BatchPlan(request.get_json(silent=True))
+        conn = get_read_connection()
+        try:
+            return jsonify(run_batch(conn, plan))
+        finally:
+            conn.close()
+    except ValueError as ve:
+        return jsonify({"error": "Invalid batch", "details": str(ve)}), 400
+    except Exception as e:
+        app.logger.error(f"Error in /batch endpoint: {e}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({"error": "Could not run batch", "details": f"{e}"}), 500
+
 # ---------------------------------------
 # 3. /stats/category-stats Endpoint
 # ---------------------------------------
@@ -210,7 +422,7 @@ def category_stats() -> Any:
     Endpoint to retrieve statistics of parking categories over a specified time range.
     
     Query parameters:
-    - start_date, end_date: Required timestamp range.
+    - start_date, end_date: Required timestamp range; archived months are included.
     """
     try:
         start_date: Optional[str] = request.args.get("start_date")
@@ -218,21 +430,23 @@ def category_stats() -> Any:
         if not start_date or not end_date:
             return jsonify({"error": "start_date and end_date parameters are required"}), 400
 
-        query: str = """
-            SELECT category, COUNT(*) AS count
-            FROM parking
-            WHERE
-              timestamp >= %s::timestamptz
-              AND timestamp <= %s::timestamptz
-            GROUP BY category;
-        """
-        params: Tuple[Any, ...] = (start_date, end_date)
-        conn: Connection = get_db_connection()
+        if columnar_store is not None and columnar_store.covers(start_date):
+            counts = columnar_store.category_counts(start_date, end_date, exclude_pedestrians=False)
+            return jsonify([{"category": category, "count": n} for category, n in counts.items()])
+
+        params: Dict[str, Any] = {"start": start_date, "end": end_date}
+        conn: Connection = get_read_connection()
         cur = conn.cursor()
-        cur.execute(query, params)
+        cur.execute(CATEGORY_STATS_SQL, params)
         results = cur.fetchall()
         cur.close()
         conn.close()
+
+        # Add whatever part of the range lies in the Parquet archive (pedestrians included).
+        if parking_archive.reaches(start_date):
+            counts = merge_counts({row["category"]: row["count"] for row in results},
+                                  parking_archive.category_counts(start_date, end_date, exclude_pedestrians=False))
+            results = [{"category": category, "count": n} for category, n in counts.items()]
         return jsonify(results)
     except Exception as e:
         app.logger.error(f"Error in /stats/category-stats endpoint: {e}")
@@ -245,19 +459,12 @@ def category_stats() -> Any:
 @app.route("/stats/today-entries", methods=["GET"])
 def today_entries() -> Any:
     """
-    Endpoint to retrieve the count of today's parking entries.
+    Endpoint to retrieve the count of today's parking entries (site timezone).
     """
     try:
-        query: str = """
-            SELECT COUNT(*) AS count
-            FROM parking
-            WHERE DATE(timestamp) = CURRENT_DATE
-              AND gate ILIKE '%%_in'
-              AND category != 'pedestrian';
-        """
-        conn: Connection = get_db_connection()
+        conn: Connection = get_read_connection()
         cur = conn.cursor()
-        cur.execute(query)
+        cur.execute(TODAY_ENTRIES_SQL, today_params())
         result = cur.fetchone()
         cur.close()
         conn.close()
@@ -276,15 +483,9 @@ def recent_entries() -> Any:
     Endpoint to retrieve the count of parking entries in the last 10 minutes.
     """
     try:
-        query: str = """
-            SELECT COUNT(*) AS count
-            FROM parking
-            WHERE timestamp >= NOW() - INTERVAL '10 minutes'
-              AND gate ILIKE '%%_in';
-        """
-        conn: Connection = get_db_connection()
+        conn: Connection = get_read_connection()
         cur = conn.cursor()
-        cur.execute(query)
+        cur.execute(RECENT_ENTRIES_SQL, {})
         result = cur.fetchone()
         cur.close()
         conn.close()
@@ -300,177 +501,145 @@ def recent_entries() -> Any:
 @app.route("/export", methods=["GET"])
 def export() -> Any:
     """
-    Endpoint to export parking data with optional filters as a CSV or XLSX file (excluding pedestrians).
+    Endpoint to export parking data with optional filters as a CSV, XLSX, Parquet or
+    Arrow IPC file (excluding pedestrians).
 
     Query parameters:
-    - start_date, end_date, license_prefix, categories, colors, gates, search, file_format (csv or xlsx).
+    - start_date, end_date, license_prefix, categories, colors, gates, search,
+      file_format (csv, xlsx, parquet or arrow).
     """
     try:
         # Extract query parameters
-        start_date: Optional[str] = request.args.get("start_date")
-        end_date: Optional[str] = request.args.get("end_date")
-        license_prefix: Optional[str] = request.args.get("license_prefix")
-        categories: Optional[str] = request.args.get("categories")
-        colors: Optional[str] = request.args.get("colors")
-        gates: Optional[str] = request.args.get("gates")
-        search: Optional[str] = request.args.get("search")
+        filters: Dict[str, Optional[str]] = {key: request.args.get(key) for key in EXPORT_FILTER_KEYS}
         file_format: str = request.args.get("file_format", "csv").lower()  # Default to csv
 
         # Validate file_format
-        if file_format not in ["csv", "xlsx"]:
-            return jsonify({"error": "Invalid file format. Use 'csv' or 'xlsx'."}), 400
+        if file_format not in EXPORT_WRITERS:
+            return jsonify({"error": "Invalid file format. Use 'csv', 'xlsx', 'parquet' or 'arrow'."}), 400
 
-        # SQL query with pedestrian exclusion
-        query: str = """
-            SELECT *
-            FROM parking
-            WHERE
-              category != 'pedestrian'
-              AND (timestamp >= COALESCE(%s::timestamptz, timestamp))
-              AND (timestamp <= COALESCE(%s::timestamptz, timestamp))
-              AND (%s IS NULL OR license_plate ILIKE (%s || '%%'))
-              AND (%s IS NULL OR category IN (SELECT UNNEST(string_to_array(%s, ','))))
-              AND (%s IS NULL OR color IN (SELECT UNNEST(string_to_array(%s, ','))))
-              AND (%s IS NULL OR gate IN (SELECT UNNEST(string_to_array(%s, ','))))
-              AND (
-                   %s IS NULL OR
-                   license_plate ILIKE ('%%' || %s || '%%') OR
-                   category ILIKE ('%%' || %s || '%%') OR
-                   color ILIKE ('%%' || %s || '%%') OR
-                   gate ILIKE ('%%' || %s || '%%') OR
-                   zone ILIKE ('%%' || %s || '%%') OR
-                   description ILIKE ('%%' || %s || '%%')
-              )
-            ORDER BY timestamp DESC;
-        """
-        params: Tuple[Any, ...] = (
-            start_date, end_date,
-            license_prefix, license_prefix,
-            categories, categories,
-            colors, colors,
-            gates, gates,
-            search, search, search, search, search, search, search
-        )
+        query, params = build_export_query(filters)
 
-        # Fetch data from the database
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(query, params)
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        # Stream rows from a server-side cursor into a temporary file so that
+        # memory use stays constant regardless of the export size.
+        # Archived months are older than every live row, so they simply follow.
+        conn = get_read_connection()
+        try:
+            rows = iter_query_rows(conn, query, params)
+            if parking_archive.reaches(filters.get("start_date")):
+                rows = itertools.chain(rows, parking_archive.iter_rows(filters, exclude_pedestrians=True))
+            path = export_to_tempfile(file_format, rows)
+        finally:
+            conn.close()
 
-        # Define column order
-        fieldnames = [
-            "timestamp", "license_plate", "category", "color",
-            "gate", "zone", "description", "insertion_id"
-        ]
-
-        # Handle CSV export
-        if file_format == "csv":
-            output = StringIO()
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
-            writer.writeheader()
-            for row in results:
-                writer.writerow(row)
-            output.seek(0)
-
-            response = make_response(output.getvalue())
-            response.headers["Content-Disposition"] = "attachment; filename=parking_data.csv"
-            response.headers["Content-Type"] = "text/csv"
-            return response
-
-        # Handle XLSX export
-        elif file_format == "xlsx":
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Parking Data"
-
-            # Write headers
-            ws.append(fieldnames)
-
-            # Write data rows
-            for row in results:
-                # Convert row dict to list in fieldnames order, handling datetime objects
-                row_data = []
-                for field in fieldnames:
-                    value = row.get(field)
-                    if isinstance(value, datetime):
-                        value = value.strftime('%Y-%m-%d %H:%M:%S')
-                    row_data.append(value)
-                ws.append(row_data)
-
-            # Save to BytesIO
-            output = BytesIO()
-            wb.save(output)
-            output.seek(0)
-
-            response = make_response(output.getvalue())
-            response.headers["Content-Disposition"] = "attachment; filename=parking_data.xlsx"
-            response.headers["Content-Type"] = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            return response
+        response = send_file(
+            path,
+            mimetype=EXPORT_MIMETYPES[file_format],
+            as_attachment=True,
+            download_name=f"parking_data.{file_format}"
+        )
+        response.call_on_close(lambda: os.remove(path))
+        return response
 
     except Exception as e:
         app.logger.error(f"Error in /export endpoint: {e}")
         app.logger.error(traceback.format_exc())
         return jsonify({"error": "Could not export data", "details": f"{e}"}), 500
 
+# ---------------------------------------
+# 6b. Background export jobs (/exports)
+# ---------------------------------------
+export_jobs = ExportJobManager(get_read_connection, archive=parking_archive)
+
+@app.route("/exports", methods=["POST"])
+def create_export_job() -> Any:
+    """
+    Queue an export in the background.
+
+    Accepts the same filters as /export (start_date, end_date, license_prefix,
+    categories, colors, gates, search) plus file_format, either as a JSON body or
+    as query parameters. Identical requests against unchanged data reuse the
+    existing artifact.
+
+    Returns 202 with the job status; poll GET /exports/<id> until status is "done".
+    """
+    try:
+        body: Dict[str, Any] = request.get_json(silent=True) or {}
+        params = {**request.args.to_dict(), **body}
+        file_format: str = str(params.get("file_format", "csv")).lower()
+        if file_format not in EXPORT_WRITERS:
+            return jsonify({"error": "Invalid file format. Use 'csv', 'xlsx', 'parquet' or 'arrow'."}), 400
+
+        filters: Dict[str, Optional[str]] = {key: params.get(key) for key in EXPORT_FILTER_KEYS}
+        job = export_jobs.submit(file_format, filters)
+        response = jsonify(job.to_dict())
+        response.status_code = 200 if job.status == "done" else 202
+        response.headers["Location"] = f"/exports/{job.id}"
+        return response
+    except Exception as e:
+        app.logger.error(f"Error in /exports endpoint: {e}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({"error": "Could not queue export", "details": f"{e}"}), 500
+
+@app.route("/exports/<job_id>", methods=["GET"])
+def get_export_job(job_id: str) -> Any:
+    """
+    Report the status and progress of an export job.
+    """
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Export not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/exports/<job_id>/download", methods=["GET"])
+def download_export_job(job_id: str) -> Any:
+    """
+    Download the artifact of a finished export job. Supports HTTP Range requests.
+
+    Query parameters:
+    - file_name: Optional download name (without extension).
+    """
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Export not found"}), 404
+    if job.status != "done":
+        return jsonify({"error": "Export is not ready", "status": job.status}), 409
+
+    path = export_jobs.artifact_path(job)
+    if not os.path.exists(path):
+        return jsonify({"error": "Export file has expired"}), 410
+
+    file_name = request.args.get("file_name") or "parking_data"
+    return send_file(
+        path,
+        mimetype=EXPORT_MIMETYPES[job.file_format],
+        as_attachment=True,
+        download_name=f"{file_name}.{job.file_format}",
+        conditional=True
+    )
+
 # ---------------------------------------
 # 7. /stats/trends Endpoint
 # ---------------------------------------
 @app.route("/stats/trends", methods=["GET"])
 def stats_trends() -> Any:
     """
-    Endpoint to retrieve trends including today's and yesterday's entries and exits.
+    Endpoint to retrieve trends including today's and yesterday's entries and exits
+    (calendar days in the site timezone).
     """
     try:
-        conn: Connection = get_db_connection()
+        conn: Connection = get_read_connection()
         cur = conn.cursor()
-
-        # Today's entries
-        cur.execute("""
-            SELECT COUNT(*) AS count
-            FROM parking
-            WHERE DATE(timestamp) = CURRENT_DATE
-              AND gate ILIKE '%%_in';
-        """)
-        todays_entries = cur.fetchone()
-
-        # Today's exits
-        cur.execute("""
-            SELECT COUNT(*) AS count
-            FROM parking
-            WHERE DATE(timestamp) = CURRENT_DATE
-              AND gate ILIKE '%%_out';
-        """)
-        todays_exits = cur.fetchone()
-
-        # Yesterday's entries
-        cur.execute("""
-            SELECT COUNT(*) AS count
-            FROM parking
-            WHERE DATE(timestamp) = CURRENT_DATE - INTERVAL '1 day'
-              AND gate ILIKE '%%_in';
-        """)
-        yesterdays_entries = cur.fetchone()
-
-        # Yesterday's exits
-        cur.execute("""
-            SELECT COUNT(*) AS count
-            FROM parking
-            WHERE DATE(timestamp) = CURRENT_DATE - INTERVAL '1 day'
-              AND gate ILIKE '%%_out';
-        """)
-        yesterdays_exits = cur.fetchone()
-
+        # One range scan over yesterday and today, split with conditional aggregation
+        cur.execute(TRENDS_SQL, trend_params())
+        counts = cur.fetchone()
         cur.close()
         conn.close()
 
         return jsonify({
-            "todays_entries": todays_entries,
-            "todays_exits": todays_exits,
-            "yesterdays_entries": yesterdays_entries,
-            "yesterdays_exits": yesterdays_exits
+            "todays_entries": {"count": counts["todays_entries"]},
+            "todays_exits": {"count": counts["todays_exits"]},
+            "yesterdays_entries": {"count": counts["yesterdays_entries"]},
+            "yesterdays_exits": {"count": counts["yesterdays_exits"]}
         })
     except Exception as e:
         app.logger.error(f"Error in /stats/trends endpoint: {e}")
@@ -483,43 +652,56 @@ def stats_trends() -> Any:
 def duration_stats() -> Any:
     """
     Endpoint to retrieve duration statistics for parking entries.
-    
+
+    Each entry since start_time is paired with the next exit of the same plate.
+
     Query parameters:
     - start_time: Required start time for filtering.
+    - mode: "raw" (default) returns every session; "percentiles" returns the
+      session count and p50/p90/p99 dwell time (seconds) per category and overall;
+      "histogram" returns session counts per category in dwell-time buckets.
+    - buckets: Optional comma-separated bucket edges in seconds for histogram mode.
+    - format: "records" (default) or "columnar" for raw mode, as for /data.
     """
+    try:
+        fmt: str = table_format()
+    except ValueError as ve:
+        return jsonify({"error": "Invalid input", "details": str(ve)}), 400
     try:
         start_time: Optional[str] = request.args.get("start_time")
         if not start_time:
             return jsonify({"error": "start_time parameter is required"}), 400
-
-        query: str = """
-            SELECT
-                e.insertion_id AS entry_id,
-                e.license_plate,
-                e.timestamp AS entry_timestamp,
-                x.timestamp AS exit_timestamp,
-                EXTRACT(EPOCH FROM (x.timestamp - e.timestamp)) AS duration
-            FROM parking e
-            LEFT JOIN LATERAL (
-                SELECT *
-                FROM parking x
-                WHERE x.license_plate = e.license_plate
-                  AND x.gate ILIKE '%%_out'
-                  AND x.timestamp > e.timestamp
-                ORDER BY x.timestamp ASC
-                LIMIT 1
-            ) x ON true
-            WHERE e.gate ILIKE '%%_in'
-              AND e.timestamp >= %s::timestamptz;
-        """
-        params: Tuple[Any, ...] = (start_time,)
-        conn: Connection = get_db_connection()
-        cur = conn.cursor()
+        mode: str = request.args.get("mode", "raw").lower()
+        if mode not in ("raw", "percentiles", "histogram"):
+            return jsonify({"error": "Invalid mode. Use 'raw', 'percentiles' or 'histogram'."}), 400
+
+        edges = DURATION_BUCKET_EDGES
+        if request.args.get("buckets"):
+            try:
+                edges = parse_bucket_edges(request.args["buckets"])
+            except ValueError as ve:
+                return jsonify({"error": "Invalid input", "details": str(ve)}), 400
+
+        params: Dict[str, Any] = {"start_time": start_time, "edges": edges}
+        query = {
+            "raw": DURATION_RAW_SQL,
+            "percentiles": DURATION_PERCENTILES_SQL,
+            "histogram": DURATION_HISTOGRAM_SQL,
+        }[mode]
+        conn: Connection = get_read_connection()
+        cur = conn.cursor(cursor_factory=TupleCursor)
         cur.execute(query, params)
-        results = cur.fetchall()
+        table = fetch_table(cur)
         cur.close()
         conn.close()
-        return jsonify(results)
+
+        if mode == "raw":
+            return table_response(table, fmt)
+        results = table.records()
+
+        if mode == "percentiles":
+            return jsonify(duration_percentiles(results))
+        return jsonify(duration_histogram(results, edges))
     except Exception as e:
         app.logger.error(f"Error in /stats/duration-stats endpoint: {e}")
         app.logger.error(traceback.format_exc())
@@ -531,19 +713,12 @@ def duration_stats() -> Any:
 @app.route("/stats/today-exits", methods=["GET"])
 def today_exits() -> Any:
     """
-    Endpoint to retrieve the count of today's parking exits.
+    Endpoint to retrieve the count of today's parking exits (site timezone).
     """
     try:
-        query: str = """
-            SELECT COUNT(*) AS count
-            FROM parking
-            WHERE DATE(timestamp) = CURRENT_DATE
-              AND gate ILIKE '%%_out'
-              AND category != 'pedestrian';
-        """
-        conn: Connection = get_db_connection()
+        conn: Connection = get_read_connection()
         cur = conn.cursor()
-        cur.execute(query)
+        cur.execute(TODAY_EXITS_SQL, today_params())
         result = cur.fetchone()
         cur.close()
         conn.close()
@@ -562,9 +737,9 @@ def test() -> Any:
     Test endpoint to retrieve the 5 most recent parking entries.
     """
     try:
-        conn: Connection = get_db_connection()
+        conn: Connection = get_read_connection()
         cur = conn.cursor()
-        cur.execute("SELECT * FROM parking ORDER BY timestamp DESC LIMIT 5;")
+        cur.execute("SELECT * FROM parking_events ORDER BY timestamp DESC LIMIT 5;")
         test_entries = cur.fetchall()
         cur.close()
         conn.close()
@@ -578,7 +753,7 @@ def test() -> Any:
 # testing endpoint for mapping vehicles (/data1)
 #---------------------------------------
 def parse_timestamp_utc(ts: str) -> datetime:
-    """Parse timestamp from 'Sat, 01 Mar 2025 13:02:55 UTC' or 'Fri, 28 Feb 2025 13:46:16 GMT'"""
+    """Parse timestamp from 'Sat, 01 Mar 2025 13:02:55 UTC' or 'Fri, 28 Feb 2025 13:46:16 GMT' as an aware UTC datetime"""
     app.logger.info(f"Attempting to parse timestamp: '{ts}'")
     formats = [
         "%a, %d %b %Y %H:%M:%S UTC",  # Primary format for database
@@ -586,7 +761,7 @@ def parse_timestamp_utc(ts: str) -> datetime:
     ]
     for fmt in formats:
         try:
-            dt = datetime.strptime(ts, fmt)
+            dt = datetime.strptime(ts, fmt).replace(tzinfo=timezone.utc)
             app.logger.info(f"Successfully parsed with format '{fmt}': {dt}")
             return dt
         except ValueError as e:
@@ -609,12 +784,16 @@ def data1():
     - Implements pagination.
     - Sorts by most recent entry time.
     - Fetches all data if no date range specified.
+    - format=columnar returns "data" as {"columns": [...], "rows": [[...]]}; an
+      Accept of application/vnd.apache.arrow.stream returns the rows as an Arrow
+      IPC stream with the pagination info in its schema metadata.
 
     Returns:
     - JSON response with parking data, pagination info, or error details.
     """
     try:
         app.logger.info("Endpoint /data1 accessed")
+        fmt = table_format()
 
         # Extract query parameters
         start_date_str = request.args.get("start_date")
@@ -644,141 +823,35 @@ def data1():
             app.logger.error("Start date is after end date")
             return jsonify({"error": "Invalid date range", "details": "start_date must be before end_date"}), 400
 
-        # Convert to string format for query (use UTC to match database)
-        start_date_str = start_date.strftime('%a, %d %b %Y %H:%M:%S UTC') if start_date else None
-        end_date_str = end_date.strftime('%a, %d %b %Y %H:%M:%S UTC') if end_date else None
-
         page_size = int(page_size_str)
         page = int(page_str)
         offset = (page - 1) * page_size
 
-        app.logger.info(f"Processed parameters: start_date={start_date_str}, end_date={end_date_str}, "
+        app.logger.info(f"Processed parameters: start_date={start_date}, end_date={end_date}, "
                         f"license_prefix={license_prefix}, categories={categories}, colors={colors}, "
                         f"gates={gates}, search={search}, page={page}, page_size={page_size}")
 
-        # Build WHERE clauses for entries
-        where_clauses = [
-            "gate LIKE '%_in'",
-            "category != 'pedestrian'",
-            "license_plate != '-'"
-        ]
+        query, params, count_query, count_params = entry_exit_queries({
+            "start_date": start_date,
+            "end_date": end_date,
+            "license_prefix": license_prefix,
+            "categories": categories,
+            "colors": colors,
+            "gates": gates,
+            "search": search,
+        })
 
-        if start_date_str and end_date_str:
-            where_clauses.append(f"timestamp BETWEEN '{start_date_str}' AND '{end_date_str}'")
-            app.logger.info(f"Applied date filter: timestamp BETWEEN '{start_date_str}' AND '{end_date_str}'")
-        else:
-            app.logger.info("No date filter applied; fetching all data")
-
-        if license_prefix:
-            where_clauses.append(f"license_plate ILIKE '{license_prefix}%'")
-        if categories and categories.lower() != "undefined":
-            categories_list = ",".join(f"'{cat.strip()}'" for cat in categories.split(','))
-            where_clauses.append(f"category IN ({categories_list})")
-        if colors and colors.lower() != "undefined":
-            colors_list = ",".join(f"'{col.strip()}'" for cat in categories.split(','))
-            where_clauses.append(f"color IN ({colors_list})")
-        if gates and colors.lower() != "undefined":
-            gates_list = ",".join(f"'{gate.strip()}'" for cat in categories.split(','))
-            where_clauses.append(f"gate IN ({gates_list})")
-        if search:
-            search_pattern = f'%{search}%'
-            where_clauses.append(f"""(
-                license_plate ILIKE '{search_pattern}' OR
-                category ILIKE '{search_pattern}' OR
-                color ILIKE '{search_pattern}' OR
-                gate ILIKE '{search_pattern}' OR
-                zone::TEXT ILIKE '{search_pattern}' OR
-                description ILIKE '{search_pattern}'
-            )""")
-
-        # Construct the query
-        query = f"""
-            WITH entries AS (
-                SELECT
-                    insertion_id,
-                    license_plate,
-                    category,
-                    color,
-                    gate AS entry_gate,
-                    timestamp AS entry_time,
-                    zone,
-                    description
-                FROM parking
-                WHERE {' AND '.join(where_clauses)}
-            ),
-            exits AS (
-                SELECT
-                    license_plate,
-                    gate AS exit_gate,
-                    timestamp AS exit_time
-                FROM parking
-                WHERE gate LIKE '%_out'
-                {f"AND timestamp <= '{end_date_str}'" if end_date_str else ""}
-            ),
-            matched_exits AS (
-                SELECT
-                    e.insertion_id,
-                    e.license_plate,
-                    e.entry_time,
-                    MIN(x.exit_time) AS exit_time
-                FROM entries e
-                LEFT JOIN exits x
-                    ON e.license_plate = x.license_plate
-                    AND x.exit_time > e.entry_time
-                GROUP BY e.insertion_id, e.license_plate, e.entry_time
-            )
-            SELECT
-                e.insertion_id,
-                e.license_plate,
-                e.category,
-                e.color,
-                e.entry_gate,
-                TO_CHAR(e.entry_time, 'Dy, DD Mon YYYY HH24:MI:SS TZ') AS entry_time,
-                COALESCE(x.exit_gate, 'Not Exited') AS exit_gate,
-                TO_CHAR(m.exit_time, 'Dy, DD Mon YYYY HH24:MI:SS TZ') AS exit_time,
-                e.zone,
-                e.description,
-                CASE
-                    WHEN m.exit_time IS NOT NULL
-                    THEN EXTRACT(EPOCH FROM (m.exit_time - e.entry_time))
-                    ELSE -1
-                END AS duration
-            FROM entries e
-            LEFT JOIN matched_exits m
-                ON e.insertion_id = m.insertion_id
-                AND e.license_plate = m.license_plate
-                AND e.entry_time = m.entry_time
-            LEFT JOIN exits x
-                ON m.license_plate = x.license_plate
-                AND m.exit_time = x.exit_time
-            ORDER BY e.entry_time DESC
-            LIMIT {page_size} OFFSET {offset}
-        """
+        conn = get_read_connection()
+        try:
+            with conn.cursor(cursor_factory=TupleCursor) as cur:
+                execute_prepared(cur, query, params + [page_size, offset])
+                table = fetch_table(cur)
 
-        count_query = f"""
-            WITH entries AS (
-                SELECT insertion_id
-                FROM parking
-                WHERE {' AND '.join(where_clauses)}
-            )
-            SELECT COUNT(*) AS total FROM entries
-        """
+                execute_prepared(cur, count_query, count_params)
+                total_records = cur.fetchone()[0]
 
-        conn = get_db_connection()
-        try:
-            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                app.logger.info(f"Executing query: {query}")
-                cur.execute(query)
-                results = cur.fetchall()
-                results_list = [dict(row) for row in results]
-
-                app.logger.info(f"Executing count query: {count_query}")
-                cur.execute(count_query)
-                total_records = cur.fetchone()['total']
-
-            app.logger.info(f"Returning {len(results_list)} records, total={total_records}")
-            return jsonify({
-                "data": results_list,
+            app.logger.info(f"Returning {len(table.rows)} records, total={total_records}")
+            return table_response(table, fmt, {
                 "page": page,
                 "page_size": page_size,
                 "total_records": total_records,
@@ -804,16 +877,20 @@ def data1():
 #----------------------------------
 #endpoint for Analytics page
 #-----------------------------------
-def parse_timestamp(timestamp_str):
-    """Parse GMT timestamp into a GMT-formatted string."""
-    try:
-        dt = datetime.strptime(timestamp_str, '%a, %d %b %Y %H:%M:%S GMT')
-        return dt.strftime('%a, %d %b %Y %H:%M:%S GMT')
-    except ValueError:
-        raise ValueError(f"Unsupported timestamp format: {timestamp_str}")
-
 @app.route("/stats/enhanced-stats", methods=["GET"])
 def get_enhanced_stats():
+    """
+    Aggregates for the Analytics page.
+
+    Query parameters:
+    - start_date, end_date: GMT strings; default to the time_range (today, week,
+      month) or the last 30 days.
+    - bucket: zone_activity_timeline resolution, "auto" (default), "1m", "5m",
+      "1h" or "1d". "auto" keeps the timeline within max_points points
+      (default TIMELINE_MAX_POINTS).
+    - downsample: "lttb" to reduce a finer timeline to max_points points with
+      Largest-Triangle-Three-Buckets instead of coarser bins.
+    """
     try:
         app.logger.info("Endpoint /stats/enhanced-stats accessed")
 
@@ -821,355 +898,73 @@ def get_enhanced_stats():
         start_date_str = request.args.get("start_date")
         end_date_str = request.args.get("end_date")
         time_range = request.args.get("time_range", "custom")
+        bucket = request.args.get("bucket", "auto")
+        if bucket != "auto" and bucket not in TIMELINE_BUCKETS:
+            return jsonify({"error": "Invalid bucket. Use 'auto', '1m', '5m', '1h' or '1d'."}), 400
+        try:
+            max_points = int(request.args.get("max_points", TIMELINE_MAX_POINTS))
+        except ValueError:
+            max_points = 0
+        if max_points < 1:
+            return jsonify({"error": "Invalid max_points. Use a positive integer."}), 400
+        downsample = request.args.get("downsample", "").lower() == "lttb"
 
-        # Current UTC time
-        now = datetime.utcnow()
-
-        # Parse dates or set defaults
-        start_date = parse_timestamp(start_date_str) if start_date_str else (now - timedelta(days=30)).strftime('%a, %d %b %Y %H:%M:%S GMT')
-        end_date = parse_timestamp(end_date_str) if end_date_str else now.strftime('%a, %d %b %Y %H:%M:%S GMT')
-
-        # Adjust dates based on time_range if no explicit dates provided
-        if not start_date_str and not end_date_str:
-            if time_range == 'today':
-                start_date = now.replace(hour=0, minute=0, second=0, microsecond=0).strftime('%a, %d %b %Y %H:%M:%S GMT')
-                end_date = now.strftime('%a, %d %b %Y %H:%M:%S GMT')
-            elif time_range == 'week':
-                start_date = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0).strftime('%a, %d %b %Y %H:%M:%S GMT')
-                end_date = now.strftime('%a, %d %b %Y %H:%M:%S GMT')
-            elif time_range == 'month':
-                start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).strftime('%a, %d %b %Y %H:%M:%S GMT')
-                end_date = now.strftime('%a, %d %b %Y %H:%M:%S GMT')
+        start_date, end_date = enhanced_stats_period(start_date_str, end_date_str, time_range)
+        bucket_seconds = timeline_bucket_seconds(bucket, start_date, end_date, max_points, downsample)
 
         app.logger.info(f"Fetching stats from {start_date} to {end_date}")
 
         # Calculate previous period
         prev_start_date, prev_end_date = calculate_previous_period(start_date, end_date, time_range)
 
-        # Connect to the database
-        conn = get_db_connection()
-        try:
-            # Helper function to execute queries
-            def execute_query(cur, query):
-                app.logger.info(f"Executing query: {query}")
-                cur.execute(query)
-
-            # Get entry/exit counts (exclude pedestrians)
-            entry_count = 0
-            exit_count = 0
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT
-                        SUM(CASE WHEN gate LIKE '%_in' THEN 1 ELSE 0 END) AS entry_count,
-                        SUM(CASE WHEN gate LIKE '%_out' THEN 1 ELSE 0 END) AS exit_count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                """
-                execute_query(cur, query)
-                result = cur.fetchone()
-                if result:
-                    entry_count = result.get('entry_count', 0) or 0
-                    exit_count = result.get('exit_count', 0) or 0
-
-            # Get zone activity timeline (hourly, exclude pedestrians)
-            zone_activity_timeline = []
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT
-                        timestamp AS time,
-                        COUNT(*) AS activity
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY timestamp
-                    ORDER BY timestamp
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        time_str = row['time'].strftime('%a, %d %b %Y %H:%M:%S GMT') if isinstance(row['time'], datetime) else str(row['time'])
-                        zone_activity_timeline.append({
-                            "time": time_str,
-                            "activity": row['activity']
-                        })
-
-            # Get total events (exclude pedestrians)
-            total_events = 0
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT COUNT(*) AS total_events
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                """
-                execute_query(cur, query)
-                result = cur.fetchone()
-                if result:
-                    total_events = result.get('total_events', 0) or 0
-
-            # Get busiest hour (exclude pedestrians)
-            busiest_hour = None
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT
-                        EXTRACT(HOUR FROM timestamp::TIMESTAMP) AS hour,
-                        COUNT(*) AS count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY hour
-                    ORDER BY count DESC
-                    LIMIT 1
-                """
-                execute_query(cur, query)
-                result = cur.fetchone()
-                if result:
-                    busiest_hour = int(result['hour'])
-
-            # Get category counts (exclude pedestrians)
-            category_counts = {}
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT category, COUNT(*) AS count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY category
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        category_counts[row['category']] = row['count']
-
-            # Get gate usage (exclude pedestrians)
-            gate_usage = {}
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT gate, COUNT(*) AS count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY gate
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        gate_usage[row['gate']] = row['count']
-
-            # Get hourly trend (exclude pedestrians)
-            hourly_trend = {}
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT
-                        EXTRACT(HOUR FROM timestamp::TIMESTAMP) AS hour,
-                        COUNT(*) AS count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY hour
-                    ORDER BY hour
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        hourly_trend[int(row['hour'])] = row['count']
-
-            # Get color distribution (exclude pedestrians)
-            color_distribution = {}
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT color, COUNT(*) AS count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY color
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        color_distribution[row['color']] = row['count']
-
-            # Get zone counts (exclude pedestrians)
-            zone_counts = {}
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT zone, COUNT(*) AS count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY zone
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        zone_counts[row['zone']] = row['count']
-
-            # Get entry/exit by category (exclude pedestrians)
-            entry_exit_by_category = {}
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT
-                        category,
-                        SUM(CASE WHEN gate LIKE '%_in' THEN 1 ELSE 0 END) AS entry,
-                        SUM(CASE WHEN gate LIKE '%_out' THEN 1 ELSE 0 END) AS exit
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY category
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        entry_exit_by_category[row['category']] = {
-                            "entry": row['entry'] if row['entry'] is not None else 0,
-                            "exit": row['exit'] if row['exit'] is not None else 0
-                        }
-
-            # Get daily trend (exclude pedestrians)
-            daily_trend = {}
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT
-                        DATE(timestamp) AS day,
-                        COUNT(*) AS count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY day
-                    ORDER BY day
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        day_str = row['day'].strftime('%Y-%m-%d') if isinstance(row['day'], datetime) else str(row['day'])
-                        daily_trend[day_str] = row['count']
-
-            # Get heatmap data (exclude pedestrians)
-            heatmap_data = []
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT
-                        EXTRACT(DOW FROM timestamp::TIMESTAMP) AS day_of_week,
-                        EXTRACT(HOUR FROM timestamp::TIMESTAMP) AS hour,
-                        COUNT(*) AS count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY day_of_week, hour
-                    ORDER BY day_of_week, hour
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        heatmap_data.append({
-                            "day_of_week": int(row['day_of_week']),
-                            "hour": int(row['hour']),
-                            "count": row['count']
-                        })
-
-            # Get previous period category counts (exclude pedestrians)
-            previous_counts = {}
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT category, COUNT(*) AS count
-                    FROM parking
-                    WHERE timestamp BETWEEN '{prev_start_date}' AND '{prev_end_date}'
-                    AND category != 'pedestrian'
-                    GROUP BY category
-                """
-                execute_query(cur, query)
-                results = cur.fetchall()
-                for row in results:
-                    if row:
-                        previous_counts[row['category']] = row['count']
-
-            # Calculate percentage changes
-            percentage_changes = calculate_percentage_changes(category_counts, previous_counts)
-
-            # Build response
-            stats = {
-                "entry_exit_counts": {"entry": entry_count, "exit": exit_count},
-                "zone_activity_timeline": zone_activity_timeline,
-                "total_events": total_events,
-                "busiest_hour": busiest_hour,
-                "category_counts": category_counts,
-                "gate_usage": gate_usage,
-                "hourly_trend": hourly_trend,
-                "color_distribution": color_distribution,
-                "zone_counts": zone_counts,
-                "entry_exit_by_category": entry_exit_by_category,
-                "daily_trend": daily_trend,
-                "heatmap_data": heatmap_data
+        # Both periods in the in-memory store: no database round-trip at all.
+        if columnar_store is not None and columnar_store.covers(prev_start_date) \
+                and columnar_store.covers(start_date):
+            stats = columnar_store.enhanced_stats(start_date, end_date, bucket_seconds)
+            previous_counts = columnar_store.category_counts(prev_start_date, prev_end_date)
+        else:
+            conn = get_read_connection()
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    rows = {}
+                    params = {"start": start_date, "end": end_date, "bucket": timedelta(seconds=bucket_seconds)}
+                    for name, query in ENHANCED_STATS_SQL.items():
+                        cur.execute(query, params)
+                        rows[name] = cur.fetchall()
+                    stats = build_enhanced_stats(rows)
+
+                    # Previous period category counts (exclude pedestrians)
+                    cur.execute(ENHANCED_STATS_SQL["categories"], {"start": prev_start_date, "end": prev_end_date})
+                    previous_counts = category_counts(cur.fetchall())
+            finally:
+                conn.close()
+
+            # Add whatever part of either period lies in the Parquet archive.
+            if parking_archive.reaches(start_date):
+                stats = merge_enhanced_stats(stats, parking_archive.enhanced_stats(start_date, end_date,
+                                                                                   bucket_seconds))
+            if parking_archive.reaches(prev_start_date):
+                previous_counts = merge_counts(previous_counts,
+                                               parking_archive.category_counts(prev_start_date, prev_end_date))
+
+        if downsample:
+            stats["zone_activity_timeline"] = downsample_timeline(stats["zone_activity_timeline"], max_points)
+
+        # Calculate percentage changes
+        percentage_changes = calculate_percentage_changes(stats["category_counts"], previous_counts)
+        return jsonify({
+            "stats": stats,
+            "percentage_changes": percentage_changes,
+            "time_period": {
+                "start_date": start_date,
+                "end_date": end_date,
+                "time_range": time_range
             }
-
-            return jsonify({
-                "stats": stats,
-                "percentage_changes": percentage_changes,
-                "time_period": {
-                    "start_date": start_date,
-                    "end_date": end_date,
-                    "time_range": time_range
-                }
-            })
-
-        finally:
-            conn.close()
+        })
 
     except Exception as e:
         app.logger.error(f"Error: {str(e)}\n{traceback.format_exc()}")
         return jsonify({"error": "Could not load stats", "details": str(e)}), 500
-# Helper functions remain unchanged
-def calculate_previous_period(start_date, end_date, time_range):
-    try:
-        start = datetime.strptime(start_date, '%a, %d %b %Y %H:%M:%S GMT')
-        end = datetime.strptime(end_date, '%a, %d %b %Y %H:%M:%S GMT')
-
-        if time_range == 'today':
-            delta = end - start
-            prev_start = start - delta
-            prev_end = end - delta
-        elif time_range == 'week':
-            prev_start = start - timedelta(weeks=1)
-            prev_end = end - timedelta(weeks=1)
-        elif time_range == 'month':
-            prev_start = start.replace(month=start.month-1 if start.month > 1 else 12, year=start.year-1 if start.month == 1 else start.year)
-            prev_end = end.replace(month=end.month-1 if end.month > 1 else 12, year=end.year-1 if end.month == 1 else end.year)
-        else:  # custom
-            delta = end - start
-            prev_start = start - delta
-            prev_end = end - delta
-
-        return prev_start.strftime('%a, %d %b %Y %H:%M:%S GMT'), prev_end.strftime('%a, %d %b %Y %H:%M:%S GMT')
-    except ValueError as e:
-        app.logger.error(f"Date parsing error: {str(e)}")
-        now = datetime.utcnow()
-        default_start = now - timedelta(days=30)
-        return default_start.strftime('%a, %d %b %Y %H:%M:%S GMT'), now.strftime('%a, %d %b %Y %H:%M:%S GMT')
-
-def calculate_percentage_changes(current_counts, previous_counts):
-    percentage_changes = {}
-    all_categories = set(list(current_counts.keys()) + list(previous_counts.keys()))
-
-    for category in all_categories:
-        current = current_counts.get(category, 0)
-        previous = previous_counts.get(category, 0)
-        if previous == 0:
-            change = 0 if current == 0 else 100
-        else:
-            change = ((current - previous) / previous) * 100
-        percentage_changes[category] = round(change, 2)
-
-    return percentage_changes
 
 
 
@@ -1178,35 +973,31 @@ def calculate_percentage_changes(current_counts, previous_counts):
 #----------------------------------------
 
 
+def filter_options_response(dimension: str, key: str) -> Any:
+    """
+    Build the response for one /filters/* endpoint from the dimension cache.
+
+    With counts=true the response also maps each value to its number of rows.
+    Responses carry an ETag, so unchanged options are answered with 304.
+    """
+    options = dimension_cache.get(dimension)
+    with_counts = request.args.get("counts", "false").lower() == "true"
+    body: Dict[str, Any] = {key: options.values}
+    if with_counts:
+        body["counts"] = options.counts
+    response = jsonify(body)
+    response.set_etag(options.counts_etag if with_counts else options.values_etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
 @app.route("/filters/colors", methods=["GET"])
 def get_colors_filter() -> Any:
     """
     Endpoint to match frontend expectations for color filters.
     """
     try:
-        conn: Connection = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT color FROM parking WHERE color IS NOT NULL;")
-        colors_tuples = cur.fetchall()
-        
-        # Debug the result structure
-        app.logger.debug(f"Colors query result type: {type(colors_tuples)}")
-        app.logger.debug(f"First result item type: {type(colors_tuples[0]) if colors_tuples else 'N/A'}")
-        
-        # Handle different result formats
-        colors = []
-        for item in colors_tuples:
-            if isinstance(item, dict):
-                colors.append(item['color'])
-            elif isinstance(item, (list, tuple)):
-                colors.append(item[0])
-            else:
-                # If it's directly the value
-                colors.append(item)
-        
-        cur.close()
-        conn.close()
-        return jsonify({"colors": colors})
+        return filter_options_response("color", "colors")
     except Exception as e:
         app.logger.error(f"Error in /filters/colors route: {e}")
         app.logger.error(traceback.format_exc())
@@ -1219,24 +1010,7 @@ def get_categories_filter() -> Any:
     Endpoint to match frontend expectations for category filters.
     """
     try:
-        conn: Connection = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT category FROM parking WHERE category IS NOT NULL;")
-        categories_tuples = cur.fetchall()
-        
-        # Handle different result formats
-        categories = []
-        for item in categories_tuples:
-            if isinstance(item, dict):
-                categories.append(item['category'])
-            elif isinstance(item, (list, tuple)):
-                categories.append(item[0])
-            else:
-                categories.append(item)
-        
-        cur.close()
-        conn.close()
-        return jsonify({"categories": categories})
+        return filter_options_response("category", "categories")
     except Exception as e:
         app.logger.error(f"Error in /filters/categories route: {e}")
         app.logger.error(traceback.format_exc())
@@ -1248,24 +1022,7 @@ def get_gates_filter() -> Any:
     Endpoint to get unique gate names from database.
     """
     try:
-        conn: Connection = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT gate FROM parking WHERE gate IS NOT NULL;")
-        gates_tuples = cur.fetchall()
-        
-        # Handle different result formats
-        gates = []
-        for item in gates_tuples:
-            if isinstance(item, dict):
-                gates.append(item['gate'])
-            elif isinstance(item, (list, tuple)):
-                gates.append(item[0])
-            else:
-                gates.append(item)
-        
-        cur.close()
-        conn.close()
-        return jsonify({"gates": gates})
+        return filter_options_response("gate", "gates")
     except Exception as e:
         app.logger.error(f"Error in /filters/gates route: {e}")
         app.logger.error(traceback.format_exc())
@@ -1276,70 +1033,101 @@ def get_gates_filter() -> Any:
 #--------------------------------------
 # endpoint to fetch and log the exports
 #--------------------------------------
-LOG_FILE_PATH = os.path.join(os.path.dirname(__file__), 'export_logs.json')
-
-# Ensure the log file exists initially
-if not os.path.exists(LOG_FILE_PATH):
-    with open(LOG_FILE_PATH, 'w') as f:
-        json.dump([], f)
-
-def load_logs():
-    """Read the current logs from the file."""
-    try:
-        with open(LOG_FILE_PATH, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return []
-
-def save_logs(logs):
-    """Write logs back to the file."""
-    with open(LOG_FILE_PATH, 'w') as f:
-        json.dump(logs, f, indent=2)
+export_log_store = ExportLogStore()
 
 @app.route('/log-export', methods=['POST'])
 def log_export():
-    """Log an export event to the file with rotation."""
+    """Append an export event to the export history."""
     data = request.get_json()
     if not data:
         return jsonify({'error': 'No data provided'}), 400
 
-    # Prepare the new log entry
-    new_log = {
-        'id': None,  # ID will be assigned after rotation
-        'fileName': data.get('fileName'),
-        'format': data.get('format'),
-        'exportType': data.get('exportType'),
-        'filters': data.get('filters'),
-        'recordCount': data.get('recordCount'),
-        'user': data.get('user'),
-        'timestamp': data.get('timestamp', datetime.utcnow().isoformat())
-    }
-
-    # Load existing logs
-    logs = load_logs()
-
-    # Log rotation logic
-    if len(logs) >= 10:
-        # Remove the oldest log (first entry) and shift IDs
-        logs = logs[1:]  # Keep logs from index 1 to end
-        # Reassign IDs from 1 to 9 for the remaining logs
-        for i, log in enumerate(logs, start=1):
-            log['id'] = i
-
-    # Assign the next ID to the new log (max 10)
-    new_log['id'] = min(len(logs) + 1, 10)
-    logs.append(new_log)
-
-    # Save updated logs
-    save_logs(logs)
+    try:
+        new_log = export_log_store.append(data)
+    except Exception as e:
+        app.logger.error(f"Error in /log-export endpoint: {e}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({"error": "Could not log export", "details": f"{e}"}), 500
 
     return jsonify({'message': 'Export logged successfully', 'log': new_log}), 200
 
 @app.route('/export-logs', methods=['GET'])
 def get_export_logs():
-    """Return the current logs."""
-    logs = load_logs()
-    return jsonify(logs)
+    """
+    Return export history, newest first.
+
+    Query parameters (all optional):
+    - user, format, export_type: Exact-match filters.
+    - since, until: ISO-8601 bounds on the export timestamp.
+    - page, page_size: Pagination settings (default page 1 of 10 entries).
+
+    The total number of matching entries is returned in the X-Total-Count header.
+    """
+    try:
+        logs, total = export_log_store.query(
+            user=request.args.get("user"),
+            file_format=request.args.get("format"),
+            export_type=request.args.get("export_type"),
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            page=int(request.args.get("page", 1)),
+            page_size=int(request.args.get("page_size", 10))
+        )
+    except ValueError as ve:
+        return jsonify({"error": "Invalid input", "details": str(ve)}), 400
+    response = jsonify(logs)
+    response.headers["X-Total-Count"] = str(total)
+    return response
+
+
+# ---------------------------------------
+# /debug/queries
+# ---------------------------------------
+@app.route("/debug/queries", methods=["GET"])
+def debug_queries() -> Any:
+    """
+    Route and query latency histograms since the process started, slowest
+    queries first, with the plans captured for slow queries (querylog.py).
+    """
+    if query_log is None:
+        return jsonify({"error": "Query statistics are disabled (QUERY_STATS=false)"}), 404
+    if not QUERY_STATS_TOKEN:
+        return jsonify({"error": "/debug/queries is disabled (QUERY_STATS_TOKEN is not set)"}), 404
+    try:
+        check_token(request.headers.get("X-Query-Stats-Token"))
+    except PermissionError as pe:
+        return jsonify({"error": "Forbidden", "details": str(pe)}), 403
+    return jsonify(query_log.snapshot())
+
+
+# ---------------------------------------
+# /debug/profiles
+# ---------------------------------------
+@app.route("/debug/profiles", methods=["GET"])
+def debug_profiles() -> Any:
+    """Saved request profiles (profiling.py), newest first."""
+    if not PROFILING:
+        return jsonify({"error": "Profiling is disabled (PROFILING=false)"}), 404
+    try:
+        check_profile_token(request.headers.get("X-Profile-Token"))
+    except PermissionError as pe:
+        return jsonify({"error": "Forbidden", "details": str(pe)}), 403
+    return jsonify(list_profiles())
+
+@app.route("/debug/profiles/<profile_id>", methods=["GET"])
+def debug_profile(profile_id: str) -> Any:
+    """Download a saved profile: folded stacks (sample mode) or a pstats dump (cprofile mode)."""
+    if not PROFILING:
+        return jsonify({"error": "Profile not found"}), 404
+    try:
+        check_profile_token(request.headers.get("X-Profile-Token"))
+    except PermissionError as pe:
+        return jsonify({"error": "Forbidden", "details": str(pe)}), 403
+    profile = profile_file(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(profile["path"], as_attachment=True, download_name=profile["file"],
+                     mimetype="text/plain" if profile["mode"] == "sample" else "application/octet-stream")
 
 
 
@@ -0,0 +1,564 @@
+# archive.py
+"""
+Cold storage of closed months of parking data in Parquet.
+
+The archiver moves whole monthly partitions (migration 004), together with
+the same month's partition of parking_detections (migration 006), out of
+Postgres once they ended more than ARCHIVE_AFTER_MONTHS months ago:
+
+    ARCHIVE_DIR/month=2025-01/part-0.parquet
+    ARCHIVE_DIR/manifest.json        <- months that are queryable
+
+Each month is written sorted by timestamp (so row-group statistics let
+readers skip by time) and verified against the partition's row count before
+the partition is detached and dropped; only then is the month added to the
+manifest. Partitions that the ingester's retention already detached into the
+`archive` schema are picked up the same way.
+
+ParkingArchive is the query side: a pyarrow dataset over the archived months,
+filtered with the same semantics as filters.compile_filters. Archived months
+are always older than anything left in `parking`, so endpoints merge by
+appending archive rows after the live rows (newest first), or by adding up
+aggregates.
+
+Usage (database settings come from the usual DB_* environment variables):
+    python endpoint/archive.py --after-months 12
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from psycopg2.extensions import connection as Connection  # type: ignore
+
+from exporters import ARROW_BATCH_SIZE, EXPORT_FIELDNAMES, iter_query_rows
+from filters import LIST_FILTERS, SEARCH_COLUMNS, split_list
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR: str = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "archive"))
+ARCHIVE_AFTER_MONTHS: int = int(os.environ.get("ARCHIVE_AFTER_MONTHS", 0))  # 0 = archiver off
+ARCHIVE_INTERVAL: int = int(os.environ.get("ARCHIVE_INTERVAL", 6 * 3600))
+
+MANIFEST = "manifest.json"
+PARTITION_NAME = re.compile(r"^parking_p(\d{4})_(\d{2})$")
+# The same month's pedestrians (migration 006), archived into the same file.
+DETECTIONS_PARTITION = "parking_detections_p{year}_{month}"
+# The exported columns plus the ingester's direction and vehicle class
+# (migration 005). Months archived before these were kept read them as null.
+ARCHIVE_FIELDNAMES = EXPORT_FIELDNAMES + ["direction", "vehicle_class"]
+
+
+def archive_schema() -> Any:
+    """Archive columns (ARCHIVE_FIELDNAMES order); IDs stay text, unlike the exports."""
+    import pyarrow as pa
+
+    return pa.schema([
+        pa.field(name, pa.timestamp("us", tz="UTC") if name == "timestamp" else pa.string())
+        for name in ARCHIVE_FIELDNAMES
+    ])
+
+
+def month_bounds(month: str) -> Tuple[datetime, datetime]:
+    """Half-open UTC [start, end) of a 'YYYY-MM' month."""
+    year, mon = map(int, month.split("-"))
+    start = datetime(year, mon, 1, tzinfo=timezone.utc)
+    end = datetime(year + mon // 12, mon % 12 + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+
+def to_datetime(value: Any) -> Optional[datetime]:
+    """Filter dates arrive as aware datetimes or as strings Postgres would accept."""
+    if value is None or isinstance(value, datetime):
+        return value
+    text = value.strip()
+    for fmt in ("%a, %d %b %Y %H:%M:%S GMT", "%a, %d %b %Y %H:%M:%S UTC"):
+        try:
+            return datetime.strptime(text, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class ParkingArchive:
+    """Read side of the Parquet archive."""
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR) -> None:
+        self.archive_dir = archive_dir
+        self._manifest: Dict[str, Any] = {}
+        self._manifest_mtime: Optional[float] = None
+        self.lock = threading.Lock()
+
+    # ---- manifest ----------------------------------------------------
+
+    def manifest(self) -> Dict[str, Any]:
+        """Archived months ('YYYY-MM' -> details), re-read when the file changes."""
+        path = os.path.join(self.archive_dir, MANIFEST)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {}
+        if mtime != self._manifest_mtime:
+            with open(path) as f:
+                self._manifest = json.load(f)["months"]
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def add_month(self, month: str, details: Dict[str, Any]) -> None:
+        with self.lock:
+            months = dict(self.manifest())
+            months[month] = details
+            tmp = os.path.join(self.archive_dir, MANIFEST + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump({"months": dict(sorted(months.items()))}, f, indent=2)
+            os.replace(tmp, os.path.join(self.archive_dir, MANIFEST))
+
+    def month_path(self, month: str) -> str:
+        return os.path.join(self.archive_dir, f"month={month}", "part-0.parquet")
+
+    def hot_start(self) -> Optional[datetime]:
+        """Where the live data begins: the end of the newest archived month."""
+        months = self.manifest()
+        return month_bounds(max(months))[1] if months else None
+
+    def reaches(self, start_date: Any) -> bool:
+        """Whether a range starting at start_date (None = unbounded) includes archived months."""
+        hot_start = self.hot_start()
+        if hot_start is None:
+            return False
+        start = to_datetime(start_date)
+        return start is None or start < hot_start
+
+    def _months(self, start: Optional[datetime], end: Optional[datetime]) -> List[str]:
+        """Archived months overlapping [start, end], newest first."""
+        selected = []
+        for month in sorted(self.manifest(), reverse=True):
+            month_start, month_end = month_bounds(month)
+            if (start is None or start < month_end) and (end is None or end >= month_start):
+                selected.append(month)
+        return selected
+
+    # ---- scanning ----------------------------------------------------
+
+    def _expression(self, filters: Mapping[str, Any], exclude_pedestrians: bool) -> Any:
+        """filters.compile_filters semantics as a pyarrow dataset expression."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        conditions = []
+        ts_type = pa.timestamp("us", tz="UTC")
+        start, end = to_datetime(filters.get("start_date")), to_datetime(filters.get("end_date"))
+        if start:
+            conditions.append(ds.field("timestamp") >= pa.scalar(start, ts_type))
+        if end:
+            conditions.append(ds.field("timestamp") <= pa.scalar(end, ts_type))
+        if exclude_pedestrians:
+            conditions.append(ds.field("category") != "pedestrian")
+        prefixes = [p.upper() for p in split_list(filters.get("license_prefix"))]
+        if prefixes:
+            conditions.append(_any([pc.starts_with(ds.field("license_plate"), p) for p in prefixes]))
+        for column, key in LIST_FILTERS:
+            values = split_list(filters.get(key))
+            if values:
+                conditions.append(ds.field(column).isin(values))
+        search = (filters.get("search") or "").strip()
+        if search:
+            conditions.append(_any([pc.match_substring(ds.field(column), search, ignore_case=True)
+                                    for column in SEARCH_COLUMNS]))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def scan(self, filters: Mapping[str, Any], exclude_pedestrians: bool = False,
+             columns: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        Yield (month, table) for each archived month matching the filters,
+        newest month first, rows sorted newest first.
+        """
+        import pyarrow.dataset as ds
+
+        expression = self._expression(filters, exclude_pedestrians)
+        months = self._months(to_datetime(filters.get("start_date")), to_datetime(filters.get("end_date")))
+        for month in months:
+            dataset = ds.dataset(self.month_path(month), format="parquet", schema=archive_schema())
+            table = dataset.to_table(columns=list(columns) if columns else None, filter=expression)
+            if "timestamp" in table.column_names:
+                table = table.sort_by([("timestamp", "descending")])
+            yield month, table
+
+    def count(self, filters: Mapping[str, Any], exclude_pedestrians: bool = False) -> int:
+        """Number of archived rows matching the filters."""
+        import pyarrow.dataset as ds
+
+        expression = self._expression(filters, exclude_pedestrians)
+        months = self._months(to_datetime(filters.get("start_date")), to_datetime(filters.get("end_date")))
+        return sum(ds.dataset(self.month_path(month), format="parquet", schema=archive_schema())
+                   .count_rows(filter=expression) for month in months)
+
+    def iter_rows(self, filters: Mapping[str, Any], exclude_pedestrians: bool = False,
+                  fieldnames: Sequence[str] = EXPORT_FIELDNAMES) -> Iterator[tuple]:
+        """Matching rows as tuples in `fieldnames` order, newest first."""
+        for _, table in self.scan(filters, exclude_pedestrians, fieldnames):
+            for batch in table.to_batches(ARROW_BATCH_SIZE):
+                yield from zip(*(column.to_pylist() for column in batch.columns))
+
+    def page(self, filters: Mapping[str, Any], skip: int, limit: int,
+             exclude_pedestrians: bool = False) -> List[Dict[str, Any]]:
+        """`limit` matching rows (as dicts) after skipping `skip`, newest first."""
+        rows: List[Dict[str, Any]] = []
+        for _, table in self.scan(filters, exclude_pedestrians):
+            if skip >= table.num_rows:
+                skip -= table.num_rows
+                continue
+            rows.extend(table.slice(skip, limit - len(rows)).to_pylist())
+            skip = 0
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def enhanced_stats(self, start_date: Any, end_date: Any, bucket_seconds: int) -> Dict[str, Any]:
+        """
+        The /stats/enhanced-stats aggregates over archived, non-pedestrian rows
+        in [start_date, end_date], keyed like the endpoint's own results. The
+        timeline is counted in epoch-aligned bins of bucket_seconds.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        width = bucket_seconds * 1_000_000
+
+        stats: Dict[str, Any] = {
+            "entry_exit_counts": {"entry": 0, "exit": 0},
+            "zone_activity_timeline": [],
+            "category_counts": {}, "gate_usage": {}, "hourly_trend": {}, "color_distribution": {},
+            "zone_counts": {}, "entry_exit_by_category": {}, "daily_trend": {}, "heatmap": {},
+        }
+        filters = {"start_date": start_date, "end_date": end_date}
+        columns = ("timestamp", "category", "color", "gate", "zone", "direction")
+        for month, table in self.scan(filters, exclude_pedestrians=True, columns=columns):
+            if table.num_rows == 0:
+                continue
+            ts = table["timestamp"]
+            if "direction" in pq.read_schema(self.month_path(month)).names:
+                is_entry = pc.fill_null(pc.equal(table["direction"], "in"), False)
+                is_exit = pc.fill_null(pc.equal(table["direction"], "out"), False)
+            else:
+                # Archived before the direction was kept: the gate naming
+                # convention migration 005 backfilled it from.
+                is_entry = pc.fill_null(pc.ends_with(table["gate"], "_in"), False)
+                is_exit = pc.fill_null(pc.ends_with(table["gate"], "_out"), False)
+            table = table.append_column("hour", pc.hour(ts)) \
+                         .append_column("dow", pc.day_of_week(ts, count_from_zero=True, week_start=7)) \
+                         .append_column("day", pc.strftime(ts, format="%Y-%m-%d")) \
+                         .append_column("entry", pc.cast(is_entry, "int64")) \
+                         .append_column("exit", pc.cast(is_exit, "int64")) \
+                         .append_column("bin", pc.multiply(pc.divide(pc.cast(ts, pa.int64()), width), width))
+
+            stats["entry_exit_counts"]["entry"] += pc.sum(table["entry"]).as_py() or 0
+            stats["entry_exit_counts"]["exit"] += pc.sum(table["exit"]).as_py() or 0
+            for column, key in (("category", "category_counts"), ("gate", "gate_usage"),
+                                ("hour", "hourly_trend"), ("color", "color_distribution"),
+                                ("zone", "zone_counts"), ("day", "daily_trend")):
+                for row in table.group_by(column).aggregate([([], "count_all")]).to_pylist():
+                    _add(stats[key], row[column], row["count_all"])
+            for row in table.group_by(["dow", "hour"]).aggregate([([], "count_all")]).to_pylist():
+                _add(stats["heatmap"], (row["dow"], row["hour"]), row["count_all"])
+            for row in table.group_by("category").aggregate([("entry", "sum"), ("exit", "sum")]).to_pylist():
+                counts = stats["entry_exit_by_category"].setdefault(row["category"], {"entry": 0, "exit": 0})
+                counts["entry"] += row["entry_sum"]
+                counts["exit"] += row["exit_sum"]
+            timeline = table.group_by("bin").aggregate([([], "count_all")]) \
+                            .sort_by([("bin", "descending")]).to_pylist()
+            stats["zone_activity_timeline"].extend(
+                {"time": datetime.fromtimestamp(row["bin"] // 1_000_000, timezone.utc),
+                 "activity": row["count_all"]}
+                for row in timeline
+            )
+        stats["zone_activity_timeline"].reverse()  # oldest first, like the endpoint
+        return stats
+
+    def category_counts(self, start_date: Any, end_date: Any, exclude_pedestrians: bool = True) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        filters = {"start_date": start_date, "end_date": end_date}
+        for _, table in self.scan(filters, exclude_pedestrians=exclude_pedestrians, columns=("category",)):
+            for row in table.group_by("category").aggregate([([], "count_all")]).to_pylist():
+                _add(counts, row["category"], row["count_all"])
+        return counts
+
+
+def _any(expressions: List[Any]) -> Any:
+    result = expressions[0]
+    for expression in expressions[1:]:
+        result = result | expression
+    return result
+
+
+def _add(counts: Dict[Any, int], key: Any, value: int) -> None:
+    counts[key] = counts.get(key, 0) + value
+
+
+def merge_counts(live: Dict[Any, int], archived: Dict[Any, int]) -> Dict[Any, int]:
+    merged = dict(live)
+    for key, value in archived.items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def merge_enhanced_stats(stats: Dict[str, Any], archived: Dict[str, Any]) -> Dict[str, Any]:
+    """Add ParkingArchive.enhanced_stats results to a /stats/enhanced-stats `stats` object."""
+    entry_exit_by_category = {category: dict(counts)
+                              for category, counts in stats["entry_exit_by_category"].items()}
+    for category, counts in archived["entry_exit_by_category"].items():
+        merged = entry_exit_by_category.setdefault(category, {"entry": 0, "exit": 0})
+        merged["entry"] += counts["entry"]
+        merged["exit"] += counts["exit"]
+    heatmap = merge_counts({(row["day_of_week"], row["hour"]): row["count"] for row in stats["heatmap_data"]},
+                           archived["heatmap"])
+    hourly_trend = dict(sorted(merge_counts(stats["hourly_trend"], archived["hourly_trend"]).items()))
+    category_counts = merge_counts(stats["category_counts"], archived["category_counts"])
+    # Archived months are older than every live row; a bin spanning the
+    # boundary appears in both and is summed.
+    timeline: Dict[str, int] = {}
+    for row in archived["zone_activity_timeline"]:
+        _add(timeline, row["time"].strftime("%a, %d %b %Y %H:%M:%S GMT"), row["activity"])
+    for row in stats["zone_activity_timeline"]:
+        _add(timeline, row["time"], row["activity"])
+    return {
+        "entry_exit_counts": {
+            "entry": stats["entry_exit_counts"]["entry"] + archived["entry_exit_counts"]["entry"],
+            "exit": stats["entry_exit_counts"]["exit"] + archived["entry_exit_counts"]["exit"],
+        },
+        "zone_activity_timeline": [{"time": time, "activity": activity} for time, activity in timeline.items()],
+        "total_events": sum(category_counts.values()),
+        "busiest_hour": max(hourly_trend, key=hourly_trend.get) if hourly_trend else None,
+        "category_counts": category_counts,
+        "gate_usage": merge_counts(stats["gate_usage"], archived["gate_usage"]),
+        "hourly_trend": hourly_trend,
+        "color_distribution": merge_counts(stats["color_distribution"], archived["color_distribution"]),
+        "zone_counts": merge_counts(stats["zone_counts"], archived["zone_counts"]),
+        "entry_exit_by_category": entry_exit_by_category,
+        "daily_trend": dict(sorted(merge_counts(stats["daily_trend"], archived["daily_trend"]).items())),
+        "heatmap_data": [{"day_of_week": dow, "hour": hour, "count": count}
+                         for (dow, hour), count in sorted(heatmap.items())],
+    }
+
+
+# ---------------------------------------
+# Archiver
+# ---------------------------------------
+def _expired(month: str, after_months: int, today: Optional[date] = None) -> bool:
+    """Whether a month ended more than `after_months` months before the current month."""
+    today = today or datetime.now(timezone.utc).date()
+    year, mon = map(int, month.split("-"))
+    return (today.year * 12 + today.month) - (year * 12 + mon) > after_months
+
+
+# A partition's rows with color, gate, description and zone decoded from their
+# ids (migration 007), as the parking_events view has them.
+DECODED_PARTITION_SQL = """
+    SELECT p.insertion_id, p.license_plate, p.category, c.name AS color, p.timestamp,
+           g.name AS gate, p.zone::text AS zone, d.name AS description,
+           p.direction::text AS direction, p.vehicle_class
+    FROM {table} p
+    LEFT JOIN parking_colors c ON c.id = p.color_id
+    LEFT JOIN parking_gates g ON g.id = p.gate_id
+    LEFT JOIN parking_descriptions d ON d.id = p.description_id
+"""
+
+
+def month_source(tables: Sequence[str]) -> str:
+    """The decoded rows of one month's partitions, as a FROM item."""
+    return "(" + " UNION ALL ".join(DECODED_PARTITION_SQL.format(table=table) for table in tables) + ") AS month"
+
+
+def write_month(conn: Connection, table: str, path: str) -> int:
+    """Stream month_source (or any relation), oldest first, into a Parquet file. Returns the row count."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = archive_schema()
+    query = f"SELECT {', '.join(ARCHIVE_FIELDNAMES)} FROM {table} ORDER BY timestamp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = path + ".part"
+    count = 0
+    rows = iter_query_rows(conn, query, ())
+    with pq.ParquetWriter(part, schema, compression="zstd", write_statistics=True) as writer:
+        while True:
+            chunk = [row for _, row in zip(range(ARROW_BATCH_SIZE), rows)]
+            if not chunk:
+                break
+            writer.write_batch(pa.RecordBatch.from_pylist(
+                [dict(zip(ARCHIVE_FIELDNAMES, row)) for row in chunk], schema=schema
+            ))
+            count += len(chunk)
+    os.replace(part, path)
+    return count
+
+
+def _value(row: Any, key: str) -> Any:
+    return row[key] if isinstance(row, dict) else row[0]
+
+
+def archive_partitions(connect: Callable[[], Connection], after_months: int,
+                       archive: Optional[ParkingArchive] = None) -> List[str]:
+    """
+    Move every monthly partition that ended more than `after_months` months
+    ago (and every partition already detached into the `archive` schema) to
+    Parquet, then drop it from Postgres.
+
+    All files are written and verified first; the partitions are then detached
+    and dropped in one transaction, and only after that commits are the months
+    added to the manifest, so no row is ever served from both places.
+
+    Returns:
+        The archived months ('YYYY-MM').
+    """
+    archive = archive or ParkingArchive()
+    os.makedirs(archive.archive_dir, exist_ok=True)
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext('parking_archive')) AS locked")
+            locked = _value(cur.fetchone(), "locked")
+        conn.commit()
+        if not locked:
+            logger.info("Archiver already running elsewhere; skipping")
+            return []
+        try:
+            return _archive_locked(conn, after_months, archive)
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(hashtext('parking_archive'))")
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def _archive_locked(conn: Connection, after_months: int, archive: ParkingArchive) -> List[str]:
+    import pyarrow.parquet as pq
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT n.nspname AS schema, c.relname AS name,
+                   EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid) AS attached
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind = 'r' AND n.nspname IN ('public', 'archive')
+              AND c.relname ~ '^parking_(detections_)?p[0-9]{4}_[0-9]{2}$'
+            ORDER BY c.relname
+        """)
+        found = [(r["schema"], r["name"], r["attached"]) if isinstance(r, dict) else tuple(r)
+                 for r in cur.fetchall()]
+    conn.commit()
+    tables = [table for table in found if PARTITION_NAME.match(table[1])]
+    detections = {name: schema for schema, name, _ in found if not PARTITION_NAME.match(name)}
+
+    # Files left by a run that dropped its partitions but stopped before
+    # updating the manifest.
+    in_postgres = {name for _, name, _ in tables}
+    manifest = archive.manifest()
+    for entry in sorted(os.listdir(archive.archive_dir)):
+        month = entry[len("month="):]
+        path = archive.month_path(month)
+        if (entry.startswith("month=") and month not in manifest and os.path.exists(path)
+                and f"parking_p{month.replace('-', '_')}" not in in_postgres):
+            archive.add_month(month, {"rows": pq.read_metadata(path).num_rows,
+                                      "path": os.path.relpath(path, archive.archive_dir),
+                                      "archived_at": datetime.now(timezone.utc).isoformat()})
+            logger.info(f"Recovered archived month {month}")
+
+    written: Dict[str, Tuple[List[str], int]] = {}
+    detach = False
+    for schema, name, attached in tables:
+        year, mon = PARTITION_NAME.match(name).groups()
+        month = f"{year}-{mon}"
+        if schema == "public" and not (attached and _expired(month, after_months)):
+            continue
+        sibling = DETECTIONS_PARTITION.format(year=year, month=mon)
+        partitions = [name] + ([sibling] if sibling in detections else [])
+        source = month_source([f"{detections.get(table, schema)}.{table}" for table in partitions])
+        path = archive.month_path(month)
+        rows = write_month(conn, source, path)
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) AS count FROM {source}")
+            expected = _value(cur.fetchone(), "count")
+        conn.commit()
+        if expected != rows:
+            raise RuntimeError(f"{' + '.join(partitions)}: wrote {rows} rows, tables have {expected}")
+        written[month] = (partitions, rows)
+        detach = detach or schema == "public"
+    if not written:
+        return []
+
+    with conn.cursor() as cur:
+        if detach:
+            # Moves the expired partitions to the `archive` schema and takes
+            # their rows out of the filter option counts.
+            cur.execute("SELECT parking_detach_expired_partitions(%s)", (after_months,))
+        for partitions, _ in written.values():
+            for name in partitions:
+                cur.execute(f"DROP TABLE archive.{name}")
+    conn.commit()
+
+    for month, (partitions, rows) in written.items():
+        path = archive.month_path(month)
+        archive.add_month(month, {"rows": rows, "path": os.path.relpath(path, archive.archive_dir),
+                                  "archived_at": datetime.now(timezone.utc).isoformat()})
+        logger.info(f"Archived {' + '.join(partitions)} ({rows} rows) to {path}")
+    return list(written)
+
+
+def start_archiver(connect: Callable[[], Connection], archive: ParkingArchive,
+                   after_months: int = ARCHIVE_AFTER_MONTHS, interval: int = ARCHIVE_INTERVAL) -> None:
+    """Run the archiver every `interval` seconds in a daemon thread (no-op when disabled)."""
+    if after_months <= 0:
+        return
+
+    def loop() -> None:
+        while True:
+            try:
+                archive_partitions(connect, after_months, archive)
+            except Exception as e:
+                logger.error(f"Archiver run failed: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="archiver", daemon=True).start()
+
+
+def main() -> int:
+    import psycopg2
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Move closed months of parking data to Parquet.")
+    parser.add_argument("--after-months", type=int, default=ARCHIVE_AFTER_MONTHS or 12,
+                        help="archive partitions that ended more than this many months ago")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    def connect() -> Connection:
+        return psycopg2.connect(
+            dbname=os.environ.get("DB_NAME", "flow"),
+            user=os.environ.get("DB_USER", "postgres"),
+            password=os.environ.get("DB_PASSWORD"),
+            host=os.environ.get("DB_HOST", "db"),
+            port=os.environ.get("DB_PORT", 5432),
+        )
+
+    months = archive_partitions(connect, args.after_months)
+    print(f"Archived {len(months)} month(s): {', '.join(months) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
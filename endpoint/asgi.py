@@ -0,0 +1,948 @@
+# asgi.py
+"""
+The endpoint service as an ASGI app (FastAPI + asyncpg), for uvicorn:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 4
+
+It serves the same routes with the same responses as app.py (the Flask app,
+still usable with `python app.py`). Database queries run on an asyncpg pool,
+so a slow analytics query only occupies its own coroutine and connection while
+the dashboard's polling endpoints keep being answered, and every worker
+process has its own event loop and pool. asyncpg prepares each statement it
+runs and keeps the prepared statements in a per-connection LRU cache of
+ASYNC_STATEMENT_CACHE_SIZE entries, so repeated queries skip parsing and
+planning as they do with db.execute_prepared in the Flask app. The SQL itself
+is shared with app.py (filters.py, stats.py) and converted to asyncpg's `$n`
+placeholders by db.to_asyncpg.
+
+The components that are synchronous by design (the /count cache, filter
+options, exports and export jobs, the export log, the Parquet archive and the
+columnar statistics store) are the same classes app.py uses. They run in the
+threadpool on a psycopg2 pool of their own.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import traceback
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from email.utils import format_datetime
+from time import perf_counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Set, Tuple, TypeVar, Union
+from uuid import UUID
+
+import asyncpg
+import psycopg2
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response
+from psycopg2.extras import RealDictCursor
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+
+load_dotenv()  # Load environment variables from .env file
+
+# Local modules read their settings from the environment at import time.
+from archive import ParkingArchive, merge_counts, merge_enhanced_stats, start_archiver, to_datetime  # noqa: E402
+from batch import BatchPlan, dashboard_summary  # noqa: E402
+from columnar import COLUMNAR_CACHE_DAYS, ColumnarStore  # noqa: E402
+from counts import COUNT_SCOPES, RecordCounter  # noqa: E402
+from db import ConnectionPool, PooledConnection, to_asyncpg  # noqa: E402
+from dimensions import DimensionCache  # noqa: E402
+from export_jobs import ExportJobManager  # noqa: E402
+from profiling import (  # noqa: E402
+    PROFILING, check_profile_token, list_profiles, profile_file, requested_mode, start_profile
+)
+from querylog import EXPLAIN, QUERY_STATS_TOKEN, InstrumentedConnection, check_token, pool_wait, query_log  # noqa: E402
+from replicas import Replica, ReplicaRouter, asyncpg_settings, replica_settings  # noqa: E402
+from export_log_store import ExportLogStore  # noqa: E402
+from exporters import (  # noqa: E402
+    EXPORT_FILTER_KEYS, EXPORT_MIMETYPES, EXPORT_WRITERS, build_export_query, export_to_tempfile,
+    iter_query_rows
+)
+from filters import FILTER_KEYS, compile_filters  # noqa: E402
+from tabular import ARROW, ARROW_STREAM_MIMETYPE, RECORDS, Table, arrow_stream, response_format  # noqa: E402
+from stats import (  # noqa: E402
+    CATEGORY_STATS_SQL, DASHBOARD_DATA_SQL, DURATION_BUCKET_EDGES, DURATION_HISTOGRAM_SQL,
+    DURATION_PERCENTILES_SQL, DURATION_RAW_SQL, ENHANCED_STATS_SQL, RECENT_ENTRIES_SQL,
+    TIMELINE_BUCKETS, TIMELINE_MAX_POINTS, TODAY_ENTRIES_SQL, TODAY_EXITS_SQL, TRENDS_SQL, build_enhanced_stats,
+    calculate_percentage_changes, calculate_previous_period, category_counts, downsample_timeline,
+    duration_histogram, duration_percentiles, enhanced_stats_period, entry_exit_queries, parse_bucket_edges,
+    timeline_bucket_seconds, today_params, trend_params
+)
+
+ASYNC_POOL_MIN: int = int(os.environ.get("ASYNC_POOL_MIN", 2))
+ASYNC_POOL_MAX: int = int(os.environ.get("ASYNC_POOL_MAX", 10))
+ASYNC_STATEMENT_CACHE_SIZE: int = int(os.environ.get("ASYNC_STATEMENT_CACHE_SIZE", 256))
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("asgi")
+
+DB_SETTINGS: Dict[str, Any] = {
+    "dbname": os.environ.get("DB_NAME", "flow"),
+    "user": os.environ.get("DB_USER", "postgres"),
+    "password": os.environ.get("DB_PASSWORD"),
+    "host": os.environ.get("DB_HOST", "db"),
+    "port": int(os.environ.get("DB_PORT", 5432)),
+}
+
+# The primary's pool and one per replica (by Replica.name), created per worker.
+pool: Optional[asyncpg.Pool] = None
+replica_pools: Dict[str, asyncpg.Pool] = {}
+
+# (fresh, max_lag) of the current request; see route_reads.
+read_preference: ContextVar[Tuple[bool, Optional[float]]] = ContextVar("read_preference", default=(False, None))
+
+# Failures that take a replica out of rotation (the read is retried on the primary).
+REPLICA_ERRORS = (OSError, asyncpg.PostgresConnectionError, asyncpg.ConnectionDoesNotExistError)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    global pool
+    pool = await asyncpg.create_pool(
+        min_size=ASYNC_POOL_MIN,
+        max_size=ASYNC_POOL_MAX,
+        statement_cache_size=ASYNC_STATEMENT_CACHE_SIZE,
+        **asyncpg_settings(DB_SETTINGS)
+    )
+    # Replicas connect on first use, so one that is down does not stop the worker.
+    for replica in read_router.replicas:
+        replica_pools[replica.name] = await asyncpg.create_pool(
+            min_size=0,
+            max_size=ASYNC_POOL_MAX,
+            statement_cache_size=ASYNC_STATEMENT_CACHE_SIZE,
+            **asyncpg_settings(replica.settings)
+        )
+    logger.info(f"asyncpg pool ready (worker pid {os.getpid()})")
+    try:
+        yield
+    finally:
+        await pool.close()
+        for replica_pool in replica_pools.values():
+            await replica_pool.close()
+        sync_pool.closeall()
+        read_router.closeall()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# CORS allowed origins (as in app.py)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[
+        "http://localhost:32212",
+        "http://localhost:3000",
+        "http://35.208.144.223:32212"
+    ],
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Total-Count", "ETag", "Location"],
+)
+
+
+@app.middleware("http")
+async def route_reads(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    """?fresh=true reads from the primary; ?max_lag=<seconds> tightens the replica lag threshold."""
+    try:
+        max_lag = float(request.query_params["max_lag"]) if request.query_params.get("max_lag") else None
+    except ValueError as ve:
+        return FlaskJSONResponse({"error": "Invalid input", "details": str(ve)}, status_code=400)
+    read_preference.set((request.query_params.get("fresh", "false").lower() == "true", max_lag))
+    return await call_next(request)
+
+
+def route_name(request: Request) -> Optional[str]:
+    """
+    "METHOD /path/{param}" of the route request goes to. Matched before the
+    request is handled (rather than read from the scope afterwards), so the
+    queries and profile of the request are already labelled with it.
+    """
+    route = next((route.path for route in app.router.routes
+                  if route.matches(request.scope)[0] == Match.FULL), None)
+    return f"{request.method} {route}" if route else None
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    """
+    Opt-in profiling (profiling.py). The event loop and the threadpool serve
+    every request at once, so the sampler reads all threads: a profile shows
+    what the worker did while the request ran.
+    """
+    try:
+        mode = requested_mode(request.headers.get("X-Profile"), request.query_params.get("profile"),
+                              request.headers.get("X-Profile-Token"))
+    except ValueError as ve:
+        return FlaskJSONResponse({"error": "Invalid input", "details": str(ve)}, status_code=400)
+    except PermissionError as pe:
+        return FlaskJSONResponse({"error": "Forbidden", "details": str(pe)}, status_code=403)
+    profile = None
+    if mode is not None:
+        on_demand = bool(request.headers.get("X-Profile") or request.query_params.get("profile"))
+        profile = start_profile(route_name(request) or f"{request.method} {request.url.path}", mode,
+                                on_demand=on_demand)
+    if profile is None:
+        return await call_next(request)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        description = profile.finish(status)
+    if profile.on_demand:
+        response.headers["X-Profile-Id"] = description["id"]
+        response.headers["X-Profile-Peak-Memory"] = str(description["peak_memory_bytes"])
+    return response
+
+
+@app.middleware("http")
+async def time_queries(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    """Route and query timings (querylog.py); the outermost middleware, so rejected requests count too."""
+    if query_log is None:
+        return await call_next(request)
+    timing = query_log.start_request(route_name(request) or "(unmatched)")
+    response = await call_next(request)
+    length = response.headers.get("content-length")
+    query_log.finish_request(timing, int(length) if length else None, response.status_code)
+    return response
+
+
+# ---------------------------------------
+# Synchronous components (threadpool)
+# ---------------------------------------
+def _connect(**settings: Any) -> PooledConnection:
+    return psycopg2.connect(
+        **{**DB_SETTINGS, **settings},
+        cursor_factory=RealDictCursor,
+        connection_factory=InstrumentedConnection
+    )
+
+
+sync_pool = ConnectionPool(_connect)
+# Also runs the replica health checks the asyncpg reads are routed by.
+read_router = ReplicaRouter(sync_pool, [Replica(settings, _connect)
+                                        for settings in replica_settings(defaults=DB_SETTINGS)])
+parking_archive = ParkingArchive()
+start_archiver(_connect, parking_archive)
+# NOTIFY is not replicated, so the filter options are loaded from the primary.
+dimension_cache = DimensionCache(sync_pool.getconn, listen_connect=_connect)
+columnar_store: Optional[ColumnarStore] = (
+    ColumnarStore(read_router.getconn, dimension_cache) if COLUMNAR_CACHE_DAYS > 0 else None
+)
+record_counter = RecordCounter(read_router.getconn, dimension_cache, parking_archive)
+export_jobs = ExportJobManager(read_router.getconn, archive=parking_archive)
+export_log_store = ExportLogStore()
+
+
+# ---------------------------------------
+# Helpers
+# ---------------------------------------
+def _json_default(value: Any) -> Any:
+    """Serialise values the way Flask's jsonify does (dates as HTTP dates)."""
+    if isinstance(value, datetime):
+        value = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return format_datetime(value, usegmt=True)
+    if isinstance(value, date):
+        return format_datetime(datetime.combine(value, time.min, tzinfo=timezone.utc), usegmt=True)
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FlaskJSONResponse(JSONResponse):
+    """JSON rendered like Flask's jsonify, so both services return identical bodies."""
+
+    def render(self, content: Any) -> bytes:
+        return json.dumps(content, default=_json_default, sort_keys=True, separators=(",", ":")).encode()
+
+
+def error_response(route: str, message: str, e: Exception, status_code: int = 500) -> FlaskJSONResponse:
+    logger.error(f"Error in {route} endpoint: {e}")
+    logger.error(traceback.format_exc())
+    return FlaskJSONResponse({"error": message, "details": f"{e}"}, status_code=status_code)
+
+
+def table_format(request: Request) -> str:
+    """The response format (tabular.py) asked for by ?format= and the Accept header."""
+    return response_format(request.query_params.get("format"), request.headers.get("accept"))
+
+
+def table_response(table: Table, fmt: str, envelope: Optional[Dict[str, Any]] = None) -> Response:
+    """A table in the given format; with an envelope, the rows go in its "data" field (see app.table_response)."""
+    if fmt == ARROW:
+        return Response(arrow_stream(table, envelope), media_type=ARROW_STREAM_MIMETYPE)
+    rows = table.records() if fmt == RECORDS else table.columnar()
+    return FlaskJSONResponse(rows if envelope is None else {"data": rows, **envelope})
+
+
+T = TypeVar("T")
+
+
+@asynccontextmanager
+async def acquire(target: asyncpg.Pool) -> AsyncIterator[asyncpg.Connection]:
+    """A connection from target; the wait for it counts as the request's pool wait."""
+    with pool_wait():
+        conn = await target.acquire()
+    try:
+        yield conn
+    finally:
+        await target.release(conn)
+
+
+async def run_read(work: Callable[[asyncpg.Connection], Awaitable[T]]) -> T:
+    """Run work on a replica chosen for the current request, else (or if it fails to connect) the primary."""
+    replica = read_router.pick(*read_preference.get())
+    if replica is not None:
+        try:
+            async with acquire(replica_pools[replica.name]) as conn:
+                return await work(conn)
+        except REPLICA_ERRORS as e:
+            replica.mark_down(e)
+    async with acquire(pool) as conn:
+        return await work(conn)
+
+
+# Plan captures in progress (the event loop only keeps weak references to tasks).
+explain_tasks: Set["asyncio.Task[None]"] = set()
+
+
+async def explain(sql: str, args: Sequence[Any], seconds: float, rows: int) -> None:
+    """Capture a slow query's plan for the slow-query log (querylog.py), read-only and rolled back."""
+
+    async def work(conn: asyncpg.Connection) -> List[str]:
+        transaction = conn.transaction(readonly=True)
+        await transaction.start()
+        try:
+            return [row[0] for row in await conn.fetch(EXPLAIN + sql, *args)]
+        finally:
+            await transaction.rollback()
+
+    try:
+        plan = await run_read(work)
+    except Exception as e:
+        logger.warning(f"Could not capture the plan of a slow query: {e}")
+        plan = [f"(plan unavailable: {e})"]
+    query_log.record_plan(sql, list(args), seconds, rows, plan)
+
+
+async def timed_records(conn: asyncpg.Connection, sql: str, args: Sequence[Any]) -> List[asyncpg.Record]:
+    """conn.fetch, timed for /debug/queries; the first slow run of a query gets its plan captured."""
+    if query_log is None:
+        return await conn.fetch(sql, *args)
+    started = perf_counter()
+    rows = await conn.fetch(sql, *args)
+    seconds = perf_counter() - started
+    if query_log.record_query(sql, seconds, len(rows)):
+        task = asyncio.get_running_loop().create_task(explain(sql, args, seconds, len(rows)))
+        explain_tasks.add(task)
+        task.add_done_callback(explain_tasks.discard)
+    return rows
+
+
+async def timed_fetch(conn: asyncpg.Connection, sql: str, args: Sequence[Any]) -> List[Dict[str, Any]]:
+    return [dict(row) for row in await timed_records(conn, sql, args)]
+
+
+async def fetch(query: str, params: Union[Sequence[Any], Mapping[str, Any]] = ()) -> List[Dict[str, Any]]:
+    """Run a psycopg2-style query on the read pool (prepared and cached by asyncpg)."""
+    sql, args = to_asyncpg(query, params)
+
+    async def work(conn: asyncpg.Connection) -> List[Dict[str, Any]]:
+        return await timed_fetch(conn, sql, args)
+
+    return await run_read(work)
+
+
+async def fetchrow(query: str, params: Union[Sequence[Any], Mapping[str, Any]] = ()) -> Optional[Dict[str, Any]]:
+    rows = await fetch(query, params)
+    return rows[0] if rows else None
+
+
+async def fetch_table(query: str, params: Union[Sequence[Any], Mapping[str, Any]] = ()) -> Table:
+    """fetch as a tabular.Table of the record tuples."""
+    sql, args = to_asyncpg(query, params)
+
+    async def work(conn: asyncpg.Connection) -> Table:
+        rows = await timed_records(conn, sql, args)
+        if rows:
+            return Table(list(rows[0].keys()), [tuple(row) for row in rows])
+        # No record to take the column names from, so ask the server (an empty page only).
+        statement = await conn.prepare(sql)
+        return Table([attribute.name for attribute in statement.get_attributes()], [])
+
+    return await run_read(work)
+
+
+def request_filters(request: Request, keys: Sequence[str] = FILTER_KEYS) -> Dict[str, Optional[str]]:
+    return {key: request.query_params.get(key) for key in keys}
+
+
+def typed_dates(filters: Mapping[str, Any]) -> Dict[str, Any]:
+    """asyncpg binds timestamptz parameters from datetimes only, not strings."""
+    typed = dict(filters)
+    for key in ("start_date", "end_date"):
+        typed[key] = to_datetime(typed.get(key)) if typed.get(key) else None
+    return typed
+
+
+# ---------------------------------------
+# 1. /data and /count
+# ---------------------------------------
+@app.get("/data")
+async def data(request: Request) -> Response:
+    """Parking data with optional filters (see app.data)."""
+    try:
+        fmt = table_format(request)
+    except ValueError as ve:
+        return FlaskJSONResponse({"error": "Invalid input", "details": str(ve)}, status_code=400)
+    try:
+        filters = request_filters(request)
+        where = compile_filters(typed_dates(filters))
+        page_size = int(request.query_params.get("page_size", 10))
+        page = int(request.query_params.get("page", 1))
+        offset = (page - 1) * page_size
+
+        table = await fetch_table(
+            f"SELECT * FROM parking_events {where} ORDER BY timestamp DESC LIMIT %s OFFSET %s",
+            where.params + [page_size, offset]
+        )
+        # A short page continues into the Parquet archive (older months only).
+        archived = []
+        if len(table.rows) < page_size and parking_archive.reaches(filters["start_date"]):
+            skip = 0
+            if not table.rows:
+                row = await fetchrow(f"SELECT COUNT(*) AS count FROM parking_events {where}", where.params)
+                skip = max(0, offset - row["count"])
+            archived = await run_in_threadpool(parking_archive.page, filters, skip, page_size - len(table.rows))
+        if fmt == RECORDS:
+            return FlaskJSONResponse(table.records() + archived)
+        table.add_records(archived)
+        return table_response(table, fmt)
+    except Exception as e:
+        return error_response("/data", "Could not load data", e)
+
+
+@app.get("/count")
+async def count(request: Request) -> Response:
+    """Record counts for the /data filters (see app.count)."""
+    try:
+        scope = request.query_params.get("scope", "all")
+        if scope not in COUNT_SCOPES:
+            return FlaskJSONResponse({"error": f"Invalid scope. Use one of: {', '.join(COUNT_SCOPES)}."},
+                                     status_code=400)
+        return FlaskJSONResponse(await run_in_threadpool(record_counter.count, scope, request_filters(request)))
+    except Exception as e:
+        return error_response("/count", "Could not count records", e)
+
+
+# ---------------------------------------
+# 2. /dashboard/data
+# ---------------------------------------
+@app.get("/dashboard/data")
+@app.get("/dashboard-data")
+async def dashboard_data(request: Request) -> Response:
+    """Newest vehicle events with a general search."""
+    try:
+        page_size = int(request.query_params.get("page_size", 10))
+        page = int(request.query_params.get("page", 1))
+        params = {"search": request.query_params.get("search"), "limit": page_size,
+                  "offset": (page - 1) * page_size}
+        return FlaskJSONResponse(await fetch(DASHBOARD_DATA_SQL, params))
+    except Exception as e:
+        return error_response("/dashboard/data", "Could not load dashboard data", e)
+
+
+# ---------------------------------------
+# Batched queries (/dashboard/summary, /batch)
+# ---------------------------------------
+async def run_batch_async(plan: BatchPlan) -> Dict[str, Any]:
+    """batch.run_batch on the read pool: one connection, one read-only snapshot."""
+
+    async def work(conn: asyncpg.Connection) -> List[List[Dict[str, Any]]]:
+        rows: List[List[Dict[str, Any]]] = []
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            for query, params in plan.statements:
+                sql, args = to_asyncpg(query, params)
+                rows.append(await timed_fetch(conn, sql, args))
+        return rows
+
+    return plan.assemble(await run_read(work))
+
+
+@app.get("/dashboard/summary")
+async def dashboard_summary_endpoint(request: Request) -> Response:
+    """One refresh of the dashboard (see app.dashboard_summary_endpoint)."""
+    try:
+        plan = BatchPlan(dashboard_summary(
+            page=int(request.query_params.get("page", 1)),
+            page_size=int(request.query_params.get("page_size", 10)),
+            search=request.query_params.get("search")
+        ))
+        return FlaskJSONResponse(await run_batch_async(plan))
+    except ValueError as ve:
+        return FlaskJSONResponse({"error": "Invalid input", "details": str(ve)}, status_code=400)
+    except Exception as e:
+        return error_response("/dashboard/summary", "Could not load dashboard summary", e)
+
+
+@app.post("/batch")
+async def batch(request: Request) -> Response:
+    """Several named sub-queries in one read-only snapshot (see app.batch)."""
+    try:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        plan = BatchPlan(body)
+        return FlaskJSONResponse(await run_batch_async(plan))
+    except ValueError as ve:
+        return FlaskJSONResponse({"error": "Invalid batch", "details": str(ve)}, status_code=400)
+    except Exception as e:
+        return error_response("/batch", "Could not run batch", e)
+
+
+# ---------------------------------------
+# 3.-5., 7. Dashboard counters
+# ---------------------------------------
+@app.get("/stats/category-stats")
+async def category_stats(request: Request) -> Response:
+    try:
+        start_date = request.query_params.get("start_date")
+        end_date = request.query_params.get("end_date")
+        if not start_date or not end_date:
+            return FlaskJSONResponse({"error": "start_date and end_date parameters are required"},
+                                     status_code=400)
+        if columnar_store is not None and columnar_store.covers(start_date):
+            counts = await run_in_threadpool(columnar_store.category_counts, start_date, end_date, False)
+            return FlaskJSONResponse([{"category": category, "count": n} for category, n in counts.items()])
+        params = {"start": to_datetime(start_date), "end": to_datetime(end_date)}
+        results = await fetch(CATEGORY_STATS_SQL, params)
+        if parking_archive.reaches(start_date):
+            archived = await run_in_threadpool(parking_archive.category_counts, start_date, end_date, False)
+            counts = merge_counts({row["category"]: row["count"] for row in results}, archived)
+            results = [{"category": category, "count": n} for category, n in counts.items()]
+        return FlaskJSONResponse(results)
+    except Exception as e:
+        return error_response("/stats/category-stats", "Could not load category stats", e)
+
+
+@app.get("/stats/today-entries")
+async def today_entries() -> Response:
+    try:
+        return FlaskJSONResponse(await fetchrow(TODAY_ENTRIES_SQL, today_params()))
+    except Exception as e:
+        return error_response("/stats/today-entries", "Could not load today's entries", e)
+
+
+@app.get("/stats/today-exits")
+async def today_exits() -> Response:
+    try:
+        return FlaskJSONResponse(await fetchrow(TODAY_EXITS_SQL, today_params()))
+    except Exception as e:
+        return error_response("/stats/today-exits", "Could not load today's exits", e)
+
+
+@app.get("/stats/recent-entries")
+async def recent_entries() -> Response:
+    try:
+        return FlaskJSONResponse(await fetchrow(RECENT_ENTRIES_SQL, {}))
+    except Exception as e:
+        return error_response("/stats/recent-entries", "Could not load recent entries", e)
+
+
+@app.get("/stats/trends")
+async def stats_trends() -> Response:
+    try:
+        counts = await fetchrow(TRENDS_SQL, trend_params())
+        return FlaskJSONResponse({
+            "todays_entries": {"count": counts["todays_entries"]},
+            "todays_exits": {"count": counts["todays_exits"]},
+            "yesterdays_entries": {"count": counts["yesterdays_entries"]},
+            "yesterdays_exits": {"count": counts["yesterdays_exits"]}
+        })
+    except Exception as e:
+        return error_response("/stats/trends", "Could not load trends", e)
+
+
+@app.get("/test")
+async def test() -> Response:
+    try:
+        return FlaskJSONResponse(await fetch("SELECT * FROM parking_events ORDER BY timestamp DESC LIMIT 5"))
+    except Exception as e:
+        return error_response("/test", "Could not load test entries", e)
+
+
+# ---------------------------------------
+# 6. Exports
+# ---------------------------------------
+def _export_file(file_format: str, filters: Dict[str, Optional[str]],
+                 fresh: bool = False, max_lag: Optional[float] = None) -> str:
+    query, params = build_export_query(filters)
+    conn = read_router.getconn(fresh, max_lag)
+    try:
+        rows = iter_query_rows(conn, query, params)
+        if parking_archive.reaches(filters.get("start_date")):
+            rows = itertools.chain(rows, parking_archive.iter_rows(filters, exclude_pedestrians=True))
+        return export_to_tempfile(file_format, rows)
+    finally:
+        conn.close()
+
+
+@app.get("/export")
+async def export(request: Request) -> Response:
+    """Filtered export as CSV, XLSX, Parquet or Arrow IPC (excluding pedestrians)."""
+    try:
+        filters = request_filters(request, EXPORT_FILTER_KEYS)
+        file_format = request.query_params.get("file_format", "csv").lower()
+        if file_format not in EXPORT_WRITERS:
+            return FlaskJSONResponse({"error": "Invalid file format. Use 'csv', 'xlsx', 'parquet' or 'arrow'."},
+                                     status_code=400)
+        path = await run_in_threadpool(_export_file, file_format, filters, *read_preference.get())
+        return FileResponse(path, media_type=EXPORT_MIMETYPES[file_format],
+                            filename=f"parking_data.{file_format}", background=BackgroundTask(os.remove, path))
+    except Exception as e:
+        return error_response("/export", "Could not export data", e)
+
+
+@app.post("/exports")
+async def create_export_job(request: Request) -> Response:
+    """Queue an export in the background (see app.create_export_job)."""
+    try:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        params = {**request.query_params, **(body if isinstance(body, dict) else {})}
+        file_format = str(params.get("file_format", "csv")).lower()
+        if file_format not in EXPORT_WRITERS:
+            return FlaskJSONResponse({"error": "Invalid file format. Use 'csv', 'xlsx', 'parquet' or 'arrow'."},
+                                     status_code=400)
+        filters = {key: params.get(key) for key in EXPORT_FILTER_KEYS}
+        job = await run_in_threadpool(export_jobs.submit, file_format, filters)
+        return FlaskJSONResponse(job.to_dict(), status_code=200 if job.status == "done" else 202,
+                                 headers={"Location": f"/exports/{job.id}"})
+    except Exception as e:
+        return error_response("/exports", "Could not queue export", e)
+
+
+@app.get("/exports/{job_id}")
+async def get_export_job(job_id: str) -> Response:
+    job = await run_in_threadpool(export_jobs.get, job_id)
+    if job is None:
+        return FlaskJSONResponse({"error": "Export not found"}, status_code=404)
+    return FlaskJSONResponse(job.to_dict())
+
+
+@app.get("/exports/{job_id}/download")
+async def download_export_job(job_id: str, request: Request) -> Response:
+    """Download a finished export; FileResponse answers Range requests."""
+    job = await run_in_threadpool(export_jobs.get, job_id)
+    if job is None:
+        return FlaskJSONResponse({"error": "Export not found"}, status_code=404)
+    if job.status != "done":
+        return FlaskJSONResponse({"error": "Export is not ready", "status": job.status}, status_code=409)
+    path = await run_in_threadpool(export_jobs.artifact_path, job)
+    if not os.path.exists(path):
+        return FlaskJSONResponse({"error": "Export file has expired"}, status_code=410)
+    file_name = request.query_params.get("file_name") or "parking_data"
+    return FileResponse(path, media_type=EXPORT_MIMETYPES[job.file_format],
+                        filename=f"{file_name}.{job.file_format}")
+
+
+# ---------------------------------------
+# 8. /stats/duration-stats
+# ---------------------------------------
+@app.get("/stats/duration-stats")
+async def duration_stats(request: Request) -> Response:
+    """Dwell times as raw sessions, percentiles or a histogram (see app.duration_stats)."""
+    try:
+        fmt = table_format(request)
+    except ValueError as ve:
+        return FlaskJSONResponse({"error": "Invalid input", "details": str(ve)}, status_code=400)
+    try:
+        start_time = request.query_params.get("start_time")
+        if not start_time:
+            return FlaskJSONResponse({"error": "start_time parameter is required"}, status_code=400)
+        mode = request.query_params.get("mode", "raw").lower()
+        if mode not in ("raw", "percentiles", "histogram"):
+            return FlaskJSONResponse({"error": "Invalid mode. Use 'raw', 'percentiles' or 'histogram'."},
+                                     status_code=400)
+        edges = DURATION_BUCKET_EDGES
+        if request.query_params.get("buckets"):
+            try:
+                edges = parse_bucket_edges(request.query_params["buckets"])
+            except ValueError as ve:
+                return FlaskJSONResponse({"error": "Invalid input", "details": str(ve)}, status_code=400)
+
+        query = {
+            "raw": DURATION_RAW_SQL,
+            "percentiles": DURATION_PERCENTILES_SQL,
+            "histogram": DURATION_HISTOGRAM_SQL,
+        }[mode]
+        params: Dict[str, Any] = {"start_time": to_datetime(start_time), "edges": [float(edge) for edge in edges]}
+        table = await fetch_table(query, params)
+        if mode == "raw":
+            return table_response(table, fmt)
+        results = table.records()
+        if mode == "percentiles":
+            return FlaskJSONResponse(duration_percentiles(results))
+        return FlaskJSONResponse(duration_histogram(results, edges))
+    except Exception as e:
+        return error_response("/stats/duration-stats", "Could not load duration stats", e)
+
+
+# ---------------------------------------
+# /data1: entries mapped to exits
+# ---------------------------------------
+def parse_timestamp_utc(ts: str) -> datetime:
+    """'Sat, 01 Mar 2025 13:02:55 UTC' or 'Fri, 28 Feb 2025 13:46:16 GMT' as an aware UTC datetime."""
+    for fmt in ("%a, %d %b %Y %H:%M:%S UTC", "%a, %d %b %Y %H:%M:%S GMT"):
+        try:
+            return datetime.strptime(ts, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid timestamp format: {ts}")
+
+
+@app.get("/data1")
+async def data1(request: Request) -> Response:
+    """Vehicle entries with their matching exits (see app.data1)."""
+    args = request.query_params
+    try:
+        start_date = parse_timestamp_utc(args["start_date"]) if args.get("start_date") else None
+        end_date = parse_timestamp_utc(args["end_date"]) if args.get("end_date") else None
+        if start_date and end_date and start_date > end_date:
+            return FlaskJSONResponse({"error": "Invalid date range",
+                                      "details": "start_date must be before end_date"}, status_code=400)
+        page_size = int(args.get("page_size", "10"))
+        page = int(args.get("page", "1"))
+        offset = (page - 1) * page_size
+        fmt = table_format(request)
+    except ValueError as ve:
+        logger.error(f"Input validation error: {ve}")
+        return FlaskJSONResponse({"error": "Invalid input", "details": str(ve)}, status_code=400)
+
+    try:
+        query, params, count_query, count_params = entry_exit_queries({
+            "start_date": start_date,
+            "end_date": end_date,
+            "license_prefix": args.get("license_prefix"),
+            "categories": args.get("categories") or args.get("category"),
+            "colors": args.get("colors") or args.get("color"),
+            "gates": args.get("gates") or args.get("gate"),
+            "search": args.get("search"),
+        })
+        table = await fetch_table(query, params + [page_size, offset])
+        total_records = (await fetchrow(count_query, count_params))["total"]
+        return table_response(table, fmt, {
+            "page": page,
+            "page_size": page_size,
+            "total_records": total_records,
+            "total_pages": math.ceil(total_records / page_size)
+        })
+    except asyncpg.PostgresError as pe:
+        return error_response("/data1", "Database error", pe)
+    except Exception as e:
+        return error_response("/data1", "Could not load data", e)
+
+
+# ---------------------------------------
+# Analytics page (/stats/enhanced-stats)
+# ---------------------------------------
+@app.get("/stats/enhanced-stats")
+async def get_enhanced_stats(request: Request) -> Response:
+    """Aggregates for the Analytics page (see app.get_enhanced_stats)."""
+    try:
+        time_range = request.query_params.get("time_range", "custom")
+        bucket = request.query_params.get("bucket", "auto")
+        if bucket != "auto" and bucket not in TIMELINE_BUCKETS:
+            return FlaskJSONResponse({"error": "Invalid bucket. Use 'auto', '1m', '5m', '1h' or '1d'."},
+                                     status_code=400)
+        try:
+            max_points = int(request.query_params.get("max_points", TIMELINE_MAX_POINTS))
+        except ValueError:
+            max_points = 0
+        if max_points < 1:
+            return FlaskJSONResponse({"error": "Invalid max_points. Use a positive integer."}, status_code=400)
+        downsample = request.query_params.get("downsample", "").lower() == "lttb"
+        start_date, end_date = enhanced_stats_period(
+            request.query_params.get("start_date"), request.query_params.get("end_date"), time_range
+        )
+        bucket_seconds = timeline_bucket_seconds(bucket, start_date, end_date, max_points, downsample)
+        prev_start_date, prev_end_date = calculate_previous_period(start_date, end_date, time_range)
+
+        if columnar_store is not None and columnar_store.covers(prev_start_date) \
+                and columnar_store.covers(start_date):
+            stats = await run_in_threadpool(columnar_store.enhanced_stats, start_date, end_date, bucket_seconds)
+            previous_counts = await run_in_threadpool(columnar_store.category_counts,
+                                                      prev_start_date, prev_end_date)
+        else:
+            params = {"start": to_datetime(start_date), "end": to_datetime(end_date),
+                      "bucket": timedelta(seconds=bucket_seconds)}
+            rows = {name: await fetch(query, params) for name, query in ENHANCED_STATS_SQL.items()}
+            stats = build_enhanced_stats(rows)
+            previous_counts = category_counts(await fetch(
+                ENHANCED_STATS_SQL["categories"],
+                {"start": to_datetime(prev_start_date), "end": to_datetime(prev_end_date)}
+            ))
+            if parking_archive.reaches(start_date):
+                archived = await run_in_threadpool(parking_archive.enhanced_stats, start_date, end_date,
+                                                   bucket_seconds)
+                stats = merge_enhanced_stats(stats, archived)
+            if parking_archive.reaches(prev_start_date):
+                previous_counts = merge_counts(previous_counts, await run_in_threadpool(
+                    parking_archive.category_counts, prev_start_date, prev_end_date))
+
+        if downsample:
+            stats["zone_activity_timeline"] = downsample_timeline(stats["zone_activity_timeline"], max_points)
+
+        return FlaskJSONResponse({
+            "stats": stats,
+            "percentage_changes": calculate_percentage_changes(stats["category_counts"], previous_counts),
+            "time_period": {"start_date": start_date, "end_date": end_date, "time_range": time_range}
+        })
+    except Exception as e:
+        return error_response("/stats/enhanced-stats", "Could not load stats", e)
+
+
+# ---------------------------------------
+# Filter options
+# ---------------------------------------
+async def filter_options_response(request: Request, dimension: str, key: str) -> Response:
+    """Cached options with an ETag; a matching If-None-Match is answered with 304."""
+    options = await run_in_threadpool(dimension_cache.get, dimension)
+    with_counts = request.query_params.get("counts", "false").lower() == "true"
+    etag = f'"{options.counts_etag if with_counts else options.values_etag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    body: Dict[str, Any] = {key: options.values}
+    if with_counts:
+        body["counts"] = options.counts
+    return FlaskJSONResponse(body, headers=headers)
+
+
+@app.get("/filters/colors")
+async def get_colors_filter(request: Request) -> Response:
+    try:
+        return await filter_options_response(request, "color", "colors")
+    except Exception as e:
+        return error_response("/filters/colors", "Could not load colors", e)
+
+
+@app.get("/filters/categories")
+async def get_categories_filter(request: Request) -> Response:
+    try:
+        return await filter_options_response(request, "category", "categories")
+    except Exception as e:
+        return error_response("/filters/categories", "Could not load categories", e)
+
+
+@app.get("/filters/gates")
+async def get_gates_filter(request: Request) -> Response:
+    try:
+        return await filter_options_response(request, "gate", "gates")
+    except Exception as e:
+        return error_response("/filters/gates", "Could not load gates", e)
+
+
+# ---------------------------------------
+# Export history
+# ---------------------------------------
+@app.post("/log-export")
+async def log_export(request: Request) -> Response:
+    """Append an export event to the export history."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data:
+        return FlaskJSONResponse({"error": "No data provided"}, status_code=400)
+    try:
+        new_log = await run_in_threadpool(export_log_store.append, data)
+    except Exception as e:
+        return error_response("/log-export", "Could not log export", e)
+    return FlaskJSONResponse({"message": "Export logged successfully", "log": new_log})
+
+
+@app.get("/export-logs")
+async def get_export_logs(request: Request) -> Response:
+    """Export history, newest first; the total is in the X-Total-Count header."""
+    args = request.query_params
+    try:
+        logs, total = await run_in_threadpool(
+            export_log_store.query,
+            user=args.get("user"),
+            file_format=args.get("format"),
+            export_type=args.get("export_type"),
+            since=args.get("since"),
+            until=args.get("until"),
+            page=int(args.get("page", 1)),
+            page_size=int(args.get("page_size", 10))
+        )
+    except ValueError as ve:
+        return FlaskJSONResponse({"error": "Invalid input", "details": str(ve)}, status_code=400)
+    return FlaskJSONResponse(logs, headers={"X-Total-Count": str(total)})
+
+
+# ---------------------------------------
+# /debug/queries
+# ---------------------------------------
+@app.get("/debug/queries")
+async def debug_queries(request: Request) -> Response:
+    """Route and query latency histograms and captured slow-query plans (see app.debug_queries)."""
+    if query_log is None:
+        return FlaskJSONResponse({"error": "Query statistics are disabled (QUERY_STATS=false)"}, status_code=404)
+    if not QUERY_STATS_TOKEN:
+        return FlaskJSONResponse({"error": "/debug/queries is disabled (QUERY_STATS_TOKEN is not set)"},
+                                 status_code=404)
+    try:
+        check_token(request.headers.get("X-Query-Stats-Token"))
+    except PermissionError as pe:
+        return FlaskJSONResponse({"error": "Forbidden", "details": str(pe)}, status_code=403)
+    return FlaskJSONResponse(query_log.snapshot())
+
+
+# ---------------------------------------
+# /debug/profiles
+# ---------------------------------------
+@app.get("/debug/profiles")
+async def debug_profiles(request: Request) -> Response:
+    """Saved request profiles (see app.debug_profiles)."""
+    if not PROFILING:
+        return FlaskJSONResponse({"error": "Profiling is disabled (PROFILING=false)"}, status_code=404)
+    try:
+        check_profile_token(request.headers.get("X-Profile-Token"))
+    except PermissionError as pe:
+        return FlaskJSONResponse({"error": "Forbidden", "details": str(pe)}, status_code=403)
+    return FlaskJSONResponse(await run_in_threadpool(list_profiles))
+
+
+@app.get("/debug/profiles/{profile_id}")
+async def debug_profile(profile_id: str, request: Request) -> Response:
+    """Download a saved profile (see app.debug_profile)."""
+    if not PROFILING:
+        return FlaskJSONResponse({"error": "Profile not found"}, status_code=404)
+    try:
+        check_profile_token(request.headers.get("X-Profile-Token"))
+    except PermissionError as pe:
+        return FlaskJSONResponse({"error": "Forbidden", "details": str(pe)}, status_code=403)
+    profile = await run_in_threadpool(profile_file, profile_id)
+    if profile is None:
+        return FlaskJSONResponse({"error": "Profile not found"}, status_code=404)
+    return FileResponse(profile["path"], filename=profile["file"],
+                        media_type="text/plain" if profile["mode"] == "sample" else "application/octet-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("asgi:app", host="0.0.0.0", port=5001, workers=int(os.environ.get("ASGI_WORKERS", 2)))
@@ -0,0 +1,139 @@
+# batch.py
+"""
+Several dashboard queries answered in one request (/dashboard/summary, /batch).
+
+A batch names its sub-queries, each one of BATCH_QUERIES with its own
+parameters:
+
+    {"entries": {"query": "today_entries"},
+     "table": {"query": "dashboard_data", "params": {"page": 2, "search": "KA"}}}
+
+and is answered as {"entries": {...}, "table": [...]}. Sub-queries that read
+the same statement with the same parameters share one execution, which covers
+the dashboard's counters: today's entries and exits and the trends all come
+from a single scan of yesterday and today (DASHBOARD_COUNTS_SQL). Every
+statement runs on one pooled connection inside a single REPEATABLE READ, READ
+ONLY transaction, so the parts of the payload agree with each other.
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from psycopg2.extensions import connection as Connection  # type: ignore
+from psycopg2.extras import RealDictCursor
+
+from archive import to_datetime
+from stats import (
+    CATEGORY_STATS_SQL, DASHBOARD_COUNTS_SQL, DASHBOARD_DATA_SQL, RECENT_ENTRIES_SQL, SITE_TIMEZONE,
+    trend_params
+)
+
+BATCH_MAX_QUERIES = 20
+
+READ_ONLY_SNAPSHOT = "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"
+
+Rows = List[Dict[str, Any]]
+
+
+class BatchQuery(NamedTuple):
+    """A sub-query: its statement, its parameters (from the request and the batch's clock) and its result."""
+    sql: str
+    params: Callable[[Mapping[str, Any], datetime], Dict[str, Any]]
+    result: Callable[[Rows], Any]
+
+
+def _dashboard_params(args: Mapping[str, Any], _: datetime) -> Dict[str, Any]:
+    page_size = int(args.get("page_size", 10))
+    page = int(args.get("page", 1))
+    return {"search": args.get("search"), "limit": page_size, "offset": (page - 1) * page_size}
+
+
+def _period_params(args: Mapping[str, Any], _: datetime) -> Dict[str, Any]:
+    if not args.get("start_date") or not args.get("end_date"):
+        raise ValueError("start_date and end_date parameters are required")
+    return {"start": to_datetime(args["start_date"]), "end": to_datetime(args["end_date"])}
+
+
+def _trends(rows: Rows) -> Dict[str, Any]:
+    counts = rows[0]
+    return {
+        "todays_entries": {"count": counts["todays_entries"]},
+        "todays_exits": {"count": counts["todays_exits"]},
+        "yesterdays_entries": {"count": counts["yesterdays_entries"]},
+        "yesterdays_exits": {"count": counts["yesterdays_exits"]},
+    }
+
+
+# Each sub-query answers like the endpoint of the same name.
+BATCH_QUERIES: Dict[str, BatchQuery] = {
+    "dashboard_data": BatchQuery(DASHBOARD_DATA_SQL, _dashboard_params, lambda rows: rows),
+    "today_entries": BatchQuery(DASHBOARD_COUNTS_SQL, lambda args, now: trend_params(now),
+                                lambda rows: {"count": rows[0]["todays_vehicle_entries"]}),
+    "today_exits": BatchQuery(DASHBOARD_COUNTS_SQL, lambda args, now: trend_params(now),
+                              lambda rows: {"count": rows[0]["todays_vehicle_exits"]}),
+    "trends": BatchQuery(DASHBOARD_COUNTS_SQL, lambda args, now: trend_params(now), _trends),
+    "recent_entries": BatchQuery(RECENT_ENTRIES_SQL, lambda args, now: {}, lambda rows: rows[0]),
+    "category_stats": BatchQuery(CATEGORY_STATS_SQL, _period_params, lambda rows: rows),
+}
+
+
+def dashboard_summary(page: int = 1, page_size: int = 10, search: Optional[str] = None) -> Dict[str, Any]:
+    """The batch behind /dashboard/summary: one refresh of the dashboard page."""
+    return {
+        "data": {"query": "dashboard_data", "params": {"page": page, "page_size": page_size, "search": search}},
+        "today_entries": {"query": "today_entries"},
+        "today_exits": {"query": "today_exits"},
+        "trends": {"query": "trends"},
+    }
+
+
+class BatchPlan:
+    """
+    The distinct statements of a batch and how each named result is built.
+
+    Raises:
+        ValueError: For a malformed batch, an unknown query or invalid parameters.
+    """
+
+    def __init__(self, batch: Any, now: Optional[datetime] = None) -> None:
+        if not isinstance(batch, Mapping) or not batch:
+            raise ValueError("Expected an object mapping names to sub-queries")
+        if len(batch) > BATCH_MAX_QUERIES:
+            raise ValueError(f"At most {BATCH_MAX_QUERIES} sub-queries per batch")
+        now = now or datetime.now(SITE_TIMEZONE)
+        self.statements: List[Tuple[str, Dict[str, Any]]] = []
+        self.results: Dict[str, Tuple[int, Callable[[Rows], Any]]] = {}
+        index: Dict[Tuple[str, str], int] = {}
+        for name, spec in batch.items():
+            if not isinstance(spec, Mapping) or spec.get("query") not in BATCH_QUERIES:
+                raise ValueError(f"{name}: query must be one of {', '.join(BATCH_QUERIES)}")
+            query = BATCH_QUERIES[spec["query"]]
+            args = spec.get("params") or {}
+            if not isinstance(args, Mapping):
+                raise ValueError(f"{name}: params must be an object")
+            try:
+                params = query.params(args, now)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{name}: {e}")
+            key = (query.sql, repr(sorted(params.items())))
+            if key not in index:
+                index[key] = len(self.statements)
+                self.statements.append((query.sql, params))
+            self.results[name] = (index[key], query.result)
+
+    def assemble(self, rows: List[Rows]) -> Dict[str, Any]:
+        """The batch response from the rows of each statement, in order."""
+        return {name: result(rows[i]) for name, (i, result) in self.results.items()}
+
+
+def run_batch(conn: Connection, plan: BatchPlan) -> Dict[str, Any]:
+    """Run a batch's statements in one read-only snapshot on conn."""
+    rows: List[Rows] = []
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(READ_ONLY_SNAPSHOT)
+            for sql, params in plan.statements:
+                cur.execute(sql, params)
+                rows.append(cur.fetchall())
+    finally:
+        conn.rollback()
+    return plan.assemble(rows)
@@ -0,0 +1,335 @@
+# columnar.py
+"""
+In-process columnar copy of the recent end of `parking` for the statistics
+endpoints (optional; enabled with COLUMNAR_CACHE_DAYS > 0).
+
+The last COLUMNAR_CACHE_DAYS days of parking_events (vehicles and
+pedestrians) are loaded once with COPY into NumPy arrays, sorted by time:
+
+- timestamp  int64 microseconds since the epoch (UTC)
+- category, color, gate, zone, license_plate, direction  int32 codes into
+  per-column dictionaries (NULL is a dictionary entry like any other value)
+
+A date range is then two binary searches and every GROUP BY is a bincount
+over the codes, with no database round-trip.
+
+Rows are only ever appended, stamped with the current time, so the store is
+kept current the way counts.RecordCounter is: it holds every row up to a
+"settled" time (COLUMNAR_SETTLE_SECONDS in the past) plus a fresh tail after
+it, and a refresh drops the fresh tail and re-reads `timestamp > settled`.
+A refresh runs when the NOTIFY listener of dimensions.DimensionCache reports
+an insert, or at most every COLUMNAR_REFRESH_SECONDS while that listener is
+down. Deletes and detached partitions, which the append-only tail cannot
+see, trigger a full reload, as does COLUMNAR_RELOAD_SECONDS passing.
+
+Hours, days and weekdays are computed in UTC, like the SQL they replace
+(which runs with the database session timezone, UTC in the deployment).
+"""
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from psycopg2.extensions import connection as Connection  # type: ignore
+
+from archive import to_datetime
+from dimensions import DimensionCache
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_CACHE_DAYS: int = int(os.environ.get("COLUMNAR_CACHE_DAYS", 0))  # 0 = disabled
+COLUMNAR_SETTLE_SECONDS: int = int(os.environ.get("COLUMNAR_SETTLE_SECONDS", 60))
+COLUMNAR_REFRESH_SECONDS: float = float(os.environ.get("COLUMNAR_REFRESH_SECONDS", 5))
+COLUMNAR_RELOAD_SECONDS: float = float(os.environ.get("COLUMNAR_RELOAD_SECONDS", 3600))
+
+CODED_COLUMNS = ("category", "color", "gate", "zone", "license_plate", "direction")
+
+COPY_SQL = """
+    COPY (
+        SELECT (EXTRACT(EPOCH FROM timestamp) * 1000000)::bigint,
+               category, color, gate, zone, license_plate, direction
+        FROM parking_events
+        WHERE timestamp > %s
+        ORDER BY timestamp
+    ) TO STDOUT WITH (FORMAT csv, NULL '\\N')
+"""
+
+US_PER_HOUR = 3_600_000_000
+US_PER_DAY = 24 * US_PER_HOUR
+GMT_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+
+def to_micros(value: datetime) -> int:
+    return int(value.timestamp() * 1_000_000)
+
+
+class Dictionary:
+    """Value <-> int32 code mapping for one column; codes are assigned in arrival order."""
+
+    def __init__(self) -> None:
+        self.values: List[Optional[str]] = []
+        self.codes: Dict[Optional[str], int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class Column:
+    """A growable NumPy array (capacity doubles, so appends are amortised O(1))."""
+
+    def __init__(self, dtype: Any) -> None:
+        self.data = np.empty(1024, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values: np.ndarray) -> None:
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.empty(max(needed, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def truncate(self, size: int) -> None:
+        self.size = size
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.size]
+
+
+class ColumnarStore:
+    """
+    Columnar copy of the last `window_days` days of `parking`.
+
+    Args:
+        connect: Factory returning a pooled connection (closed after use).
+        notifications: DimensionCache whose NOTIFY listener announces changes;
+            without one (or while it is down) the store polls for new rows.
+        window_days: How many days back the store covers.
+    """
+
+    def __init__(self, connect: Callable[[], Connection],
+                 notifications: Optional[DimensionCache] = None,
+                 window_days: int = COLUMNAR_CACHE_DAYS,
+                 settle_seconds: int = COLUMNAR_SETTLE_SECONDS,
+                 refresh_seconds: float = COLUMNAR_REFRESH_SECONDS,
+                 reload_seconds: float = COLUMNAR_RELOAD_SECONDS) -> None:
+        self.connect = connect
+        self.window = timedelta(days=window_days)
+        self.settle = timedelta(seconds=settle_seconds)
+        self.refresh_seconds = refresh_seconds
+        self.reload_seconds = reload_seconds
+        self.notifications = notifications
+        self.lock = threading.RLock()
+        self.stale = True      # full reload needed
+        self.dirty = False     # new rows were announced
+        self.window_start: Optional[datetime] = None
+        self.settled_at: Optional[datetime] = None
+        self.refreshed_at = 0.0
+        self.reloaded_at = 0.0
+        self._reset()
+        if notifications is not None:
+            notifications.subscribe(self.on_notify)
+
+    def _reset(self) -> None:
+        self.timestamp = Column(np.int64)
+        self.columns = {name: Column(np.int32) for name in CODED_COLUMNS}
+        self.dictionaries = {name: Dictionary() for name in CODED_COLUMNS}
+
+    # ---- change notifications ----------------------------------------
+
+    def on_notify(self, payload: Optional[str]) -> None:
+        """
+        Callback for the parking_dimensions NOTIFY channel. `None` means the
+        listener (re)connected and may have missed notifications.
+        """
+        if payload == "INSERT":
+            self.dirty = True
+        else:
+            self.stale = True
+
+    @property
+    def listening(self) -> bool:
+        return self.notifications is not None and self.notifications.listening
+
+    # ---- loading -----------------------------------------------------
+
+    def _copy(self, after: datetime) -> int:
+        """Append every row with timestamp > after. Returns the number of rows read."""
+        buffer = io.StringIO()
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(cur.mogrify(COPY_SQL, (after,)).decode(), buffer)
+            conn.commit()
+        finally:
+            conn.close()
+        buffer.seek(0)
+
+        stamps: List[int] = []
+        codes: List[List[int]] = [[] for _ in CODED_COLUMNS]
+        encoders = [self.dictionaries[name].encode for name in CODED_COLUMNS]
+        for row in csv.reader(buffer):
+            stamps.append(int(row[0]))
+            for i, value in enumerate(row[1:]):
+                codes[i].append(encoders[i](None if value == "\\N" else value))
+        self.timestamp.extend(np.array(stamps, dtype=np.int64))
+        for name, column in zip(CODED_COLUMNS, codes):
+            self.columns[name].extend(np.array(column, dtype=np.int32))
+        return len(stamps)
+
+    def _reload(self, now: datetime) -> None:
+        self.stale = self.dirty = False  # notifications from here on apply to the new copy
+        self._reset()
+        self.window_start = now - self.window
+        self._copy(self.window_start)
+        self.settled_at = self.window_start
+        self.reloaded_at = time.monotonic()
+        logger.info(f"Columnar store loaded {self.timestamp.size} rows since {self.window_start}")
+
+    def _refresh(self, now: datetime) -> None:
+        """Drop the fresh tail, re-read everything after the settled time, then trim the window."""
+        keep = int(np.searchsorted(self.timestamp.view(), to_micros(self.settled_at), side="right"))
+        self.timestamp.truncate(keep)
+        for column in self.columns.values():
+            column.truncate(keep)
+        self._copy(self.settled_at)
+
+        # Trim the oldest rows once a day's worth has fallen out of the window.
+        window_start = now - self.window
+        if window_start - self.window_start > timedelta(days=1):
+            cut = int(np.searchsorted(self.timestamp.view(), to_micros(window_start)))
+            for column in [self.timestamp, *self.columns.values()]:
+                kept = column.view()[cut:].copy()
+                column.truncate(0)
+                column.extend(kept)
+            self.window_start = window_start
+
+    def sync(self) -> None:
+        """Bring the store up to date if anything may have changed."""
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            if self.stale or time.monotonic() - self.reloaded_at > self.reload_seconds:
+                self._reload(now)
+            elif self.dirty or (not self.listening
+                                and time.monotonic() - self.refreshed_at > self.refresh_seconds):
+                self.dirty = False
+                self._refresh(now)
+            else:
+                return
+            self.settled_at = max(self.settled_at, now - self.settle)
+            self.refreshed_at = time.monotonic()
+
+    def covers(self, start_date: Any) -> bool:
+        """Whether a range starting at start_date lies entirely inside the store's window."""
+        start = to_datetime(start_date)
+        if start is None:
+            return False
+        window_start = self.window_start or datetime.now(timezone.utc) - self.window
+        return start >= window_start
+
+    # ---- queries -----------------------------------------------------
+
+    def _range(self, start_date: Any, end_date: Any) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Timestamps and codes of the rows in [start_date, end_date] (inclusive)."""
+        ts = self.timestamp.view()
+        lo = int(np.searchsorted(ts, to_micros(to_datetime(start_date)), side="left"))
+        hi = int(np.searchsorted(ts, to_micros(to_datetime(end_date)), side="right"))
+        return ts[lo:hi], {name: column.view()[lo:hi] for name, column in self.columns.items()}
+
+    def _lookup(self, column: str, predicate: Callable[[Optional[str]], bool]) -> np.ndarray:
+        """Boolean table indexed by code: predicate(value) for each dictionary value."""
+        return np.fromiter((predicate(v) for v in self.dictionaries[column].values), dtype=bool,
+                           count=len(self.dictionaries[column].values))
+
+    def _vehicles(self, start_date: Any, end_date: Any) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Like _range, without pedestrians (and NULL categories, like `category != 'pedestrian'`)."""
+        ts, codes = self._range(start_date, end_date)
+        keep = self._lookup("category", lambda v: v is not None and v != "pedestrian")[codes["category"]]
+        return ts[keep], {name: values[keep] for name, values in codes.items()}
+
+    def _count_by(self, column: str, codes: np.ndarray) -> Dict[Optional[str], int]:
+        values = self.dictionaries[column].values
+        counts = np.bincount(codes, minlength=len(values))
+        return {values[code]: int(counts[code]) for code in np.flatnonzero(counts)}
+
+    def category_counts(self, start_date: Any, end_date: Any,
+                        exclude_pedestrians: bool = True) -> Dict[Optional[str], int]:
+        self.sync()
+        with self.lock:
+            if exclude_pedestrians:
+                _, codes = self._vehicles(start_date, end_date)
+            else:
+                _, codes = self._range(start_date, end_date)
+            return self._count_by("category", codes["category"])
+
+    def enhanced_stats(self, start_date: Any, end_date: Any, bucket_seconds: int) -> Dict[str, Any]:
+        """
+        The `stats` object of /stats/enhanced-stats for [start_date, end_date],
+        with the timeline in epoch-aligned bins of bucket_seconds.
+        """
+        self.sync()
+        with self.lock:
+            ts, codes = self._vehicles(start_date, end_date)
+            gates = codes["gate"]
+            is_entry = self._lookup("direction", lambda v: v == "in")[codes["direction"]]
+            is_exit = self._lookup("direction", lambda v: v == "out")[codes["direction"]]
+            hours = (ts // US_PER_HOUR) % 24
+            days = ts // US_PER_DAY
+            dows = (days + 4) % 7  # 1970-01-01 was a Thursday; Sunday = 0 like EXTRACT(DOW)
+
+            category_counts = self._count_by("category", codes["category"])
+            hourly = np.bincount(hours, minlength=24)
+            hourly_trend = {int(h): int(hourly[h]) for h in np.flatnonzero(hourly)}
+
+            width = bucket_seconds * 1_000_000
+            stamps, activity = np.unique(ts - ts % width, return_counts=True)
+            timeline = [
+                {"time": datetime.fromtimestamp(int(us) // 1_000_000, timezone.utc).strftime(GMT_FORMAT),
+                 "activity": int(n)}
+                for us, n in zip(stamps, activity)
+            ]
+
+            categories = self.dictionaries["category"].values
+            entries = np.bincount(codes["category"], weights=is_entry, minlength=len(categories))
+            exits = np.bincount(codes["category"], weights=is_exit, minlength=len(categories))
+            entry_exit_by_category = {
+                categories[code]: {"entry": int(entries[code]), "exit": int(exits[code])}
+                for code in np.unique(codes["category"])
+            }
+
+            day_values, day_counts = np.unique(days, return_counts=True)
+            daily_trend = {
+                (datetime(1970, 1, 1) + timedelta(days=int(day))).strftime("%Y-%m-%d"): int(n)
+                for day, n in zip(day_values, day_counts)
+            }
+
+            cells = np.bincount(dows * 24 + hours, minlength=7 * 24)
+            heatmap_data = [
+                {"day_of_week": int(cell // 24), "hour": int(cell % 24), "count": int(cells[cell])}
+                for cell in np.flatnonzero(cells)
+            ]
+
+            return {
+                "entry_exit_counts": {"entry": int(is_entry.sum()), "exit": int(is_exit.sum())},
+                "zone_activity_timeline": timeline,
+                "total_events": int(len(ts)),
+                "busiest_hour": int(np.argmax(hourly)) if len(ts) else None,
+                "category_counts": category_counts,
+                "gate_usage": self._count_by("gate", gates),
+                "hourly_trend": hourly_trend,
+                "color_distribution": self._count_by("color", codes["color"]),
+                "zone_counts": self._count_by("zone", codes["zone"]),
+                "entry_exit_by_category": entry_exit_by_category,
+                "daily_trend": daily_trend,
+                "heatmap_data": heatmap_data,
+            }
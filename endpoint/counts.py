@@ -0,0 +1,240 @@
+# counts.py
+"""
+Record counts for the filter UI (/count).
+
+New rows are stamped with the current time, so an exact count for a filter
+set stays exact if it is remembered together with the point in time it
+covers, as long as no rows are taken away. RecordCounter caches, per filter
+set, the count of matching rows up to a "settled" time (COUNT_SETTLE_SECONDS
+in the past, so transactions still in flight cannot land behind it) and on
+every request only counts the rows after that point, which is a short range
+scan on parking_timestamp_idx.
+
+Rows do go away: retention detaches whole months and the archiver drops them
+(migrations 004 and 006, archive.py), and rows can be deleted. Both send a
+NOTIFY on parking_dimensions other than INSERT, and the cache is then
+cleared; for COUNT_SETTLE_SECONDS after that, counts are not cached, since a
+replica may not have replayed the change yet. While the NOTIFY listener is
+down the cache is not used, and it is cleared when the listener reconnects.
+
+The "all" and "export" scopes also count the matching rows of the Parquet
+archive, which /data and the exports append to the live rows; /data1, and
+with it the "entries" scope, covers the live rows only.
+
+When there is no cached count yet and the planner expects more than
+COUNT_EXACT_LIMIT rows, the planner's estimate is returned (flagged as such)
+and the exact count is computed in the background for the next request.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Mapping, Optional, Set, Tuple
+
+from psycopg2.extensions import connection as Connection  # type: ignore
+
+from archive import ParkingArchive
+from db import execute_prepared
+from dimensions import DimensionCache
+from filters import FILTER_KEYS, Where, compile_filters
+from stats import ENTRY_DIRECTION
+
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_SIZE: int = int(os.environ.get("COUNT_CACHE_SIZE", 512))
+COUNT_EXACT_LIMIT: int = int(os.environ.get("COUNT_EXACT_LIMIT", 1_000_000))
+COUNT_SETTLE_SECONDS: int = int(os.environ.get("COUNT_SETTLE_SECONDS", 60))
+
+# Rows counted by each scope, as fixed predicates.
+COUNT_SCOPES: Dict[str, Tuple[str, ...]] = {
+    "all": (),
+    "export": ("category != 'pedestrian'",),
+    "entries": (ENTRY_DIRECTION, "category != 'pedestrian'", "license_plate != '-'"),
+}
+
+# The relation each scope counts; only "all" includes the pedestrians, which
+# are stored apart from the vehicle rows (migration 006). Both are views with
+# the decoded color, gate and description the filters match (migration 007).
+COUNT_TABLES: Dict[str, str] = {"all": "parking_events", "export": "parking_vehicles", "entries": "parking_vehicles"}
+
+# Scopes that include the Parquet archive, with whether it is read without
+# the pedestrians.
+ARCHIVE_SCOPES: Dict[str, bool] = {"all": False, "export": True}
+
+# Rows of {table} matching {where}, in total and up to a settled time (the
+# first parameter).
+EXACT_COUNT_SQL = """
+    SELECT COUNT(*) FILTER (WHERE timestamp <= %s) AS settled, COUNT(*) AS total
+    FROM {table}
+    {where}
+"""
+
+
+def scope_where(scope: str, filters: Mapping[str, Any]) -> Where:
+    return compile_filters(filters, Where(*COUNT_SCOPES[scope]))
+
+
+class RecordCounter:
+    """
+    Exact, incrementally maintained counts per (scope, filters), with a
+    planner estimate as the fallback for large uncached counts.
+
+    Args:
+        connect: Factory returning a database connection (closed after use).
+        notifications: DimensionCache whose NOTIFY listener announces deletes
+            and detached partitions; without one the cache is never cleared.
+        archive: Parquet archive added to the ARCHIVE_SCOPES counts.
+    """
+
+    def __init__(self, connect: Callable[[], Connection],
+                 notifications: Optional[DimensionCache] = None,
+                 archive: Optional[ParkingArchive] = None,
+                 cache_size: int = COUNT_CACHE_SIZE,
+                 exact_limit: int = COUNT_EXACT_LIMIT,
+                 settle_seconds: int = COUNT_SETTLE_SECONDS) -> None:
+        self.connect = connect
+        self.notifications = notifications
+        self.archive = archive
+        self.cache_size = cache_size
+        self.exact_limit = exact_limit
+        self.settle = timedelta(seconds=settle_seconds)
+        # key -> (settled_at, count of matching rows with timestamp <= settled_at)
+        self.cache: "OrderedDict[str, Tuple[datetime, int]]" = OrderedDict()
+        # key -> (archived months, count of matching archived rows)
+        self.archived: "OrderedDict[str, Tuple[Tuple[str, ...], int]]" = OrderedDict()
+        self.generation = 0     # bumped whenever the cache is cleared
+        self.hold_until = 0.0   # no caching before this (time.monotonic())
+        self.pending: Set[str] = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="count")
+        if notifications is not None:
+            notifications.subscribe(self.on_notify)
+
+    def on_notify(self, payload: Optional[str]) -> None:
+        """
+        Callback for the parking_dimensions NOTIFY channel: anything but an
+        insert may have taken rows away. `None` means the listener
+        (re)connected and may have missed notifications.
+        """
+        if payload == "INSERT":
+            return
+        with self.lock:
+            self.cache.clear()
+            self.generation += 1
+            if payload is not None:
+                self.hold_until = time.monotonic() + self.settle.total_seconds()
+
+    @staticmethod
+    def cache_key(scope: str, filters: Mapping[str, Any]) -> str:
+        return json.dumps({"scope": scope, **{k: filters.get(k) or None for k in FILTER_KEYS}},
+                          sort_keys=True)
+
+    def _cached(self, key: str) -> Optional[Tuple[datetime, int]]:
+        if self.notifications is not None and not self.notifications.listening:
+            return None
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.cache.move_to_end(key)
+            return entry
+
+    def _store(self, key: str, settled_at: datetime, count: int, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation or time.monotonic() < self.hold_until:
+                return
+            current = self.cache.get(key)
+            if current is None or current[0] < settled_at:
+                self.cache[key] = (settled_at, count)
+                self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _exact(self, key: str, table: str, where: Where) -> int:
+        """Count exactly, reusing the cached count up to its settled time."""
+        generation = self.generation
+        cached = self._cached(key)
+        settled_at = datetime.now(timezone.utc) - self.settle
+        tail = where.copy()
+        if cached is not None:
+            tail.add("timestamp > %s", cached[0])
+        query = EXACT_COUNT_SQL.format(table=table, where=tail)
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                execute_prepared(cur, query, [settled_at] + tail.params)
+                row = cur.fetchone()
+        finally:
+            conn.close()
+        settled, total = (row["settled"], row["total"]) if isinstance(row, dict) else row
+        base = cached[1] if cached is not None else 0
+        if cached is None or settled_at > cached[0]:
+            self._store(key, settled_at, base + settled, generation)
+        return base + total
+
+    def _archived(self, key: str, scope: str, filters: Mapping[str, Any]) -> int:
+        """Matching rows in the Parquet archive, cached until its months change."""
+        if self.archive is None or scope not in ARCHIVE_SCOPES:
+            return 0
+        months = tuple(sorted(self.archive.manifest()))
+        if not months:
+            return 0
+        with self.lock:
+            entry = self.archived.get(key)
+        if entry is not None and entry[0] == months:
+            return entry[1]
+        count = self.archive.count(filters, exclude_pedestrians=ARCHIVE_SCOPES[scope])
+        with self.lock:
+            self.archived[key] = (months, count)
+            self.archived.move_to_end(key)
+            while len(self.archived) > self.cache_size:
+                self.archived.popitem(last=False)
+        return count
+
+    def _estimate(self, table: str, where: Where) -> int:
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {table} {where}", where.params)
+                plan = cur.fetchone()
+        finally:
+            conn.close()
+        plan = plan["QUERY PLAN"] if isinstance(plan, dict) else plan[0]
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def _fill(self, key: str, table: str, where: Where) -> None:
+        try:
+            self._exact(key, table, where)
+        except Exception as e:
+            logger.error(f"Background count failed: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+
+    def count(self, scope: str, filters: Mapping[str, Any]) -> Dict[str, Any]:
+        """
+        Count the rows in `scope` matching `filters`.
+
+        Returns:
+            {"count": n, "exact": bool, "source": "cache" | "query" | "estimate"}
+        """
+        key = self.cache_key(scope, filters)
+        table = COUNT_TABLES[scope]
+        where = scope_where(scope, filters)
+        archived = self._archived(key, scope, filters)
+        if self._cached(key) is not None:
+            return {"count": self._exact(key, table, where) + archived, "exact": True, "source": "cache"}
+
+        estimate = self._estimate(table, where)
+        if estimate <= self.exact_limit:
+            return {"count": self._exact(key, table, where) + archived, "exact": True, "source": "query"}
+
+        with self.lock:
+            start = key not in self.pending
+            self.pending.add(key)
+        if start:
+            self.executor.submit(self._fill, key, table, where)
+        return {"count": estimate + archived, "exact": False, "source": "estimate"}
@@ -0,0 +1,165 @@
+# db.py
+"""
+Pooled PostgreSQL connections with per-connection prepared statements.
+
+Connections are kept open between requests (up to DB_POOL_MAX), and close()
+hands a connection back to the pool instead of disconnecting, so existing
+`conn.close()` call sites keep working unchanged. Because a connection now
+outlives the request, statements PREPAREd on it can be reused:
+execute_prepared() prepares each distinct query text once per connection and
+afterwards only sends EXECUTE, skipping parse and (once Postgres settles on a
+generic plan) planning for hot queries.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from typing import Any, Callable, List, Mapping, Optional, Sequence, Set, Tuple, Union
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MAX: int = int(os.environ.get("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT: float = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+
+# Prepared statements kept per connection before they are all deallocated.
+DB_MAX_PREPARED: int = int(os.environ.get("DB_MAX_PREPARED", 256))
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """A connection that returns itself to its pool on close()."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.pool: Optional["ConnectionPool"] = None
+        self.prepared: Set[str] = set()
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.putconn(self)
+        else:
+            super().close()
+
+    def discard(self) -> None:
+        """Really disconnect, bypassing the pool."""
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe LIFO pool of PooledConnection objects.
+
+    Args:
+        connect: Opens a new connection; must pass connection_factory=PooledConnection.
+        maxconn: Most connections open (idle or in use) at any time.
+        timeout: Seconds getconn() waits for a free connection before raising PoolError.
+    """
+
+    def __init__(self, connect: Callable[[], PooledConnection], maxconn: int = DB_POOL_MAX,
+                 timeout: float = DB_POOL_TIMEOUT) -> None:
+        self.connect = connect
+        self.timeout = timeout
+        self._idle: List[PooledConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self) -> PooledConnection:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"no database connection available after {self.timeout}s")
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self.connect()
+            conn.pool = self
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn: PooledConnection) -> None:
+        """Reset a connection and make it available again; broken ones are dropped."""
+        conn.pool = None
+        try:
+            if not conn.closed:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = False
+                with self._lock:
+                    self._idle.append(conn)
+                return
+        except psycopg2.Error as e:
+            logger.warning(f"Dropping database connection that failed to reset: {e}")
+            conn.discard()
+        finally:
+            self._slots.release()
+
+    def closeall(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.discard()
+
+
+_PLACEHOLDER = re.compile(r"%([%s])")
+
+
+def to_numbered_placeholders(query: str) -> str:
+    """Turn psycopg2 `%s` placeholders into PREPARE's `$1, $2, ...` (and `%%` into `%`)."""
+    counter = iter(range(1, 1 << 16))
+    return _PLACEHOLDER.sub(lambda m: "%" if m.group(1) == "%" else f"${next(counter)}", query)
+
+
+_NAMED_PLACEHOLDER = re.compile(r"%%|%\((\w+)\)s")
+
+
+def to_asyncpg(query: str, params: Union[Sequence[Any], Mapping[str, Any]] = ()) -> Tuple[str, List[Any]]:
+    """
+    Turn a psycopg2 query (positional `%s` or named `%(name)s` parameters)
+    into asyncpg's `$n` form and its argument list.
+    """
+    if not isinstance(params, Mapping):
+        return to_numbered_placeholders(query), list(params)
+    names: List[str] = []
+
+    def number(match: "re.Match[str]") -> str:
+        name = match.group(1)
+        if name is None:
+            return "%"
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return _NAMED_PLACEHOLDER.sub(number, query), [params[name] for name in names]
+
+
+def execute_prepared(cur: Any, query: str, params: Sequence[Any] = ()) -> None:
+    """
+    Execute a query with positional `%s` parameters through a prepared statement.
+
+    The statement is named after a hash of the query text and PREPAREd the
+    first time the connection sees it. Prepared statements survive rollbacks
+    and live as long as the connection; connections that do not come from the
+    pool fall back to a plain execute.
+    """
+    conn = cur.connection
+    prepared: Optional[Set[str]] = getattr(conn, "prepared", None)
+    if prepared is None:
+        cur.execute(query, params)
+        return
+    name = "stmt_" + hashlib.sha1(query.encode()).hexdigest()[:20]
+    if name not in prepared:
+        if len(prepared) >= DB_MAX_PREPARED:
+            cur.execute("DEALLOCATE ALL")
+            prepared.clear()
+        cur.execute(f"PREPARE {name} AS {to_numbered_placeholders(query)}")
+        prepared.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
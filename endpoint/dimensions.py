@@ -0,0 +1,163 @@
+# dimensions.py
+"""
+Cached filter options (distinct categories, colors and gates) for /filters/*.
+
+The values and their row counts live in parking_dimension_counts, which
+triggers on `parking` keep up to date (migration 003), so loading them costs
+O(distinct values) no matter how large `parking` grows. DimensionCache keeps
+the last load in memory and drops it when the triggers send
+NOTIFY parking_dimensions; a background thread LISTENs on its own connection.
+If that connection is down, the copy expires after DIMENSION_CACHE_TTL seconds
+instead.
+"""
+import hashlib
+import json
+import logging
+import os
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from psycopg2.extensions import connection as Connection  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ("category", "color", "gate")
+NOTIFY_CHANNEL = "parking_dimensions"
+DIMENSION_CACHE_TTL: float = float(os.environ.get("DIMENSION_CACHE_TTL", 60))
+
+LOAD_SQL = """
+    SELECT dimension, value, count
+    FROM parking_dimension_counts
+    WHERE count > 0
+    ORDER BY dimension, value
+"""
+
+
+class Dimension:
+    """One dimension's values (sorted) and counts, with ETags for both views."""
+
+    def __init__(self, counts: Dict[str, int]) -> None:
+        self.counts = counts
+        self.values: List[str] = list(counts)
+        self.values_etag = _digest(self.values)
+        self.counts_etag = _digest(counts)
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value).encode()).hexdigest()
+
+
+class DimensionCache:
+    """
+    In-process copy of parking_dimension_counts, invalidated by NOTIFY.
+
+    Args:
+        connect: Factory returning a pooled connection for loading.
+        listen_connect: Factory returning a dedicated connection for LISTEN;
+            without one the cache relies on the TTL alone.
+    """
+
+    def __init__(self, connect: Callable[[], Connection],
+                 listen_connect: Optional[Callable[[], Connection]] = None,
+                 ttl: float = DIMENSION_CACHE_TTL) -> None:
+        self.connect = connect
+        self.listen_connect = listen_connect
+        self.ttl = ttl
+        self.dimensions: Optional[Dict[str, Dimension]] = None
+        self.generation = 0
+        self.loaded_at = 0.0
+        self.listening = False
+        self.lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self._subscribers: List[Callable[[Optional[str]], None]] = []
+
+    def invalidate(self, payload: Optional[str] = None) -> None:
+        """
+        Drop the cached copy and pass the notification on to subscribers
+        (payload None: the listener reconnected and may have missed some).
+        """
+        self.generation += 1
+        self.dimensions = None
+        for callback in self._subscribers:
+            callback(payload)
+
+    def subscribe(self, callback: Callable[[Optional[str]], None]) -> None:
+        """Also deliver every parking_dimensions notification to callback; starts the listener."""
+        self._subscribers.append(callback)
+        self._start_listener()
+
+    def get(self, dimension: str) -> Dimension:
+        self._start_listener()
+        dimensions = self.dimensions
+        if dimensions is None or (not self.listening and time.monotonic() - self.loaded_at > self.ttl):
+            with self.lock:
+                dimensions = self.dimensions
+                if dimensions is None or (not self.listening
+                                          and time.monotonic() - self.loaded_at > self.ttl):
+                    dimensions = self._load()
+        return dimensions[dimension]
+
+    def _load(self) -> Dict[str, Dimension]:
+        generation = self.generation
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(LOAD_SQL)
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+        counts: Dict[str, Dict[str, int]] = {name: {} for name in DIMENSIONS}
+        for row in rows:
+            if isinstance(row, dict):
+                name, value, count = row["dimension"], row["value"], row["count"]
+            else:
+                name, value, count = row
+            if name in counts:
+                counts[name][value] = count
+        dimensions = {name: Dimension(values) for name, values in counts.items()}
+        # Only keep the load if no NOTIFY arrived while it ran.
+        if generation == self.generation:
+            self.dimensions = dimensions
+            self.loaded_at = time.monotonic()
+        return dimensions
+
+    # ---- NOTIFY listener ---------------------------------------------
+
+    def _start_listener(self) -> None:
+        if self.listen_connect is None or self._listener is not None:
+            return
+        with self.lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="dimension-listener",
+                                                  daemon=True)
+                self._listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            conn = None
+            try:
+                conn = self.listen_connect()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Anything loaded before LISTEN took effect may be stale.
+                self.invalidate()
+                self.listening = True
+                while True:
+                    if select.select([conn], [], [], 60)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self.invalidate(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"Filter option listener stopped, retrying in 10s: {e}")
+            finally:
+                self.listening = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(10)
+
@@ -0,0 +1,434 @@
+# export_jobs.py
+"""
+Background export jobs.
+
+Exports are queued with POST /exports and written to EXPORT_DIR by a small
+thread pool, so large exports no longer hold a request worker for their whole
+duration. Each job pins its data to a watermark (the newest timestamp in
+`parking` when the job was submitted); jobs with identical filters, format and
+watermark share one artifact. Finished artifacts expire after EXPORT_TTL_SECONDS
+and the least recently downloaded are evicted whenever the directory exceeds
+EXPORT_QUOTA_BYTES.
+
+Job records are rewritten on every state change (and as progress is made), so
+when the service runs as several worker processes any of them can report on a
+job another one is running. Expiry works from those records too: every
+EXPORT_SWEEP_INTERVAL seconds, and after each job, a worker takes a file lock
+on EXPORT_DIR and applies the TTL and quota to every worker's artifacts.
+"""
+import fcntl
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from psycopg2.extensions import connection as Connection  # type: ignore
+
+from archive import ParkingArchive
+from exporters import EXPORT_FILTER_KEYS, EXPORT_WRITERS, build_export_query, iter_query_rows
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR: str = os.environ.get("EXPORT_DIR", os.path.join(os.path.dirname(__file__), "exports"))
+EXPORT_WORKERS: int = int(os.environ.get("EXPORT_WORKERS", 2))
+EXPORT_QUOTA_BYTES: int = int(os.environ.get("EXPORT_QUOTA_BYTES", 2 * 1024 ** 3))
+EXPORT_TTL_SECONDS: int = int(os.environ.get("EXPORT_TTL_SECONDS", 24 * 3600))
+EXPORT_SWEEP_INTERVAL: int = int(os.environ.get("EXPORT_SWEEP_INTERVAL", 600))  # 0 = only after jobs
+
+# Held (flock) while a worker applies the TTL and quota to EXPORT_DIR.
+SWEEP_LOCK = ".sweep.lock"
+
+# How often (in rows) a running job publishes its progress.
+PROGRESS_EVERY: int = 5000
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+WATERMARK_SQL = "SELECT MAX(timestamp) AS watermark FROM parking"
+
+
+class ExportJob:
+    """State of a single export job; persisted as <id>.json next to the artifact."""
+
+    def __init__(self, job_id: str, key: str, file_format: str,
+                 filters: Dict[str, Optional[str]], watermark: Optional[str]) -> None:
+        self.id = job_id
+        self.key = key
+        self.file_format = file_format
+        self.filters = filters
+        self.watermark = watermark
+        self.status = QUEUED
+        self.rows_written = 0
+        self.estimated_rows: Optional[int] = None
+        self.size_bytes = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.last_access = self.created_at
+        self.pid: Optional[int] = None  # of the worker that last saved the record
+
+    @property
+    def file_name(self) -> str:
+        return f"{self.id}.{self.file_format}"
+
+    def progress(self) -> float:
+        """Fraction complete, based on the planner's row estimate while running."""
+        if self.status == DONE:
+            return 1.0
+        if not self.estimated_rows:
+            return 0.0
+        return min(self.rows_written / self.estimated_rows, 0.99)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "format": self.file_format,
+            "filters": self.filters,
+            "watermark": self.watermark,
+            "rows_written": self.rows_written,
+            "estimated_rows": self.estimated_rows,
+            "progress": round(self.progress(), 4),
+            "size_bytes": self.size_bytes,
+            "error": self.error,
+            "created_at": datetime.utcfromtimestamp(self.created_at).isoformat() + "Z",
+            "finished_at": (datetime.utcfromtimestamp(self.finished_at).isoformat() + "Z"
+                            if self.finished_at else None),
+        }
+
+    def to_record(self) -> Dict[str, Any]:
+        record = self.to_dict()
+        record.update({
+            "key": self.key,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "last_access": self.last_access,
+            "pid": os.getpid(),
+        })
+        return record
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "ExportJob":
+        job = cls(record["id"], record["key"], record["format"], record["filters"], record["watermark"])
+        job.status = record["status"]
+        job.rows_written = record.get("rows_written", 0)
+        job.estimated_rows = record.get("estimated_rows")
+        job.size_bytes = record.get("size_bytes", 0)
+        job.created_at = record["created_at"]
+        job.finished_at = record.get("finished_at")
+        job.last_access = record.get("last_access", job.created_at)
+        job.error = record.get("error")
+        job.pid = record.get("pid")
+        return job
+
+
+def job_key(file_format: str, filters: Dict[str, Optional[str]], watermark: Optional[str]) -> str:
+    """Cache key identifying the artifact for a filter set at a data watermark."""
+    canonical = json.dumps(
+        {"format": file_format, "filters": {k: filters.get(k) or None for k in EXPORT_FILTER_KEYS},
+         "watermark": watermark},
+        sort_keys=True
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ExportJobManager:
+    """
+    Queue, run, track and expire export jobs.
+
+    Args:
+        connect: Factory returning a new database connection.
+        export_dir: Directory that holds the artifacts and job records.
+        archive: Parquet archive whose rows follow the live ones when the
+            filters reach past the live data.
+        sweep_interval: Seconds between expiry passes in the background
+            (0 = only after each job).
+    """
+
+    def __init__(self, connect: Callable[[], Connection], export_dir: str = EXPORT_DIR,
+                 workers: int = EXPORT_WORKERS, quota_bytes: int = EXPORT_QUOTA_BYTES,
+                 ttl_seconds: int = EXPORT_TTL_SECONDS,
+                 archive: Optional[ParkingArchive] = None,
+                 sweep_interval: int = EXPORT_SWEEP_INTERVAL) -> None:
+        self.connect = connect
+        self.archive = archive
+        self.export_dir = export_dir
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.jobs: Dict[str, ExportJob] = {}
+        self.by_key: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        os.makedirs(export_dir, exist_ok=True)
+        self._load_records()
+        if sweep_interval > 0:
+            threading.Thread(target=self._sweep_loop, args=(sweep_interval,),
+                             name="export-sweep", daemon=True).start()
+
+    # ---- persistence -------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.export_dir, name)
+
+    def _save_record(self, job: ExportJob) -> None:
+        tmp = self._path(f"{job.id}.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(job.to_record(), f)
+        os.replace(tmp, self._path(f"{job.id}.json"))
+
+    def _read_record(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable export job record {name}: {e}")
+            return None
+
+    def _load_records(self) -> None:
+        """
+        Pick up finished jobs left by a previous process; drop the records and
+        partial artifacts of jobs whose process is gone.
+        """
+        for name in os.listdir(self.export_dir):
+            if name.endswith(".tmp") and time.time() - os.path.getmtime(self._path(name)) > 60:
+                os.remove(self._path(name))
+            if not name.endswith(".json"):
+                continue
+            record = self._read_record(name)
+            if record is None:
+                continue
+            try:
+                job = ExportJob.from_record(record)
+            except KeyError as e:
+                logger.warning(f"Ignoring export job record {name} without {e}")
+                continue
+            if job.status == DONE and os.path.exists(self._path(job.file_name)):
+                self.jobs[job.id] = job
+                self.by_key[job.key] = job.id
+            elif not _alive(record.get("pid")):
+                for stale in (name, job.file_name + ".part"):
+                    try:
+                        os.remove(self._path(stale))
+                    except FileNotFoundError:
+                        pass
+
+    # ---- public API --------------------------------------------------
+
+    def current_watermark(self) -> Optional[str]:
+        """Newest timestamp in parking; rows are only ever appended with the current time."""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(WATERMARK_SQL)
+                row = cur.fetchone()
+        finally:
+            conn.close()
+        value = row["watermark"] if isinstance(row, dict) else row[0]
+        return value.isoformat() if value else None
+
+    def submit(self, file_format: str, filters: Dict[str, Optional[str]]) -> ExportJob:
+        """
+        Queue an export, or return the existing job for the same filters,
+        format and data watermark.
+        """
+        filters = {k: filters.get(k) or None for k in EXPORT_FILTER_KEYS}
+        watermark = self.current_watermark()
+        key = job_key(file_format, filters, watermark)
+        with self.lock:
+            existing = self.jobs.get(self.by_key.get(key, ""))
+            if existing and existing.status == DONE and not os.path.exists(self._path(existing.file_name)):
+                self._forget(existing)  # evicted by another worker
+                existing = None
+            if existing and existing.status != FAILED:
+                existing.last_access = time.time()
+                if existing.status == DONE:
+                    self._save_record(existing)
+                return existing
+            job = ExportJob(uuid.uuid4().hex, key, file_format, filters, watermark)
+            self.jobs[job.id] = job
+            self.by_key[key] = job.id
+        self._save_record(job)
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        """
+        A job of this process, or the latest record of one run by another
+        worker. A finished job whose artifact has expired (in any worker) is gone.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            if not job_id.isalnum():
+                return None
+            record = self._read_record(f"{job_id}.json")
+            if record is None:
+                return None
+            job = ExportJob.from_record(record)
+        if job.status == DONE and not os.path.exists(self._path(job.file_name)):
+            with self.lock:
+                self._forget(job)
+            return None
+        if job.status == DONE:
+            with self.lock:
+                self.jobs[job.id] = job
+                self.by_key.setdefault(job.key, job.id)
+        return job
+
+    def artifact_path(self, job: ExportJob) -> str:
+        """Path of a finished job's artifact; records the download for the quota's LRU order."""
+        job.last_access = time.time()
+        path = self._path(job.file_name)
+        if os.path.exists(path):
+            self._save_record(job)
+        return path
+
+    # ---- worker ------------------------------------------------------
+
+    def _track(self, job: ExportJob, rows: Iterable[Sequence[Any]]) -> Iterator[Sequence[Any]]:
+        for row in rows:
+            yield row
+            job.rows_written += 1
+            if job.rows_written % PROGRESS_EVERY == 0:
+                self._save_record(job)
+                logger.debug(f"Export {job.id}: {job.rows_written} rows written")
+
+    def _run(self, job: ExportJob) -> None:
+        job.status = RUNNING
+        watermark = datetime.fromisoformat(job.watermark) if job.watermark else None
+        query, params = build_export_query(job.filters, watermark)
+        part = self._path(job.file_name + ".part")
+        try:
+            conn = self.connect()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                    plan = cur.fetchone()
+                    plan = plan["QUERY PLAN"] if isinstance(plan, dict) else plan[0]
+                    job.estimated_rows = int(plan[0]["Plan"]["Plan Rows"])
+                self._save_record(job)
+                rows: Iterable[Sequence[Any]] = iter_query_rows(conn, query, params)
+                if self.archive is not None and self.archive.reaches(job.filters.get("start_date")):
+                    rows = itertools.chain(rows, self.archive.iter_rows(job.filters, exclude_pedestrians=True))
+                EXPORT_WRITERS[job.file_format](self._track(job, rows), part)
+            finally:
+                conn.close()
+            os.replace(part, self._path(job.file_name))
+            job.size_bytes = os.path.getsize(self._path(job.file_name))
+            job.status = DONE
+            job.finished_at = time.time()
+            self._save_record(job)
+            logger.info(f"Export {job.id} finished: {job.rows_written} rows, {job.size_bytes} bytes")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            job.finished_at = time.time()
+            logger.error(f"Export {job.id} failed: {e}")
+            if os.path.exists(part):
+                os.remove(part)
+            self._save_record(job)
+        self.enforce_quota()
+
+    # ---- expiry ------------------------------------------------------
+
+    def _forget(self, job: ExportJob) -> None:
+        """Drop a job from this process's maps. Caller holds the lock."""
+        self.jobs.pop(job.id, None)
+        if self.by_key.get(job.key) == job.id:
+            del self.by_key[job.key]
+
+    def _remove(self, job: ExportJob) -> None:
+        """Forget a job and delete its files. Caller holds the lock."""
+        self._forget(job)
+        for name in (job.file_name, job.file_name + ".part", f"{job.id}.json"):
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _sweep_lock(self) -> Iterator[None]:
+        """Exclusive across the worker processes sharing export_dir."""
+        with open(self._path(SWEEP_LOCK), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _records(self) -> List[ExportJob]:
+        """Every job recorded in export_dir, whichever worker ran it."""
+        jobs = []
+        for name in os.listdir(self.export_dir):
+            record = self._read_record(name) if name.endswith(".json") else None
+            if record is None:
+                continue
+            try:
+                job = ExportJob.from_record(record)
+            except KeyError:
+                continue
+            jobs.append(job)
+        return jobs
+
+    def enforce_quota(self) -> None:
+        """
+        Drop expired or failed jobs, and those a dead worker left unfinished,
+        then evict least recently used artifacts over quota. Works from the
+        records in export_dir, so it covers the jobs of every worker.
+        """
+        now = time.time()
+        with self.lock, self._sweep_lock():
+            finished: List[ExportJob] = []
+            for job in self._records():
+                if job.status in (QUEUED, RUNNING):
+                    # Left by a worker that is gone (or by an earlier process with this pid).
+                    if job.id not in self.jobs and not _alive(job.pid):
+                        self._remove(job)
+                elif job.status == FAILED:
+                    if now - (job.finished_at or now) > self.ttl_seconds:
+                        self._remove(job)
+                elif (now - (job.finished_at or now) > self.ttl_seconds
+                      or not os.path.exists(self._path(job.file_name))):
+                    self._remove(job)
+                else:
+                    finished.append(job)
+
+            total = sum(job.size_bytes for job in finished)
+            for job in sorted(finished, key=lambda j: j.last_access):
+                if total <= self.quota_bytes:
+                    break
+                total -= job.size_bytes
+                logger.info(f"Evicting export {job.id} ({job.size_bytes} bytes) to stay under quota")
+                self._remove(job)
+
+    def _sweep_loop(self, interval: int) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.enforce_quota()
+            except Exception as e:
+                logger.error(f"Export expiry failed: {e}")
+
+
+def _alive(pid: Optional[int]) -> bool:
+    """Whether another process with this pid is running."""
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
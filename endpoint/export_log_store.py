@@ -0,0 +1,181 @@
+# export_log_store.py
+"""
+Export history kept in an embedded SQLite database (WAL mode).
+
+Every /log-export call is a single INSERT, so concurrent requests cannot lose
+entries and the history is never rewritten as a whole. Old entries are pruned
+by count (EXPORT_LOG_RETENTION) and optionally by age
+(EXPORT_LOG_RETENTION_DAYS). The legacy export_logs.json file is imported the
+first time the database is created.
+"""
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXPORT_LOG_DB: str = os.environ.get(
+    "EXPORT_LOG_DB", os.path.join(os.path.dirname(__file__), "export_logs.db")
+)
+EXPORT_LOG_RETENTION: int = int(os.environ.get("EXPORT_LOG_RETENTION", 1000))
+EXPORT_LOG_RETENTION_DAYS: int = int(os.environ.get("EXPORT_LOG_RETENTION_DAYS", 0))  # 0 = no age limit
+
+LEGACY_LOG_FILE: str = os.path.join(os.path.dirname(__file__), "export_logs.json")
+
+# Entry fields as exposed by the API, mapped to their column names.
+FIELDS: Dict[str, str] = {
+    "id": "id",
+    "fileName": "file_name",
+    "format": "format",
+    "jobId": "job_id",
+    "exportType": "export_type",
+    "filters": "filters",
+    "recordCount": "record_count",
+    "user": "user",
+    "timestamp": "timestamp",
+}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS export_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_name TEXT,
+        format TEXT,
+        job_id TEXT,
+        export_type TEXT,
+        filters TEXT,
+        record_count INTEGER,
+        user TEXT,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS export_logs_timestamp_idx ON export_logs (timestamp);
+    CREATE INDEX IF NOT EXISTS export_logs_user_idx ON export_logs (user, id);
+"""
+
+
+class ExportLogStore:
+    """
+    Append-only export history with retention and filtered paging.
+
+    A new SQLite connection is opened per call, so the store can be shared by
+    every request thread (and by several processes using the same file).
+    """
+
+    def __init__(self, path: str = EXPORT_LOG_DB, retention: int = EXPORT_LOG_RETENTION,
+                 retention_days: int = EXPORT_LOG_RETENTION_DAYS) -> None:
+        self.path = path
+        self.retention = retention
+        self.retention_days = retention_days
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            empty = conn.execute("SELECT NOT EXISTS (SELECT 1 FROM export_logs)").fetchone()[0]
+        if empty:
+            self._import_legacy(LEGACY_LOG_FILE)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection, commit on success (roll back on error) and close it."""
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _import_legacy(self, json_path: str) -> None:
+        """Copy entries from the old export_logs.json file, oldest first."""
+        try:
+            with open(json_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for entry in entries:
+            self.append(entry)
+        logger.info(f"Imported {len(entries)} export log entries from {json_path}")
+
+    @staticmethod
+    def _to_entry(row: sqlite3.Row) -> Dict[str, Any]:
+        entry = {field: row[column] for field, column in FIELDS.items()}
+        entry["filters"] = json.loads(entry["filters"]) if entry["filters"] else None
+        return entry
+
+    def append(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Record an export and apply retention.
+
+        Returns:
+            The stored entry, including its assigned id.
+        """
+        values = {
+            "file_name": data.get("fileName"),
+            "format": data.get("format"),
+            "job_id": data.get("jobId"),
+            "export_type": data.get("exportType"),
+            "filters": json.dumps(data.get("filters")) if data.get("filters") is not None else None,
+            "record_count": data.get("recordCount"),
+            "user": data.get("user"),
+            "timestamp": data.get("timestamp") or datetime.utcnow().isoformat(),
+        }
+        columns = ", ".join(values)
+        placeholders = ", ".join(f":{name}" for name in values)
+        with self._connect() as conn:
+            cur = conn.execute(f"INSERT INTO export_logs ({columns}) VALUES ({placeholders})", values)
+            row = conn.execute("SELECT * FROM export_logs WHERE id = ?", (cur.lastrowid,)).fetchone()
+            self._apply_retention(conn)
+        return self._to_entry(row)
+
+    def _apply_retention(self, conn: sqlite3.Connection) -> None:
+        if self.retention > 0:
+            conn.execute(
+                "DELETE FROM export_logs WHERE id <= "
+                "(SELECT id FROM export_logs ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.retention,)
+            )
+        if self.retention_days > 0:
+            cutoff = (datetime.utcnow() - timedelta(days=self.retention_days)).isoformat()
+            conn.execute("DELETE FROM export_logs WHERE timestamp < ?", (cutoff,))
+
+    def get(self, log_id: int) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM export_logs WHERE id = ?", (log_id,)).fetchone()
+        return self._to_entry(row) if row else None
+
+    def query(self, user: Optional[str] = None, file_format: Optional[str] = None,
+              export_type: Optional[str] = None, since: Optional[str] = None,
+              until: Optional[str] = None, page: int = 1,
+              page_size: int = 10) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Return one page of entries (newest first) matching the filters.
+
+        `since` and `until` are ISO-8601 timestamps compared against the entry timestamp.
+
+        Returns:
+            The page of entries and the total number of matching entries.
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        for column, value in (("user", user), ("format", file_format), ("export_type", export_type)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp <= ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM export_logs {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM export_logs {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [page_size, (page - 1) * page_size]
+            ).fetchall()
+        return [self._to_entry(row) for row in rows], total
@@ -0,0 +1,325 @@
+# exporters.py
+"""
+File writers used by the /export endpoint.
+
+Every writer consumes an iterable of row tuples (in EXPORT_FIELDNAMES order)
+and writes the result to a file path, so rows can be streamed straight from
+a server-side cursor without materialising the whole result set in memory.
+"""
+import csv
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from psycopg2.extensions import connection as Connection  # type: ignore
+from psycopg2.extensions import cursor as TupleCursor  # type: ignore
+
+from filters import FILTER_KEYS, Where, compile_filters
+
+# Column order used by every export format.
+EXPORT_FIELDNAMES = [
+    "timestamp", "license_plate", "category", "color",
+    "gate", "zone", "description", "insertion_id"
+]
+
+# Query parameters accepted as export filters.
+EXPORT_FILTER_KEYS = FILTER_KEYS
+
+# Excel's hard limit on rows per worksheet (header row included).
+XLSX_MAX_ROWS: int = 1_048_576
+
+# Rows fetched per round-trip from the server-side cursor.
+EXPORT_FETCH_SIZE: int = int(os.environ.get("EXPORT_FETCH_SIZE", 10000))
+
+# Directory for temporary export files; defaults to the system temp dir.
+EXPORT_TMP_DIR: Optional[str] = os.environ.get("EXPORT_TMP_DIR") or None
+
+# Rows per Arrow record batch / Parquet row group.
+ARROW_BATCH_SIZE: int = int(os.environ.get("ARROW_BATCH_SIZE", 100000))
+
+# Columns stored dictionary-encoded in the Arrow and Parquet exports.
+DICTIONARY_COLUMNS = ("category", "color", "gate", "zone", "description")
+
+
+def build_export_query(filters: Dict[str, Optional[str]],
+                       watermark: Optional[datetime] = None) -> Tuple[str, Tuple[Any, ...]]:
+    """
+    Build the export SQL (pedestrians excluded) for the given filters.
+
+    Args:
+        filters: Values for EXPORT_FILTER_KEYS; missing or None values are ignored.
+        watermark: Optional upper bound on timestamp, used to pin an export to a
+            point in the data so that it can be reproduced.
+
+    Returns:
+        The query text and its parameters tuple.
+    """
+    where = compile_filters(filters, Where("category != 'pedestrian'"))
+    if watermark is not None:
+        where.add("timestamp <= %s", watermark)
+
+    query: str = f"""
+        SELECT {", ".join(EXPORT_FIELDNAMES)}
+        FROM parking_vehicles
+        {where}
+        ORDER BY timestamp DESC
+    """
+    return query, tuple(where.params)
+
+
+def iter_query_rows(conn: Connection, query: str, params: Sequence[Any],
+                    fetch_size: int = EXPORT_FETCH_SIZE) -> Iterator[tuple]:
+    """
+    Stream the rows of a query as plain tuples using a named (server-side) cursor.
+
+    Only `fetch_size` rows are held on the client at any time. The cursor is
+    closed once the generator is exhausted or closed.
+    """
+    cur = conn.cursor(name="export_cursor", cursor_factory=TupleCursor)
+    cur.itersize = fetch_size
+    try:
+        cur.execute(query, params)
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
+
+
+def _excel_datetime(value: datetime) -> datetime:
+    """Excel has no timezone support: store aware datetimes as naive UTC."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def write_csv(rows: Iterable[Sequence[Any]], path: str,
+              fieldnames: Sequence[str] = EXPORT_FIELDNAMES) -> int:
+    """
+    Write rows to a CSV file.
+
+    Returns:
+        The number of data rows written.
+    """
+    count = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_xlsx(rows: Iterable[Sequence[Any]], path: str,
+               fieldnames: Sequence[str] = EXPORT_FIELDNAMES,
+               sheet_title: str = "Parking Data",
+               max_rows: int = XLSX_MAX_ROWS) -> int:
+    """
+    Write rows to an XLSX file using an openpyxl write-only workbook.
+
+    Datetimes are written as native Excel date cells. When a sheet reaches
+    `max_rows` (header included) a new sheet is started, named
+    "<sheet_title> (2)", "<sheet_title> (3)", ...
+
+    Returns:
+        The number of data rows written.
+    """
+    from openpyxl import Workbook
+
+    datetime_columns = [i for i, name in enumerate(fieldnames) if name == "timestamp"]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+    ws.append(list(fieldnames))
+    sheet_rows = 1
+    sheet_number = 1
+    count = 0
+
+    for row in rows:
+        if sheet_rows >= max_rows:
+            sheet_number += 1
+            ws = wb.create_sheet(title=f"{sheet_title} ({sheet_number})")
+            ws.append(list(fieldnames))
+            sheet_rows = 1
+
+        row = list(row)
+        for i in datetime_columns:
+            value = row[i]
+            if isinstance(value, datetime):
+                row[i] = _excel_datetime(value)
+        ws.append(row)
+        sheet_rows += 1
+        count += 1
+
+    wb.save(path)
+    return count
+
+
+def _parse_int(value: Any) -> Optional[int]:
+    """Convert a text ID to an int; non-numeric placeholders such as 'N/A' become None."""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _DictionaryEncoder:
+    """
+    Incremental string dictionary shared by all batches of one export.
+
+    The dictionary only ever grows, so consecutive batches can be written as
+    dictionary deltas, which the Arrow IPC file format requires.
+    """
+
+    def __init__(self) -> None:
+        self.index: Dict[Any, int] = {}
+        self.values: List[Any] = []
+
+    def encode(self, column: Sequence[Any]) -> Any:
+        import pyarrow as pa
+
+        index = self.index
+        indices: List[Optional[int]] = []
+        for value in column:
+            if value is None:
+                indices.append(None)
+                continue
+            i = index.get(value)
+            if i is None:
+                i = index[value] = len(self.values)
+                self.values.append(value)
+            indices.append(i)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, type=pa.int32()),
+            pa.array(self.values, type=pa.string())
+        )
+
+
+def arrow_schema(fieldnames: Sequence[str] = EXPORT_FIELDNAMES) -> Any:
+    """Typed Arrow schema for the exported columns."""
+    import pyarrow as pa
+
+    types = {
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "license_plate": pa.string(),
+        "insertion_id": pa.int64(),
+    }
+    dictionary_type = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        pa.field(name, dictionary_type if name in DICTIONARY_COLUMNS else types.get(name, pa.string()))
+        for name in fieldnames
+    ])
+
+
+def iter_record_batches(rows: Iterable[Sequence[Any]],
+                        fieldnames: Sequence[str] = EXPORT_FIELDNAMES,
+                        batch_size: int = ARROW_BATCH_SIZE) -> Iterator[Any]:
+    """
+    Group row tuples into typed Arrow record batches of `batch_size` rows.
+    """
+    import pyarrow as pa
+
+    schema = arrow_schema(fieldnames)
+    encoders = {name: _DictionaryEncoder() for name in fieldnames if name in DICTIONARY_COLUMNS}
+
+    def to_batch(chunk: List[Sequence[Any]]) -> Any:
+        arrays = []
+        for name, column in zip(fieldnames, zip(*chunk)):
+            if name in encoders:
+                arrays.append(encoders[name].encode(column))
+            elif name == "insertion_id":
+                arrays.append(pa.array([_parse_int(v) for v in column], type=pa.int64()))
+            else:
+                arrays.append(pa.array(column, type=schema.field(name).type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    chunk: List[Sequence[Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= batch_size:
+            yield to_batch(chunk)
+            chunk = []
+    if chunk:
+        yield to_batch(chunk)
+
+
+def write_parquet(rows: Iterable[Sequence[Any]], path: str,
+                  fieldnames: Sequence[str] = EXPORT_FIELDNAMES,
+                  batch_size: int = ARROW_BATCH_SIZE) -> int:
+    """
+    Write rows to a Parquet file, one row group per record batch.
+
+    Column statistics are written for every row group, so readers can skip
+    row groups by timestamp range.
+
+    Returns:
+        The number of data rows written.
+    """
+    import pyarrow.parquet as pq
+
+    count = 0
+    with pq.ParquetWriter(path, arrow_schema(fieldnames), compression="zstd",
+                          write_statistics=True) as writer:
+        for batch in iter_record_batches(rows, fieldnames, batch_size):
+            writer.write_batch(batch, row_group_size=batch_size)
+            count += batch.num_rows
+    return count
+
+
+def write_arrow(rows: Iterable[Sequence[Any]], path: str,
+                fieldnames: Sequence[str] = EXPORT_FIELDNAMES,
+                batch_size: int = ARROW_BATCH_SIZE) -> int:
+    """
+    Write rows to an Arrow IPC file (Feather v2), readable with pyarrow.ipc
+    or pandas.read_feather.
+
+    Returns:
+        The number of data rows written.
+    """
+    import pyarrow as pa
+
+    count = 0
+    options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, arrow_schema(fieldnames), options=options) as writer:
+            for batch in iter_record_batches(rows, fieldnames, batch_size):
+                writer.write_batch(batch)
+                count += batch.num_rows
+    return count
+
+
+# Registry of supported export formats.
+EXPORT_WRITERS: Dict[str, Callable[..., int]] = {
+    "csv": write_csv,
+    "xlsx": write_xlsx,
+    "parquet": write_parquet,
+    "arrow": write_arrow,
+}
+
+EXPORT_MIMETYPES: Dict[str, str] = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+def export_to_tempfile(file_format: str, rows: Iterable[Sequence[Any]]) -> str:
+    """
+    Write rows in the given format to a new temporary file.
+
+    The caller owns the returned path and must remove it when done.
+    """
+    writer = EXPORT_WRITERS[file_format]
+    fd, path = tempfile.mkstemp(prefix="parking_export_", suffix=f".{file_format}",
+                                dir=EXPORT_TMP_DIR)
+    os.close(fd)
+    try:
+        writer(rows, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
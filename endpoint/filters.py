@@ -0,0 +1,120 @@
+# filters.py
+"""
+Filter compiler shared by /data, /data1 and /export.
+
+Request arguments are turned into a parameterized WHERE clause that contains
+only the predicates that actually apply. Unused filters are left out of the SQL
+entirely instead of being written as `%s IS NULL OR ...`, so each remaining
+predicate is a plain comparison the planner can match against an index:
+
+- start_date / end_date    -> timestamp range on parking_timestamp_idx
+- license_prefix (a,b,...) -> license_plate LIKE 'A%' on parking_license_plate_prefix_idx
+- categories/colors/gates  -> column = ANY(array)
+- search                   -> substring match across the text columns (not indexable)
+
+The same filter set always compiles to the same query text, which is what lets
+db.execute_prepared reuse one server-side prepared statement per connection.
+"""
+from datetime import datetime
+from typing import Any, Iterable, List, Mapping, Optional, Union
+
+# Query parameters understood by compile_filters.
+FILTER_KEYS = (
+    "start_date", "end_date", "license_prefix",
+    "categories", "colors", "gates", "search"
+)
+
+# Columns matched by the free-text `search` filter.
+SEARCH_COLUMNS = ("license_plate", "category", "color", "gate", "zone", "description")
+
+# List columns and the request argument that filters them.
+LIST_FILTERS = (("category", "categories"), ("color", "colors"), ("gate", "gates"))
+
+
+def split_list(value: Optional[str]) -> List[str]:
+    """Split a comma-separated argument, dropping blanks and the frontend's 'undefined'."""
+    if not value:
+        return []
+    items = [item.strip() for item in value.split(",")]
+    return [item for item in items if item and item.lower() != "undefined"]
+
+
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards so user input only ever matches literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class Where:
+    """
+    A WHERE clause under construction: AND-ed predicates and their positional
+    parameters, in placeholder order.
+    """
+
+    def __init__(self, *clauses: str) -> None:
+        self.clauses: List[str] = list(clauses)
+        self.params: List[Any] = []
+
+    def add(self, clause: str, *params: Any) -> "Where":
+        self.clauses.append(clause)
+        self.params.extend(params)
+        return self
+
+    def copy(self) -> "Where":
+        clone = Where(*self.clauses)
+        clone.params = list(self.params)
+        return clone
+
+    def __str__(self) -> str:
+        return f"WHERE {' AND '.join(self.clauses)}" if self.clauses else ""
+
+
+def compile_filters(filters: Mapping[str, Any], where: Optional[Where] = None,
+                    alias: str = "") -> Where:
+    """
+    Add the predicates for the given filters to a WHERE clause.
+
+    Args:
+        filters: Values for FILTER_KEYS. Dates may be strings (anything Postgres
+            accepts as timestamptz) or aware datetimes; list filters are
+            comma-separated strings. Missing and empty values are ignored.
+        where: Clause to extend, e.g. one holding fixed predicates; a new one
+            is created when omitted.
+        alias: Optional table alias used to qualify the column names.
+
+    Returns:
+        The extended clause.
+    """
+    where = where if where is not None else Where()
+
+    def col(name: str) -> str:
+        return f"{alias}.{name}" if alias else name
+
+    start_date: Union[str, datetime, None] = filters.get("start_date")
+    end_date: Union[str, datetime, None] = filters.get("end_date")
+    if start_date:
+        where.add(f"{col('timestamp')} >= %s::timestamptz", start_date)
+    if end_date:
+        where.add(f"{col('timestamp')} <= %s::timestamptz", end_date)
+
+    # Plates are stored upper-case, so an upper-cased, case-sensitive prefix
+    # LIKE matches the old ILIKE and can use a text_pattern_ops index.
+    prefixes = [escape_like(p.upper()) + "%" for p in split_list(filters.get("license_prefix"))]
+    if prefixes:
+        where.add(_any_of(f"{col('license_plate')} LIKE %s" for _ in prefixes), *prefixes)
+
+    for column, key in LIST_FILTERS:
+        values = split_list(filters.get(key))
+        if values:
+            where.add(f"{col(column)} = ANY(%s::text[])", values)
+
+    search = (filters.get("search") or "").strip()
+    if search:
+        pattern = f"%{escape_like(search)}%"
+        where.add(_any_of(f"{col(column)} ILIKE %s" for column in SEARCH_COLUMNS),
+                  *[pattern] * len(SEARCH_COLUMNS))
+    return where
+
+
+def _any_of(predicates: Iterable[str]) -> str:
+    predicates = list(predicates)
+    return predicates[0] if len(predicates) == 1 else f"({' OR '.join(predicates)})"
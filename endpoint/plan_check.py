@@ -0,0 +1,514 @@
+# plan_check.py
+"""
+Query-plan checks for the endpoint SQL.
+
+Each check runs EXPLAIN (FORMAT JSON) for one query of endpoint/app.py (with
+the SQL it takes from stats.py, counts.py, exporters.py, ...) or
+backend/webhooks.py against a seeded database and asserts properties of the
+plan, e.g. that `parking` is reached through parking_timestamp_idx rather
+than a sequential scan, and that a date-bounded query only touches the
+monthly partitions covering its range. `parking` and its indexes are
+partitioned, so a plan names the partitions (parking_p2025_01) and their
+indexes; names are resolved to their parent before comparing. Sequential
+scans are disabled for the check (SET LOCAL enable_seqscan = off), so a small
+test table still has to prove that the predicate *can* use the index. With
+seq scans off, a non-sargable predicate such as DATE(timestamp) = ... or a
+leading-wildcard ILIKE does not fall back to a Seq Scan but to a full Index
+Scan of parking_timestamp_idx that applies it as a Filter. So a date range
+must show up as an Index Cond on timestamp, and no scan of parking may
+filter on DATE() or a leading wildcard; the "guard" checks run such queries
+to prove that these assertions reject them.
+
+Reads are run with EXPLAIN ANALYZE inside a rolled-back transaction, so every
+check also asserts that no sort, hash or aggregate spilled to disk under the
+database's work_mem (--no-analyze only plans them). Writes are only planned.
+
+The shape of each plan (node types with their relation and index) is kept in
+expected_plans.json, recorded with --update. A failing check prints the diff
+of its plan shape against the recorded one, followed by the full plan; a
+passing check whose shape changed is marked "changed" with the diff.
+
+The shapes are recorded on a database loaded from the bundled
+parking_export.csv with every migration applied; the checks themselves also
+hold for a database seeded by bench/generate_parking.py.
+
+Usage (database settings come from the usual DB_* environment variables):
+    python endpoint/plan_check.py [--update] [--no-analyze] [name ...]
+"""
+import argparse
+import difflib
+import json
+import os
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from counts import COUNT_TABLES, EXACT_COUNT_SQL, scope_where  # noqa: E402
+from dimensions import LOAD_SQL  # noqa: E402
+from export_jobs import WATERMARK_SQL  # noqa: E402
+from exporters import build_export_query  # noqa: E402
+from filters import compile_filters  # noqa: E402
+from stats import (  # noqa: E402
+    CATEGORY_STATS_SQL, DASHBOARD_COUNTS_SQL, DASHBOARD_DATA_SQL, DURATION_BUCKET_EDGES, DURATION_HISTOGRAM_SQL,
+    DURATION_PERCENTILES_SQL, DURATION_RAW_SQL, ENHANCED_STATS_SQL, RECENT_ENTRIES_SQL, TODAY_ENTRIES_SQL,
+    TODAY_EXITS_SQL, TRENDS_SQL, entry_exit_queries, today_params, trend_params
+)
+
+TIMESTAMP_INDEX = "parking_timestamp_idx"
+PLATE_PREFIX_INDEX = "parking_license_plate_prefix_idx"
+DIRECTION_INDEX = "parking_direction_timestamp_idx"
+DETECTIONS_TIMESTAMP_INDEX = "parking_detections_timestamp_idx"
+
+EXPECTED_PLANS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "expected_plans.json")
+
+
+# Partition (or partition index) name -> name of its root parent, filled from
+# pg_inherits by load_partitions() before the checks run.
+PARENTS: Dict[str, str] = {}
+
+# Monthly partitions (migration 004): parking_p2025_01, parking_detections_p2025_01.
+PARTITION_MONTH = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def load_partitions(cur: Any) -> None:
+    cur.execute("""
+        WITH RECURSIVE tree AS (
+            SELECT inhrelid AS child, inhparent AS root FROM pg_inherits
+            WHERE inhparent NOT IN (SELECT inhrelid FROM pg_inherits)
+            UNION ALL
+            SELECT i.inhrelid, t.root FROM pg_inherits i JOIN tree t ON i.inhparent = t.child
+        )
+        SELECT child::regclass::text, root::regclass::text FROM tree
+    """)
+    PARENTS.update(dict(cur.fetchall()))
+
+
+def root_of(name: Optional[str]) -> Optional[str]:
+    return PARENTS.get(name, name) if name else name
+
+
+def partitions_of(relation: str) -> List[str]:
+    return [child for child, root in PARENTS.items() if root == relation]
+
+
+def partition_end(name: str) -> Optional[datetime]:
+    """Exclusive upper bound of a monthly partition; None for the default partition."""
+    match = PARTITION_MONTH.search(name)
+    if not match:
+        return None
+    year, month = int(match.group(1)), int(match.group(2))
+    return datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def walk(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan tree."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+def uses_index(*index_names: str, key: Optional[str] = None) -> Callable[[Dict[str, Any]], Optional[str]]:
+    """
+    Plan must read through one of the given indexes. With `key`, the scan
+    must also be bounded by an Index Cond on that column; a full scan of the
+    index that only filters its rows does not count.
+    """
+    def check(plan: Dict[str, Any]) -> Optional[str]:
+        scans = [node for node in walk(plan) if root_of(node.get("Index Name")) in index_names]
+        if key is None and scans:
+            return None
+        if any(re.search(rf"\b{key}\b", node.get("Index Cond") or "") for node in scans):
+            return None
+        expected = f"expected a scan on index {' or '.join(index_names)}"
+        if key is None:
+            return expected
+        filters = sorted({node["Filter"] for node in scans if node.get("Filter")})
+        return f"{expected} with an Index Cond on {key}" + (f" (filter: {'; '.join(filters)})" if filters else "")
+    return check
+
+
+def no_seq_scan(relation: str) -> Callable[[Dict[str, Any]], Optional[str]]:
+    """Plan must not scan the whole relation."""
+    def check(plan: Dict[str, Any]) -> Optional[str]:
+        for node in walk(plan):
+            if node.get("Node Type") == "Seq Scan" and root_of(node.get("Relation Name")) == relation:
+                return f"unexpected Seq Scan on {relation} (filter: {node.get('Filter')})"
+        return None
+    return check
+
+
+# Filters an index cannot serve: DATE() of a column, or LIKE/ILIKE ('~~',
+# '~~*') with a leading wildcard.
+DATE_FILTER = re.compile(r"\bdate\(")
+WILDCARD_FILTER = re.compile(r"~~\*? '%")
+
+
+def sargable(relation: str, search: bool = False) -> Callable[[Dict[str, Any]], Optional[str]]:
+    """
+    No scan of the relation may filter on DATE() or a leading-wildcard LIKE.
+    The free-text `search` filter matches substrings by design (filters.py),
+    so with search=True only DATE() is rejected.
+    """
+    patterns = [DATE_FILTER] if search else [DATE_FILTER, WILDCARD_FILTER]
+
+    def check(plan: Dict[str, Any]) -> Optional[str]:
+        for node in walk(plan):
+            if root_of(node.get("Relation Name")) == relation and any(
+                    pattern.search(node.get("Filter") or "") for pattern in patterns):
+                return f"{node['Node Type']} on {relation} filters on a non-sargable predicate: {node['Filter']}"
+        return None
+    return check
+
+
+def rejects(*assertions: Callable[[Dict[str, Any]], Optional[str]]) -> Callable[[Dict[str, Any]], Optional[str]]:
+    """Each of the assertions must fail on the plan (for the guard checks)."""
+    def check(plan: Dict[str, Any]) -> Optional[str]:
+        passed = [assertion.__qualname__.split(".")[0] for assertion in assertions if not assertion(plan)]
+        if not passed:
+            return None
+        return f"expected {', '.join(passed)} to reject this plan"
+    return check
+
+
+def scanned_partitions(plan: Dict[str, Any], relation: str) -> List[str]:
+    return sorted({node["Relation Name"] for node in walk(plan)
+                   if node.get("Relation Name") in PARENTS and root_of(node["Relation Name"]) == relation})
+
+
+def scans_at_most(relation: str, limit: int) -> Callable[[Dict[str, Any]], Optional[str]]:
+    """Partition pruning: a bounded range may only touch `limit` partitions."""
+    def check(plan: Dict[str, Any]) -> Optional[str]:
+        scanned = scanned_partitions(plan, relation)
+        if len(scanned) <= limit:
+            return None
+        return f"expected at most {limit} partitions of {relation}, scanned {', '.join(scanned)}"
+    return check
+
+
+def prunes(relation: str, since: Callable[[], datetime]) -> Callable[[Dict[str, Any]], Optional[str]]:
+    """
+    Partition pruning: an open-ended range from since() must skip the
+    partitions that end before it. The current month, the months created
+    ahead and the default partition all match such a range, so there is
+    nothing to check while no partition is older than the range.
+    """
+    def check(plan: Dict[str, Any]) -> Optional[str]:
+        start = since()
+        older = {name for name in partitions_of(relation)
+                 if partition_end(name) is not None and partition_end(name) <= start}
+        kept = sorted(older.intersection(scanned_partitions(plan, relation)))
+        if not kept:
+            return None
+        return f"expected partitions of {relation} before {start:%Y-%m-%d} to be pruned, scanned {', '.join(kept)}"
+    return check
+
+
+def inserts_into(relation: str) -> Callable[[Dict[str, Any]], Optional[str]]:
+    """Plan must insert into the relation (Postgres routes the rows to its partitions)."""
+    def check(plan: Dict[str, Any]) -> Optional[str]:
+        if plan.get("Operation") == "Insert" and root_of(plan.get("Relation Name")) == relation:
+            return None
+        return f"expected an Insert into {relation}, got {plan.get('Node Type')}"
+    return check
+
+
+def no_spill(plan: Dict[str, Any]) -> Optional[str]:
+    """No sort, hash or hash aggregate may spill to disk (only visible with ANALYZE)."""
+    for node in walk(plan):
+        if node.get("Sort Space Type") == "Disk":
+            return f"{node['Node Type']} spilled to disk ({node.get('Sort Method')}, {node.get('Sort Space Used')} kB)"
+        if node.get("Hash Batches", 1) > 1:
+            return f"Hash spilled to disk ({node['Hash Batches']} batches)"
+        if node.get("HashAgg Batches", 1) > 1 or node.get("Disk Usage", 0) > 0:
+            return f"HashAggregate spilled to disk ({node.get('Disk Usage')} kB)"
+    return None
+
+
+def shape(plan: Dict[str, Any], depth: int = 0) -> List[str]:
+    """
+    The plan as one line per node (type, relation, index) with partitions
+    named by their parent. Identical children of a node, such as the same
+    scan on every partition, are listed once, so the shape does not depend on
+    how many partitions a range happens to touch.
+    """
+    label = plan["Node Type"]
+    if plan.get("Strategy") and plan["Node Type"] == "Aggregate":
+        label += f" ({plan['Strategy']})"
+    if plan.get("Relation Name"):
+        label += f" on {root_of(plan['Relation Name'])}"
+    if plan.get("Index Name"):
+        label += f" using {root_of(plan['Index Name'])}"
+    if plan.get("Subplan Name"):
+        label += f" [{plan['Subplan Name']}]"
+    children: List[List[str]] = []
+    for child in plan.get("Plans", []):
+        lines = shape(child, depth + 1)
+        if lines not in children:
+            children.append(lines)
+    return ["  " * depth + label] + [line for lines in children for line in lines]
+
+
+def plan_diff(expected: Sequence[str], actual: Sequence[str]) -> List[str]:
+    """A unified diff of two plan shapes, empty when they are the same."""
+    return list(difflib.unified_diff(expected, actual, "expected", "actual", lineterm=""))
+
+
+def week_ago() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=7)
+
+
+def ten_minutes_ago() -> datetime:
+    """Lower bound of RECENT_ENTRIES_SQL's window."""
+    return datetime.now(timezone.utc) - timedelta(minutes=10)
+
+
+def duration_params() -> Dict[str, Any]:
+    return {"start_time": week_ago().isoformat(), "edges": DURATION_BUCKET_EDGES}
+
+
+def data_query(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """The /data page query for a filter set."""
+    where = compile_filters(filters)
+    return f"SELECT * FROM parking_events {where} ORDER BY timestamp DESC LIMIT %s OFFSET %s", where.params + [10, 0]
+
+
+def last_week() -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    return {"start_date": (now - timedelta(days=7)).isoformat(), "end_date": now.isoformat()}
+
+
+def last_week_bounds() -> Dict[str, Any]:
+    """CATEGORY_STATS_SQL parameters for the last week."""
+    week = last_week()
+    return {"start": week["start_date"], "end": week["end_date"]}
+
+
+def last_month_bounds() -> Dict[str, Any]:
+    """ENHANCED_STATS_SQL parameters for the last 30 days, hourly."""
+    now = datetime.now(timezone.utc)
+    return {"start": now - timedelta(days=30), "end": now, "bucket": timedelta(hours=1)}
+
+
+def dashboard_params(search: Optional[str]) -> Callable[[], Dict[str, Any]]:
+    return lambda: {"search": search, "limit": 10, "offset": 0}
+
+
+def exact_count(scope: str, filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """The /count query for a scope and filter set."""
+    where = scope_where(scope, filters)
+    query = EXACT_COUNT_SQL.format(table=COUNT_TABLES[scope], where=where)
+    return query, [datetime.now(timezone.utc) - timedelta(minutes=1)] + where.params
+
+
+def data1_queries(filters: Dict[str, Any]) -> Tuple[str, List[Any], str, List[Any]]:
+    """The /data1 page query (first page) and its count query for a filter set."""
+    query, params, count_query, count_params = entry_exit_queries(filters)
+    return query, params + [10, 0], count_query, count_params
+
+
+# insert_data_to_db() in backend/webhooks.py, as execute_values() expands it
+# for two rows (the webhook service is not importable next to the endpoint).
+# Color, gate and description are dimension ids (migration 007).
+INGEST_SQL = """
+    INSERT INTO {table}
+    (insertion_id, license_plate, category, color_id, timestamp, gate_id, zone, description_id, direction,
+     vehicle_class)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s), (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def ingest_params(plate: str, category: str) -> Callable[[], List[Any]]:
+    """Two rows of one category, as the ingester routes them (vehicles to parking, pedestrians apart)."""
+    def params() -> List[Any]:
+        now = datetime.now(timezone.utc)
+        return [value for n in (1, 2) for value in
+                (f"plan_check_{n}", plate, category, 1, now, 1, 1, 1, "in", "car")]
+    return params
+
+
+DATA_ALL = data_query({})
+DATA_DATE_RANGE = data_query(last_week())
+DATA_SEARCH = data_query({**last_week(), "search": "MH12"})
+DATA_PLATE_PREFIX = data_query({"license_prefix": "mp,ka", "categories": "car,van"})
+DATA_ARCHIVE_COUNT = compile_filters(last_week())
+EXPORT_DATE_RANGE = build_export_query(last_week())
+EXPORT_COUNT = exact_count("export", last_week())
+ENTRIES_COUNT = exact_count("entries", {"license_prefix": "MH"})
+DATA1 = data1_queries({**{k: datetime.fromisoformat(v) for k, v in last_week().items()}, "license_prefix": "MH"})
+
+# What every read of a date range of parking must do. Both indexes with a
+# timestamp key are valid: the planner reads one direction through the
+# (direction, timestamp) index of migration 005, and picks it at equal cost
+# for the empty partitions of the months created ahead. Either way the range
+# has to be an Index Cond on timestamp. Reads of parking_events (migration
+# 006) must do the same on the detections.
+RANGE_SCAN = [uses_index(TIMESTAMP_INDEX, DIRECTION_INDEX, key="timestamp"), no_seq_scan("parking"),
+              sargable("parking")]
+DETECTIONS_SCAN = [uses_index(DETECTIONS_TIMESTAMP_INDEX), no_seq_scan("parking_detections")]
+# Reads without a date range (newest rows first) walk parking_timestamp_idx in
+# order until the page is full.
+ORDERED_SCAN = [uses_index(TIMESTAMP_INDEX), no_seq_scan("parking"), sargable("parking")]
+SEARCH_RANGE_SCAN = RANGE_SCAN[:-1] + [sargable("parking", search=True)]
+SEARCH_ORDERED_SCAN = ORDERED_SCAN[:-1] + [sargable("parking", search=True)]
+
+# Queries the checks above must catch: the newest rows of today through
+# DATE(timestamp) instead of a range, and a substring match on the plate.
+GUARD_DATE_SQL = ("SELECT * FROM parking_vehicles WHERE DATE(timestamp) = CURRENT_DATE "
+                  "ORDER BY timestamp DESC LIMIT 10")
+GUARD_WILDCARD_SQL = "SELECT * FROM parking WHERE license_plate ILIKE '%%MH12%%' ORDER BY timestamp DESC LIMIT 10"
+
+
+# name -> (query, params, assertions); no_spill() applies to every check.
+CHECKS: Dict[str, Any] = {
+    "stats/trends": (TRENDS_SQL, trend_params,
+                     RANGE_SCAN + [scans_at_most("parking", 2), no_seq_scan("parking_footfall")]),
+    "stats/today-entries": (TODAY_ENTRIES_SQL, today_params, RANGE_SCAN + [scans_at_most("parking", 1)]),
+    "stats/today-exits": (TODAY_EXITS_SQL, today_params, RANGE_SCAN + [scans_at_most("parking", 1)]),
+    "stats/recent-entries": (RECENT_ENTRIES_SQL, dict,
+                             RANGE_SCAN + DETECTIONS_SCAN + [prunes("parking", ten_minutes_ago),
+                                                             prunes("parking_detections", ten_minutes_ago)]),
+    "stats/duration-stats raw": (DURATION_RAW_SQL, duration_params,
+                                 RANGE_SCAN + DETECTIONS_SCAN + [prunes("parking", week_ago),
+                                                                 prunes("parking_detections", week_ago)]),
+    "stats/duration-stats percentiles": (DURATION_PERCENTILES_SQL, duration_params,
+                                         [no_seq_scan("parking"), no_seq_scan("parking_detections"),
+                                          prunes("parking", week_ago)]),
+    "stats/duration-stats histogram": (DURATION_HISTOGRAM_SQL, duration_params,
+                                       [no_seq_scan("parking"), no_seq_scan("parking_detections"),
+                                        prunes("parking", week_ago)]),
+    "data date range": (DATA_DATE_RANGE[0], lambda: DATA_DATE_RANGE[1],
+                        RANGE_SCAN + [scans_at_most("parking", 2)]),
+    # A common prefix may be read newest first through the timestamp index
+    # until the page is full, instead of collecting and sorting its matches.
+    "data license prefix": (DATA_PLATE_PREFIX[0], lambda: DATA_PLATE_PREFIX[1],
+                            [uses_index(PLATE_PREFIX_INDEX, TIMESTAMP_INDEX), no_seq_scan("parking"),
+                             no_seq_scan("parking_detections")]),
+    "export date range": (EXPORT_DATE_RANGE[0], lambda: EXPORT_DATE_RANGE[1],
+                          RANGE_SCAN + [scans_at_most("parking", 2)]),
+    "data": (DATA_ALL[0], lambda: DATA_ALL[1], ORDERED_SCAN + DETECTIONS_SCAN),
+    "data search": (DATA_SEARCH[0], lambda: DATA_SEARCH[1],
+                    SEARCH_RANGE_SCAN + DETECTIONS_SCAN + [scans_at_most("parking", 2),
+                                                           scans_at_most("parking_detections", 2)]),
+    "data archive count": (f"SELECT COUNT(*) AS count FROM parking_events {DATA_ARCHIVE_COUNT}",
+                           lambda: DATA_ARCHIVE_COUNT.params,
+                           RANGE_SCAN + DETECTIONS_SCAN + [scans_at_most("parking", 2),
+                                                           scans_at_most("parking_detections", 2)]),
+    "count export": (EXPORT_COUNT[0], lambda: EXPORT_COUNT[1], RANGE_SCAN + [scans_at_most("parking", 2)]),
+    # Entries without a date range: by plate prefix, or by direction 'in'.
+    "count entries license prefix": (ENTRIES_COUNT[0], lambda: ENTRIES_COUNT[1],
+                                     [uses_index(PLATE_PREFIX_INDEX, DIRECTION_INDEX), no_seq_scan("parking")]),
+    "dashboard/data": (DASHBOARD_DATA_SQL, dashboard_params(None), ORDERED_SCAN),
+    "dashboard/data search": (DASHBOARD_DATA_SQL, dashboard_params("MH12"), SEARCH_ORDERED_SCAN),
+    "dashboard/summary counts": (DASHBOARD_COUNTS_SQL, trend_params,
+                                 RANGE_SCAN + [scans_at_most("parking", 2), no_seq_scan("parking_footfall")]),
+    "stats/category-stats": (CATEGORY_STATS_SQL, last_week_bounds,
+                             RANGE_SCAN + DETECTIONS_SCAN + [scans_at_most("parking", 2),
+                                                             scans_at_most("parking_detections", 2)]),
+    **{f"stats/enhanced-stats {name}": (query, last_month_bounds, RANGE_SCAN + [scans_at_most("parking", 2)])
+       for name, query in ENHANCED_STATS_SQL.items()},
+    # The exits are only bounded by end_date (entry_exit_queries), so every
+    # older partition is scanned for them; "data1 count" checks that the
+    # entries themselves are pruned.
+    "data1": (DATA1[0], lambda: DATA1[1], RANGE_SCAN),
+    "data1 count": (DATA1[2], lambda: DATA1[3], RANGE_SCAN + [scans_at_most("parking", 2)]),
+    "test": ("SELECT * FROM parking_events ORDER BY timestamp DESC LIMIT 5", list, ORDERED_SCAN + DETECTIONS_SCAN),
+    "filters": (LOAD_SQL, dict, [no_seq_scan("parking_dimension_counts")]),
+    "exports watermark": (WATERMARK_SQL, dict, ORDERED_SCAN),
+    "webhooks insert": (INGEST_SQL.format(table="parking"), ingest_params("MH12AB1234", "car"),
+                        [inserts_into("parking")]),
+    "webhooks insert detections": (INGEST_SQL.format(table="parking_detections"),
+                                   ingest_params("-", "pedestrian"), [inserts_into("parking_detections")]),
+    "guard DATE(timestamp)": (GUARD_DATE_SQL, list, [rejects(*RANGE_SCAN[:1], sargable("parking"))]),
+    "guard leading wildcard": (GUARD_WILDCARD_SQL, list, [rejects(sargable("parking"))]),
+}
+
+
+def is_read(query: str) -> bool:
+    return query.lstrip().upper().startswith(("SELECT", "WITH"))
+
+
+def explain(cur: Any, query: str, params: Any, fmt: str = "JSON", analyze: bool = False) -> Any:
+    options = f"ANALYZE, BUFFERS, FORMAT {fmt}" if analyze else f"FORMAT {fmt}"
+    cur.execute("BEGIN")
+    try:
+        cur.execute("SET LOCAL enable_seqscan = off")
+        cur.execute(f"EXPLAIN ({options}) {query}", params)
+        rows = cur.fetchall()
+    finally:
+        cur.execute("ROLLBACK")
+    if fmt == "JSON":
+        return rows[0][0][0]["Plan"]
+    return "\n".join(row[0] for row in rows)
+
+
+def main(argv: Sequence[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help="only run the checks whose names contain one of these")
+    parser.add_argument("--update", action="store_true", help="record the plan shapes in expected_plans.json")
+    parser.add_argument("--no-analyze", action="store_true", help="plan the reads without running them")
+    args = parser.parse_args(argv)
+
+    checks = {name: check for name, check in CHECKS.items()
+              if not args.names or any(part in name for part in args.names)}
+    try:
+        with open(EXPECTED_PLANS) as f:
+            expected: Dict[str, List[str]] = json.load(f)
+    except FileNotFoundError:
+        expected = {}
+
+    conn = psycopg2.connect(
+        dbname=os.environ.get("DB_NAME", "flow"),
+        user=os.environ.get("DB_USER", "postgres"),
+        password=os.environ.get("DB_PASSWORD"),
+        host=os.environ.get("DB_HOST", "db"),
+        port=os.environ.get("DB_PORT", 5432),
+    )
+    conn.autocommit = True
+    failures: List[str] = []
+    shapes: Dict[str, List[str]] = {}
+    with conn.cursor() as cur:
+        load_partitions(cur)
+        for name, (query, make_params, assertions) in checks.items():
+            params = make_params()
+            analyze = is_read(query) and not args.no_analyze
+            plan = explain(cur, query, params, analyze=analyze)
+            shapes[name] = shape(plan)
+            diff = plan_diff(expected[name], shapes[name]) if name in expected else []
+            problems = [p for p in (check(plan) for check in assertions + [no_spill]) if p]
+            if problems:
+                failures.append(name)
+                print(f"FAIL {name}")
+                for problem in problems:
+                    print(f"     - {problem}")
+                if diff:
+                    print("     plan shape (expected_plans.json -> now):")
+                    for line in diff:
+                        print(f"       {line}")
+                print("     plan:")
+                for line in explain(cur, query, params, fmt="TEXT", analyze=analyze).splitlines():
+                    print(f"       {line}")
+            elif diff:
+                print(f"ok   {name} (changed)")
+                for line in diff:
+                    print(f"       {line}")
+            else:
+                print(f"ok   {name}")
+    conn.close()
+    print(f"\n{len(checks) - len(failures)}/{len(checks)} plan checks passed")
+
+    if args.update:
+        with open(EXPECTED_PLANS, "w") as f:
+            json.dump({**expected, **shapes}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Plan shapes written to {EXPECTED_PLANS}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,249 @@
+# profiling.py
+"""
+On-demand and sampled profiling of API requests.
+
+Off unless PROFILING=true. A request is profiled when it carries an
+`X-Profile: <mode>` header or a `profile=<mode>` query parameter (when
+PROFILE_TOKEN is set, the header `X-Profile-Token` must match it), or when it
+is picked at random at PROFILE_SAMPLE_RATE (a fraction of all requests). The
+modes are:
+
+- sample (also "1" or "true"): a thread reads the stacks of the request's
+  thread every PROFILE_INTERVAL_MS and counts them as folded stacks, one
+  `frame;frame;frame count` line per distinct stack, the input of
+  flamegraph.pl, speedscope and inferno.
+- cprofile: cProfile's deterministic profile, saved as a pstats dump (for
+  snakeviz, gprof2dot or `python -m pstats`).
+
+Both also trace allocations with tracemalloc and report the peak traced
+memory. Only one request is profiled at a time (tracemalloc is process-wide);
+requests arriving meanwhile run unprofiled. Each profile is saved in
+PROFILE_DIR with a JSON description, and the newest PROFILE_KEEP are kept. The
+response carries the profile's id in X-Profile-Id for /debug/profiles/<id>;
+listing and downloading profiles takes the same X-Profile-Token.
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+PROFILING: bool = os.environ.get("PROFILING", "false").lower() == "true"
+PROFILE_TOKEN: str = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE: float = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_INTERVAL_MS: float = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR: str = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles"))
+PROFILE_KEEP: int = int(os.environ.get("PROFILE_KEEP", 100))
+
+PROFILE_MODES = ("sample", "cprofile")
+PROFILE_EXTENSIONS = {"sample": "folded", "cprofile": "pstats"}
+
+_PROFILE_ID = re.compile(r"[0-9TZ]+-[0-9a-f]+")
+
+# Held while a request is profiled.
+_active = threading.Lock()
+
+
+def check_profile_token(token: Optional[str]) -> None:
+    """
+    Raises:
+        PermissionError: When PROFILE_TOKEN is set and the X-Profile-Token header does not match it.
+    """
+    if PROFILE_TOKEN and not hmac.compare_digest(token or "", PROFILE_TOKEN):
+        raise PermissionError("Profiling requires a valid X-Profile-Token header")
+
+
+def requested_mode(header: Optional[str], flag: Optional[str], token: Optional[str]) -> Optional[str]:
+    """
+    The mode a request asks for with X-Profile / ?profile=, or one picked by
+    PROFILE_SAMPLE_RATE; None when the request is not to be profiled.
+
+    Raises:
+        ValueError: For an unknown mode.
+        PermissionError: When PROFILE_TOKEN is set and the request does not carry it.
+    """
+    if not PROFILING:
+        return None
+    value = (header or flag or "").lower()
+    if not value:
+        return "sample" if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE else None
+    if value in ("1", "true"):
+        value = "sample"
+    if value not in PROFILE_MODES:
+        raise ValueError(f"Invalid profile mode. Use one of: {', '.join(PROFILE_MODES)}.")
+    check_profile_token(token)
+    return value
+
+
+def _frame_name(code: Any) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """
+    Counts the folded stacks of some threads (all but its own when thread_ids
+    is None), read every interval seconds until stop().
+    """
+
+    def __init__(self, thread_ids: Optional[Set[int]], interval: float) -> None:
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class RequestProfile:
+    """
+    A profile of one request, started by start_profile() and saved by finish().
+
+    Args:
+        route: What the request was (e.g. "GET /stats/enhanced-stats").
+        mode: One of PROFILE_MODES.
+        thread_ids: Threads to sample (None for every thread).
+        on_demand: Whether the request asked for it (or was sampled).
+    """
+
+    def __init__(self, route: str, mode: str, thread_ids: Optional[Set[int]], on_demand: bool) -> None:
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{secrets.token_hex(4)}"
+        self.route = route
+        self.mode = mode
+        self.on_demand = on_demand
+        self._traced = tracemalloc.is_tracing()
+        if not self._traced:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._sampler: Optional[StackSampler] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        if mode == "sample":
+            self._sampler = StackSampler(thread_ids, PROFILE_INTERVAL_MS / 1000)
+            self._sampler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._started = time.perf_counter()
+
+    def finish(self, status: int) -> Dict[str, Any]:
+        """Stop profiling, save the profile and its description, and return the description."""
+        try:
+            wall_ms = (time.perf_counter() - self._started) * 1000
+            if self._profiler is not None:
+                self._profiler.disable()
+            stacks = self._sampler.stop() if self._sampler is not None else None
+            _, peak = tracemalloc.get_traced_memory()
+            if not self._traced:
+                tracemalloc.stop()
+            description = {
+                "id": self.id,
+                "route": self.route,
+                "mode": self.mode,
+                "on_demand": self.on_demand,
+                "status": status,
+                "time": datetime.now(timezone.utc).isoformat(),
+                "wall_ms": round(wall_ms, 3),
+                "peak_memory_bytes": peak,
+                "samples": self._sampler.samples if self._sampler is not None else None,
+                "file": f"{self.id}.{PROFILE_EXTENSIONS[self.mode]}",
+            }
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, description["file"])
+            if stacks is not None:
+                with open(path, "w") as f:
+                    f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+            else:
+                self._profiler.dump_stats(path)
+            with open(os.path.join(PROFILE_DIR, f"{self.id}.json"), "w") as f:
+                json.dump(description, f)
+            _prune()
+            logger.info(f"Profiled {self.route} ({self.mode}, {wall_ms:.0f} ms, peak {peak} bytes): {self.id}")
+            return description
+        finally:
+            _active.release()
+
+
+def start_profile(route: str, mode: str, thread_ids: Optional[Set[int]] = None,
+                  on_demand: bool = True) -> Optional[RequestProfile]:
+    """Start profiling a request, or return None while another request is being profiled."""
+    if not _active.acquire(blocking=False):
+        return None
+    try:
+        return RequestProfile(route, mode, thread_ids, on_demand)
+    except Exception:
+        _active.release()
+        raise
+
+
+def _prune() -> None:
+    for description in list_profiles()[PROFILE_KEEP:]:
+        for name in (description["file"], f"{description['id']}.json"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name))
+            except OSError:
+                pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Descriptions of the saved profiles, newest first."""
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    descriptions = []
+    for name in sorted(names, reverse=True):
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                descriptions.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return descriptions
+
+
+def profile_file(profile_id: str) -> Optional[Mapping[str, Any]]:
+    """The description of a saved profile with the path of its file, or None."""
+    if not _PROFILE_ID.fullmatch(profile_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as f:
+            description = json.load(f)
+    except (OSError, ValueError):
+        return None
+    path = os.path.join(PROFILE_DIR, description["file"])
+    return {**description, "path": os.path.abspath(path)} if os.path.exists(path) else None
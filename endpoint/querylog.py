@@ -0,0 +1,411 @@
+# querylog.py
+"""
+Per-route and per-query timings, and EXPLAIN capture for slow queries.
+
+Every statement run on an InstrumentedConnection (and every asyncpg query
+asgi.py makes) is timed and counted under its fingerprint: the statement text
+with whitespace collapsed, hashed. Statements run through
+db.execute_prepared are counted under the text they were PREPAREd from, not
+the EXECUTE that runs them. Requests are timed per route, together with the
+bytes of the response body (when its length is known), the time spent waiting
+for a pooled connection and the rows their queries returned. Queries made
+outside a request (the archiver, the caches' refreshes) count under
+"(background)". All durations are kept in fixed-bucket histograms, so the
+memory used does not grow with traffic.
+
+The first time a SELECT of some fingerprint takes longer than SLOW_QUERY_MS,
+it is run again on a fresh connection to the same server as
+`EXPLAIN (ANALYZE, BUFFERS)`, in a read-only transaction that is rolled back,
+and the plan is written to SLOW_QUERY_LOG (a JSON line per query, rotated at
+SLOW_QUERY_LOG_BYTES with SLOW_QUERY_LOG_BACKUPS old files). This happens in
+the background and only once per fingerprint and process, so a slow query
+costs one extra execution, not one per request. Captured parameters are
+redacted: text (plates, search terms) is replaced by its length.
+
+/debug/queries shows the histograms and the most recent captures. It is only
+served when QUERY_STATS_TOKEN is set, to requests whose X-Query-Stats-Token
+header matches it. QUERY_STATS=false turns all of it off.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import psycopg2.extensions
+
+from db import PooledConnection
+
+logger = logging.getLogger(__name__)
+
+QUERY_STATS: bool = os.environ.get("QUERY_STATS", "true").lower() == "true"
+SLOW_QUERY_MS: float = float(os.environ.get("SLOW_QUERY_MS", 500))
+QUERY_STATS_TOKEN: str = os.environ.get("QUERY_STATS_TOKEN", "")  # unset = /debug/queries off
+SLOW_QUERY_LOG: str = os.environ.get("SLOW_QUERY_LOG", os.path.join(os.path.dirname(__file__), "slow_queries.log"))
+SLOW_QUERY_LOG_BYTES: int = int(os.environ.get("SLOW_QUERY_LOG_BYTES", 5 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUPS: int = int(os.environ.get("SLOW_QUERY_LOG_BACKUPS", 3))
+
+# Upper bounds (milliseconds) of the histogram buckets; the last bucket is open.
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Captured plans kept in memory for /debug/queries.
+RECENT_SLOW_QUERIES = 50
+
+BACKGROUND = "(background)"
+
+EXPLAIN = "EXPLAIN (ANALYZE, BUFFERS) "
+READ_ONLY = "SET TRANSACTION READ ONLY"
+
+_WHITESPACE = re.compile(r"\s+")
+_PREPARE = re.compile(r"PREPARE (\w+) AS (.*)", re.DOTALL)
+_EXECUTE = re.compile(r"EXECUTE (\w+)")
+
+
+def normalize(query: str) -> str:
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def fingerprint(query: str) -> str:
+    return hashlib.sha1(normalize(query).encode()).hexdigest()[:16]
+
+
+def _explainable(query: str) -> bool:
+    return normalize(query).split(" ", 1)[0].upper() in ("SELECT", "WITH")
+
+
+def redact(params: Any) -> Any:
+    """Bound parameters with every text value replaced by its length; numbers, dates and None are kept."""
+    if isinstance(params, dict):
+        return {key: redact(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [redact(value) for value in params]
+    if isinstance(params, (str, bytes)):
+        return f"<{len(params)} chars>"
+    return params
+
+
+def check_token(token: Optional[str]) -> None:
+    """
+    Raises:
+        PermissionError: When the X-Query-Stats-Token header does not match QUERY_STATS_TOKEN.
+    """
+    if not hmac.compare_digest(token or "", QUERY_STATS_TOKEN):
+        raise PermissionError("/debug/queries requires a valid X-Query-Stats-Token header")
+
+
+def _round(ms: Optional[float]) -> Optional[float]:
+    return None if ms is None else round(ms, 3)
+
+
+class Histogram:
+    """Counts of durations per LATENCY_BUCKETS_MS bucket, with their sum and maximum."""
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile (the maximum for the open bucket)."""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> Dict[str, Any]:
+        bounds = [f"le_{bound:g}" for bound in LATENCY_BUCKETS_MS] + ["inf"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "p50_ms": _round(self.percentile(50)),
+            "p95_ms": _round(self.percentile(95)),
+            "p99_ms": _round(self.percentile(99)),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": {bound: n for bound, n in zip(bounds, self.counts) if n},
+        }
+
+
+class RouteStats:
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.pool_wait = Histogram()
+        self.bytes = 0
+        self.rows = 0
+        self.queries = 0
+        self.errors = 0
+
+
+class QueryStats:
+    def __init__(self, query: str) -> None:
+        self.query = normalize(query)
+        self.latency = Histogram()
+        self.rows = 0
+        self.routes: Set[str] = set()
+
+
+class RequestTiming:
+    """What the current request spent on the database; lives in the current_request context variable."""
+
+    def __init__(self, route: str) -> None:
+        self.route = route
+        self.started = time.perf_counter()
+        self.pool_wait_ms = 0.0
+        self.rows = 0
+        self.queries = 0
+
+
+current_request: ContextVar[Optional[RequestTiming]] = ContextVar("current_request", default=None)
+
+
+class QueryLog:
+    """
+    The process's route and query statistics and its slow-query log.
+
+    Args:
+        slow_ms: Duration above which a query's plan is captured.
+        log_path: File the captured plans are appended to (rotated).
+    """
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS, log_path: str = SLOW_QUERY_LOG) -> None:
+        self.slow_ms = slow_ms
+        self.started = datetime.now(timezone.utc)
+        self.routes: Dict[str, RouteStats] = {}
+        self.queries: Dict[str, QueryStats] = {}
+        self.explained: Set[str] = set()
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_SLOW_QUERIES)
+        self._lock = threading.Lock()
+        self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+        self.slow_log = logging.getLogger("slow_queries")
+        self.slow_log.propagate = False
+        self.slow_log.setLevel(logging.INFO)
+        if log_path and not self.slow_log.handlers:
+            handler = RotatingFileHandler(log_path, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                          backupCount=SLOW_QUERY_LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.slow_log.addHandler(handler)
+
+    def start_request(self, route: str) -> RequestTiming:
+        timing = RequestTiming(route)
+        current_request.set(timing)
+        return timing
+
+    def finish_request(self, timing: RequestTiming, nbytes: Optional[int], status: int) -> None:
+        ms = (time.perf_counter() - timing.started) * 1000
+        with self._lock:
+            stats = self.routes.setdefault(timing.route, RouteStats())
+            stats.latency.add(ms)
+            stats.pool_wait.add(timing.pool_wait_ms)
+            stats.bytes += nbytes or 0
+            stats.rows += timing.rows
+            stats.queries += timing.queries
+            stats.errors += status >= 500
+        current_request.set(None)
+
+    def record_pool_wait(self, seconds: float) -> None:
+        timing = current_request.get()
+        if timing is not None:
+            timing.pool_wait_ms += seconds * 1000
+
+    def record_query(self, query: str, seconds: float, rows: int) -> bool:
+        """
+        Count one execution of query; rows is -1 when unknown.
+
+        Returns:
+            True when this execution was slow and its fingerprint has no plan
+            captured yet; the caller then runs explain() (the fingerprint is
+            claimed, so no other execution is asked to).
+        """
+        ms = seconds * 1000
+        timing = current_request.get()
+        route = timing.route if timing is not None else BACKGROUND
+        if timing is not None:
+            timing.queries += 1
+            timing.rows += max(rows, 0)
+        key = fingerprint(query)
+        with self._lock:
+            stats = self.queries.get(key)
+            if stats is None:
+                stats = self.queries[key] = QueryStats(query)
+            stats.latency.add(ms)
+            stats.rows += max(rows, 0)
+            stats.routes.add(route)
+            if ms < self.slow_ms or key in self.explained or not _explainable(query):
+                return False
+            self.explained.add(key)
+            return True
+
+    def record_plan(self, query: str, params: Any, seconds: float, rows: int, plan: Sequence[str]) -> None:
+        """Append a captured plan (or the error that prevented it) to the slow-query log."""
+        timing = current_request.get()
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "fingerprint": fingerprint(query),
+            "route": timing.route if timing is not None else BACKGROUND,
+            "duration_ms": round(seconds * 1000, 3),
+            "rows": rows,
+            "query": normalize(query),
+            "params": json.loads(json.dumps(redact(params), default=str)),
+            "plan": list(plan),
+        }
+        self.slow_log.info(json.dumps(entry))
+        with self._lock:
+            self.recent.append(entry)
+
+    def explain_later(self, explain: Callable[[], List[str]], query: str, params: Any,
+                      seconds: float, rows: int) -> None:
+        """Run explain() on the background thread and log its plan."""
+        timing = current_request.get()
+
+        def capture() -> None:
+            current_request.set(timing)
+            try:
+                plan = explain()
+            except Exception as e:
+                logger.warning(f"Could not capture the plan of slow query {fingerprint(query)}: {e}")
+                plan = [f"(plan unavailable: {e})"]
+            self.record_plan(query, params, seconds, rows, plan)
+
+        self._explainer.submit(capture)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything recorded so far, for /debug/queries (queries by total time, slowest first)."""
+        with self._lock:
+            routes = {
+                route: {
+                    "latency": stats.latency.summary(),
+                    "pool_wait": stats.pool_wait.summary(),
+                    "bytes": stats.bytes,
+                    "rows": stats.rows,
+                    "queries": stats.queries,
+                    "errors": stats.errors,
+                }
+                for route, stats in sorted(self.routes.items())
+            }
+            queries = [
+                {
+                    "fingerprint": key,
+                    "query": stats.query,
+                    "latency": stats.latency.summary(),
+                    "rows": stats.rows,
+                    "routes": sorted(stats.routes),
+                    "plan_captured": key in self.explained,
+                }
+                for key, stats in sorted(self.queries.items(), key=lambda item: -item[1].latency.total_ms)
+            ]
+            recent = list(self.recent)
+        return {
+            "since": self.started.isoformat(),
+            "slow_query_ms": self.slow_ms,
+            "routes": routes,
+            "queries": queries,
+            "slow_queries": recent[::-1],
+        }
+
+
+query_log: Optional[QueryLog] = QueryLog() if QUERY_STATS else None
+
+
+def explain_sync(connect: Callable[[], Any], query: str, params: Any, setup: Sequence[str] = ()) -> List[str]:
+    """EXPLAIN (ANALYZE, BUFFERS) query on a new connection from connect(), read-only and rolled back."""
+    conn = connect()
+    conn.instrumented = False
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.execute(READ_ONLY)
+            for statement in setup:
+                cur.execute(statement)
+            cur.execute(EXPLAIN + query, params)
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        getattr(conn, "discard", conn.close)()
+
+
+class TimedCursor:
+    """Mixed into a connection's cursor class: times execute() and reports it to query_log."""
+
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        conn = self.connection  # type: ignore[attr-defined]
+        if query_log is None or not getattr(conn, "instrumented", False) or not isinstance(query, str):
+            return super().execute(query, vars)  # type: ignore[misc]
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)  # type: ignore[misc]
+        finally:
+            self._record(conn, query, vars, time.perf_counter() - started)
+
+    def _record(self, conn: Any, query: str, vars: Any, seconds: float) -> None:
+        prepare = _PREPARE.match(query)
+        if prepare:
+            # Remembered so the EXECUTEs are counted under the prepared text.
+            conn.statements[prepare.group(1)] = prepare.group(2)
+            return
+        text, setup = query, ()
+        execute = _EXECUTE.match(query)
+        if execute and execute.group(1) in conn.statements:
+            text = conn.statements[execute.group(1)]
+            setup = (f"PREPARE {execute.group(1)} AS {text}",)
+        rows = self.rowcount  # type: ignore[attr-defined]
+        if query_log.record_query(text, seconds, rows):
+            pool = conn.pool
+            if pool is None:
+                return
+            query_log.explain_later(lambda: explain_sync(pool.connect, query, vars, setup),
+                                    text, vars, seconds, rows)
+
+
+@lru_cache(maxsize=None)
+def timed_cursor(factory: type) -> type:
+    """factory's cursor class with TimedCursor mixed in."""
+    return type(f"Timed{factory.__name__}", (TimedCursor, factory), {})
+
+
+class InstrumentedConnection(PooledConnection):
+    """A PooledConnection whose cursors (whatever their cursor_factory) report to query_log."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.instrumented = True
+        # Text of the statements PREPAREd on this connection, by name.
+        self.statements: Dict[str, str] = {}
+
+    def cursor(self, *args: Any, **kwargs: Any) -> Any:
+        factory = kwargs.pop("cursor_factory", None) or self.cursor_factory or psycopg2.extensions.cursor
+        if query_log is not None:
+            factory = timed_cursor(factory)
+        return super().cursor(*args, cursor_factory=factory, **kwargs)
+
+
+@contextmanager
+def pool_wait() -> Iterator[None]:
+    """Count the time spent in the block (taking a pooled connection) as the current request's pool wait."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if query_log is not None:
+            query_log.record_pool_wait(time.perf_counter() - started)
@@ -0,0 +1,167 @@
+# replicas.py
+"""
+Read routing between the primary and streaming replicas.
+
+DB_REPLICAS lists the replicas as comma-separated libpq connection strings or
+URIs ("host=replica1 port=5432" or "postgresql://replica1:5432"); database,
+user and password default to the primary's DB_* settings. Without it every
+read goes to the primary, as before.
+
+A background thread checks each replica every REPLICA_CHECK_INTERVAL seconds
+and records whether it answers and how far its replay lags behind the
+primary. A replica whose WAL receiver is not streaming (it lost the primary,
+replayed what it had and stopped) is only as fresh as the last transaction it
+replayed, so it is measured by that. Reads go round robin to the healthy
+replicas whose lag is within REPLICA_MAX_LAG seconds (or the tighter max_lag a
+request asks for). A read that must see the latest writes passes fresh=True
+and goes to the primary, as does every read while no replica qualifies. The
+incremental caches (counts.py, columnar.py) only trust rows older than their
+settle time, so they read from replicas safely as long as REPLICA_MAX_LAG
+stays below it.
+
+test_replicas.py covers the routing, and LAG_SQL against a real standby.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+import psycopg2
+from psycopg2.extensions import parse_dsn
+
+from db import ConnectionPool, PooledConnection
+
+logger = logging.getLogger(__name__)
+
+DB_REPLICAS: str = os.environ.get("DB_REPLICAS", "")
+REPLICA_MAX_LAG: float = float(os.environ.get("REPLICA_MAX_LAG", 10))
+REPLICA_CHECK_INTERVAL: float = float(os.environ.get("REPLICA_CHECK_INTERVAL", 5))
+
+# Replay lag in seconds: 0 for a server that is not a standby at all, and 0
+# when the WAL receiver is streaming and everything received has been replayed
+# (an idle primary sends nothing new). Otherwise the age of the last replayed
+# transaction, or NULL (unknown, not used) if none was replayed yet. Without
+# superuser or pg_read_all_stats the status in pg_stat_wal_receiver reads as
+# NULL, so an idle primary makes the replica look lagging rather than fresh.
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+             AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END AS lag
+"""
+
+
+def replica_settings(dsns: str = DB_REPLICAS, defaults: Optional[Mapping[str, Any]] = None) -> List[Dict[str, Any]]:
+    """psycopg2.connect() keyword arguments for each replica in a DB_REPLICAS value."""
+    defaults = {key: value for key, value in (defaults or {}).items()
+                if key in ("dbname", "user", "password")}
+    return [{**defaults, **parse_dsn(dsn.strip())} for dsn in dsns.split(",") if dsn.strip()]
+
+
+def asyncpg_settings(settings: Mapping[str, Any]) -> Dict[str, Any]:
+    """asyncpg.connect() keyword arguments for replica_settings() output."""
+    names = {"host": "host", "port": "port", "user": "user", "password": "password", "dbname": "database"}
+    result = {names[key]: value for key, value in settings.items() if key in names}
+    if "port" in result:
+        result["port"] = int(result["port"])
+    return result
+
+
+class Replica:
+    """One replica: its connection pool and the outcome of the last health check."""
+
+    def __init__(self, settings: Mapping[str, Any], connect: Callable[..., PooledConnection]) -> None:
+        self.settings = dict(settings)
+        self.name = f"{settings.get('host', 'localhost')}:{settings.get('port', 5432)}"
+        self.connect = lambda: connect(**self.settings)
+        self.pool = ConnectionPool(self.connect)
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self._check_conn: Optional[PooledConnection] = None
+
+    def check(self) -> None:
+        """Measure the replay lag on a dedicated connection; any error marks the replica down."""
+        try:
+            if self._check_conn is None or self._check_conn.closed:
+                self._check_conn = self.connect()
+                self._check_conn.autocommit = True
+            with self._check_conn.cursor() as cur:
+                cur.execute(LAG_SQL)
+                row = cur.fetchone()
+            lag = row["lag"] if isinstance(row, dict) else row[0]
+        except Exception as e:
+            self.mark_down(e)
+            if self._check_conn is not None:
+                self._check_conn.discard()
+                self._check_conn = None
+            return
+        if not self.healthy:
+            logger.info(f"Replica {self.name} is available (lag {'unknown' if lag is None else f'{lag:.1f}s'})")
+        self.lag = None if lag is None else float(lag)
+        self.healthy = True
+
+    def mark_down(self, error: Exception) -> None:
+        if self.healthy:
+            logger.warning(f"Replica {self.name} is unavailable, reading from the primary: {error}")
+            # Idle connections did not survive whatever happened to the server.
+            self.pool.closeall()
+        self.healthy = False
+        self.lag = None
+
+
+class ReplicaRouter:
+    """
+    Hands out read connections from a healthy, recent-enough replica or the primary.
+
+    Args:
+        primary: Pool of connections to the primary.
+        replicas: The replicas to balance reads over (may be empty).
+        max_lag: Default lag in seconds above which a replica is skipped.
+        check_interval: Seconds between health checks.
+    """
+
+    def __init__(self, primary: ConnectionPool, replicas: Sequence[Replica] = (),
+                 max_lag: float = REPLICA_MAX_LAG, check_interval: float = REPLICA_CHECK_INTERVAL) -> None:
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = itertools.count()
+        self._checker: Optional[threading.Thread] = None
+        if self.replicas:
+            self._checker = threading.Thread(target=self._check_loop, name="replica-checker", daemon=True)
+            self._checker.start()
+
+    def pick(self, fresh: bool = False, max_lag: Optional[float] = None) -> Optional[Replica]:
+        """The replica for the next read, or None for the primary."""
+        if fresh:
+            return None
+        limit = self.max_lag if max_lag is None else min(max_lag, self.max_lag)
+        eligible = [r for r in self.replicas if r.healthy and r.lag is not None and r.lag <= limit]
+        if not eligible:
+            return None
+        return eligible[next(self._next) % len(eligible)]
+
+    def getconn(self, fresh: bool = False, max_lag: Optional[float] = None) -> PooledConnection:
+        """A connection for reads; close() returns it to its pool."""
+        replica = self.pick(fresh, max_lag)
+        if replica is not None:
+            try:
+                return replica.pool.getconn()
+            except psycopg2.OperationalError as e:
+                replica.mark_down(e)
+        return self.primary.getconn()
+
+    def closeall(self) -> None:
+        for replica in self.replicas:
+            replica.pool.closeall()
+
+    def _check_loop(self) -> None:
+        while True:
+            for replica in self.replicas:
+                replica.check()
+            time.sleep(self.check_interval)
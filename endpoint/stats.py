@@ -0,0 +1,655 @@
+# stats.py
+"""
+Day boundaries and SQL for the dashboard statistics endpoints (shared by the
+Flask app and the ASGI service).
+
+Days are half-open [day_start, day_end) ranges computed in the site's
+timezone (SITE_TIMEZONE) and passed to Postgres as timestamptz parameters, so
+every predicate is a plain range on `timestamp` that can use
+parking_timestamp_idx instead of evaluating DATE(timestamp) for every row.
+
+Pedestrians are stored apart from the vehicle rows in `parking` (migration
+006). Queries that include them read the parking_events view, or for the
+day totals, the parking_footfall rollup.
+
+color, gate and description are stored as ids into dimension tables and zone
+as an integer (migration 007). Queries that return or filter on them read the
+views with the decoded names, parking_vehicles and parking_events; counts per
+gate or color group by the ids and look the names up afterwards.
+"""
+import logging
+import math
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from filters import Where, compile_filters
+
+logger = logging.getLogger(__name__)
+
+SITE_TIMEZONE: ZoneInfo = ZoneInfo(os.environ.get("SITE_TIMEZONE", "UTC"))
+
+# Entries and exits by the direction the ingester stores from its gate
+# registry (migration 005), which parking_direction_timestamp_idx covers.
+ENTRY_DIRECTION = "direction = 'in'"
+EXIT_DIRECTION = "direction = 'out'"
+
+
+def site_today(now: Optional[datetime] = None) -> date:
+    """The current calendar date at the site."""
+    return (now or datetime.now(SITE_TIMEZONE)).astimezone(SITE_TIMEZONE).date()
+
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    """Half-open [start, end) of a calendar day at the site, as aware datetimes."""
+    start = datetime.combine(day, time.min, tzinfo=SITE_TIMEZONE)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=SITE_TIMEZONE)
+    return start, end
+
+
+def trend_params(now: Optional[datetime] = None) -> Dict[str, datetime]:
+    """Parameters for TRENDS_SQL: the bounds of yesterday and today."""
+    today = site_today(now)
+    yesterday_start, today_start = day_bounds(today - timedelta(days=1))
+    _, today_end = day_bounds(today)
+    return {"yesterday_start": yesterday_start, "today_start": today_start, "today_end": today_end}
+
+
+def today_params(now: Optional[datetime] = None) -> Dict[str, datetime]:
+    """Parameters for TODAY_ENTRIES_SQL / TODAY_EXITS_SQL."""
+    day_start, day_end = day_bounds(site_today(now))
+    return {"day_start": day_start, "day_end": day_end}
+
+
+# Today's and yesterday's pedestrian entries and exits from the footfall
+# rollup (migration 006). Day bounds fall on its 15-minute buckets.
+FOOTFALL_CTE = f"""
+    footfall AS (
+        SELECT
+            COALESCE(SUM(count) FILTER (WHERE bucket >= %(today_start)s AND {ENTRY_DIRECTION}), 0) AS todays_entries,
+            COALESCE(SUM(count) FILTER (WHERE bucket >= %(today_start)s AND {EXIT_DIRECTION}), 0) AS todays_exits,
+            COALESCE(SUM(count) FILTER (WHERE bucket < %(today_start)s AND {ENTRY_DIRECTION}), 0) AS yesterdays_entries,
+            COALESCE(SUM(count) FILTER (WHERE bucket < %(today_start)s AND {EXIT_DIRECTION}), 0) AS yesterdays_exits
+        FROM parking_footfall
+        WHERE bucket >= %(yesterday_start)s
+          AND bucket < %(today_end)s
+    )
+"""
+
+# Today's and yesterday's entries and exits: one range scan of the vehicle
+# rows plus the pedestrians' footfall.
+TRENDS_SQL = f"""
+    WITH vehicles AS (
+        SELECT
+            COUNT(*) FILTER (WHERE timestamp >= %(today_start)s AND {ENTRY_DIRECTION}) AS todays_entries,
+            COUNT(*) FILTER (WHERE timestamp >= %(today_start)s AND {EXIT_DIRECTION}) AS todays_exits,
+            COUNT(*) FILTER (WHERE timestamp < %(today_start)s AND {ENTRY_DIRECTION}) AS yesterdays_entries,
+            COUNT(*) FILTER (WHERE timestamp < %(today_start)s AND {EXIT_DIRECTION}) AS yesterdays_exits
+        FROM parking
+        WHERE timestamp >= %(yesterday_start)s
+          AND timestamp < %(today_end)s
+    ),
+    {FOOTFALL_CTE}
+    SELECT
+        (v.todays_entries + f.todays_entries)::bigint AS todays_entries,
+        (v.todays_exits + f.todays_exits)::bigint AS todays_exits,
+        (v.yesterdays_entries + f.yesterdays_entries)::bigint AS yesterdays_entries,
+        (v.yesterdays_exits + f.yesterdays_exits)::bigint AS yesterdays_exits
+    FROM vehicles v, footfall f
+"""
+
+# The dashboard counters in one range scan: everything TRENDS_SQL returns,
+# plus today's vehicle entries and exits (TODAY_ENTRIES_SQL / TODAY_EXITS_SQL).
+DASHBOARD_COUNTS_SQL = f"""
+    WITH vehicles AS (
+        SELECT
+            COUNT(*) FILTER (WHERE timestamp >= %(today_start)s AND {ENTRY_DIRECTION}) AS todays_entries,
+            COUNT(*) FILTER (WHERE timestamp >= %(today_start)s AND {EXIT_DIRECTION}) AS todays_exits,
+            COUNT(*) FILTER (WHERE timestamp < %(today_start)s AND {ENTRY_DIRECTION}) AS yesterdays_entries,
+            COUNT(*) FILTER (WHERE timestamp < %(today_start)s AND {EXIT_DIRECTION}) AS yesterdays_exits,
+            COUNT(*) FILTER (WHERE timestamp >= %(today_start)s AND {ENTRY_DIRECTION}
+                             AND category != 'pedestrian') AS todays_vehicle_entries,
+            COUNT(*) FILTER (WHERE timestamp >= %(today_start)s AND {EXIT_DIRECTION}
+                             AND category != 'pedestrian') AS todays_vehicle_exits
+        FROM parking
+        WHERE timestamp >= %(yesterday_start)s
+          AND timestamp < %(today_end)s
+    ),
+    {FOOTFALL_CTE}
+    SELECT
+        (v.todays_entries + f.todays_entries)::bigint AS todays_entries,
+        (v.todays_exits + f.todays_exits)::bigint AS todays_exits,
+        (v.yesterdays_entries + f.yesterdays_entries)::bigint AS yesterdays_entries,
+        (v.yesterdays_exits + f.yesterdays_exits)::bigint AS yesterdays_exits,
+        v.todays_vehicle_entries,
+        v.todays_vehicle_exits
+    FROM vehicles v, footfall f
+"""
+
+TODAY_ENTRIES_SQL = f"""
+    SELECT COUNT(*) AS count
+    FROM parking
+    WHERE timestamp >= %(day_start)s
+      AND timestamp < %(day_end)s
+      AND {ENTRY_DIRECTION}
+      AND category != 'pedestrian'
+"""
+
+TODAY_EXITS_SQL = f"""
+    SELECT COUNT(*) AS count
+    FROM parking
+    WHERE timestamp >= %(day_start)s
+      AND timestamp < %(day_end)s
+      AND {EXIT_DIRECTION}
+      AND category != 'pedestrian'
+"""
+
+RECENT_ENTRIES_SQL = f"""
+    SELECT COUNT(*) AS count
+    FROM parking_events
+    WHERE timestamp >= NOW() - INTERVAL '10 minutes'
+      AND {ENTRY_DIRECTION}
+"""
+
+
+# Dashboard table (/dashboard/data): newest vehicle events matching an optional
+# free-text search.
+DASHBOARD_DATA_SQL = """
+    SELECT *
+    FROM parking_vehicles
+    WHERE (
+      %(search)s::text IS NULL OR
+      license_plate ILIKE ('%%' || %(search)s::text || '%%') OR
+      category ILIKE ('%%' || %(search)s::text || '%%') OR
+      color ILIKE ('%%' || %(search)s::text || '%%') OR
+      gate ILIKE ('%%' || %(search)s::text || '%%') OR
+      zone ILIKE ('%%' || %(search)s::text || '%%') OR
+      description ILIKE ('%%' || %(search)s::text || '%%')
+    )
+    AND category != 'pedestrian'
+    ORDER BY timestamp DESC
+    LIMIT %(limit)s
+    OFFSET %(offset)s
+"""
+
+CATEGORY_STATS_SQL = """
+    SELECT category, COUNT(*) AS count
+    FROM parking_events
+    WHERE
+      timestamp >= %(start)s::timestamptz
+      AND timestamp <= %(end)s::timestamptz
+    GROUP BY category
+"""
+
+# ---------------------------------------
+# Dwell time (/stats/duration-stats)
+# ---------------------------------------
+# Default histogram bucket edges in seconds: 15m, 30m, 1h, 2h, 4h, 8h, 24h.
+DURATION_BUCKET_EDGES = [900, 1800, 3600, 7200, 14400, 28800, 86400]
+
+
+def parse_bucket_edges(value: str) -> List[float]:
+    """
+    Histogram bucket edges (seconds) from a comma-separated `buckets`
+    parameter, sorted.
+
+    Raises:
+        ValueError: For an edge that is not a positive number, or a duplicate.
+    """
+    edges = []
+    for part in value.split(","):
+        try:
+            edge = float(part)
+        except ValueError:
+            edge = math.nan
+        if not (math.isfinite(edge) and edge > 0):
+            raise ValueError(f"Invalid bucket edge {part.strip()!r}. Use positive numbers of seconds, "
+                             f"e.g. buckets=900,3600,86400.")
+        edges.append(edge)
+    duplicates = sorted({edge for edge in edges if edges.count(edge) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate bucket edges: {', '.join(f'{edge:g}' for edge in duplicates)}.")
+    return sorted(edges)
+
+# One sort/window pass: events since start_time are ordered newest first per
+# plate, so the earliest exit after an entry is a running MIN over the
+# preceding rows (the frame start stays fixed, so it is computed
+# incrementally). Entries sort before exits with the same timestamp, keeping
+# the exit strictly later than the entry as in the old LATERAL join.
+DURATION_SESSIONS_CTE = f"""
+    WITH events AS (
+        SELECT
+            insertion_id,
+            license_plate,
+            category,
+            timestamp,
+            {ENTRY_DIRECTION} AS is_entry
+        FROM parking_events
+        WHERE timestamp >= %(start_time)s::timestamptz
+          AND direction IS NOT NULL
+    ),
+    paired AS (
+        SELECT
+            insertion_id,
+            license_plate,
+            category,
+            is_entry,
+            timestamp AS entry_timestamp,
+            MIN(timestamp) FILTER (WHERE NOT is_entry) OVER (
+                PARTITION BY license_plate
+                ORDER BY timestamp DESC, is_entry DESC
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ) AS exit_timestamp
+        FROM events
+    ),
+    sessions AS (
+        SELECT
+            insertion_id AS entry_id,
+            license_plate,
+            category,
+            entry_timestamp,
+            exit_timestamp,
+            EXTRACT(EPOCH FROM (exit_timestamp - entry_timestamp)) AS duration
+        FROM paired
+        WHERE is_entry
+    )
+"""
+
+DURATION_RAW_SQL = DURATION_SESSIONS_CTE + """
+    SELECT entry_id, license_plate, entry_timestamp, exit_timestamp, duration
+    FROM sessions
+"""
+
+# Per-category and overall (category NULL) dwell-time percentiles of completed sessions.
+DURATION_PERCENTILES_SQL = DURATION_SESSIONS_CTE + """
+    SELECT
+        category,
+        COUNT(*) AS sessions,
+        COUNT(duration) AS completed,
+        AVG(duration)::float AS avg,
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY duration) AS p50,
+        percentile_cont(0.9) WITHIN GROUP (ORDER BY duration) AS p90,
+        percentile_cont(0.99) WITHIN GROUP (ORDER BY duration) AS p99
+    FROM sessions
+    GROUP BY GROUPING SETS ((category), ())
+"""
+
+# Session counts per category and dwell-time bucket. Bucket 0 holds open
+# sessions (no exit yet); bucket i >= 1 covers [edges[i-2], edges[i-1]).
+DURATION_HISTOGRAM_SQL = DURATION_SESSIONS_CTE + """
+    SELECT
+        category,
+        CASE WHEN duration IS NULL THEN 0
+             ELSE width_bucket(duration, %(edges)s::float8[]) + 1
+        END AS bucket,
+        COUNT(*) AS count
+    FROM sessions
+    GROUP BY category, bucket
+"""
+
+
+def duration_percentiles(rows: Sequence[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Shape DURATION_PERCENTILES_SQL rows as {"overall": ..., "categories": {...}}."""
+    by_category = {}
+    overall = None
+    for row in rows:
+        summary = {key: row[key] for key in ("sessions", "completed", "avg", "p50", "p90", "p99")}
+        if row["category"] is None:
+            overall = summary
+        else:
+            by_category[row["category"]] = summary
+    return {"overall": overall, "categories": by_category}
+
+
+def duration_histogram(rows: Sequence[Mapping[str, Any]], edges: Sequence[float]) -> Dict[str, Any]:
+    """Shape DURATION_HISTOGRAM_SQL rows as bucket bounds plus per-category counts."""
+    # bucket 0 = still parked, bucket i = [bounds[i-1], bounds[i])
+    bounds = [0.0] + [float(edge) for edge in edges] + [None]
+    buckets = [{"lower": bounds[i], "upper": bounds[i + 1]} for i in range(len(bounds) - 1)]
+    categories: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        entry = categories.setdefault(row["category"], {"open": 0, "counts": [0] * len(buckets)})
+        if row["bucket"] == 0:
+            entry["open"] += row["count"]
+        else:
+            entry["counts"][row["bucket"] - 1] += row["count"]
+    return {"buckets": buckets, "categories": categories}
+
+
+# ---------------------------------------
+# Entry/exit listing (/data1)
+# ---------------------------------------
+# Vehicle entries with a plate, each mapped to the first exit of the same
+# plate after it; {where} filters the entries, {exits_where} the exits.
+ENTRY_EXIT_SQL = """
+    WITH entries AS (
+        SELECT
+            insertion_id,
+            license_plate,
+            category,
+            color,
+            gate AS entry_gate,
+            timestamp AS entry_time,
+            zone,
+            description
+        FROM parking_vehicles
+        {where}
+    ),
+    exits AS (
+        SELECT
+            license_plate,
+            gate AS exit_gate,
+            timestamp AS exit_time
+        FROM parking_vehicles
+        {exits_where}
+    ),
+    matched_exits AS (
+        SELECT
+            e.insertion_id,
+            e.license_plate,
+            e.entry_time,
+            MIN(x.exit_time) AS exit_time
+        FROM entries e
+        LEFT JOIN exits x
+            ON e.license_plate = x.license_plate
+            AND x.exit_time > e.entry_time
+        GROUP BY e.insertion_id, e.license_plate, e.entry_time
+    )
+    SELECT
+        e.insertion_id,
+        e.license_plate,
+        e.category,
+        e.color,
+        e.entry_gate,
+        TO_CHAR(e.entry_time, 'Dy, DD Mon YYYY HH24:MI:SS TZ') AS entry_time,
+        COALESCE(x.exit_gate, 'Not Exited') AS exit_gate,
+        TO_CHAR(m.exit_time, 'Dy, DD Mon YYYY HH24:MI:SS TZ') AS exit_time,
+        e.zone,
+        e.description,
+        CASE
+            WHEN m.exit_time IS NOT NULL
+            THEN EXTRACT(EPOCH FROM (m.exit_time - e.entry_time))
+            ELSE -1
+        END AS duration
+    FROM entries e
+    LEFT JOIN matched_exits m
+        ON e.insertion_id = m.insertion_id
+        AND e.license_plate = m.license_plate
+        AND e.entry_time = m.entry_time
+    LEFT JOIN exits x
+        ON m.license_plate = x.license_plate
+        AND m.exit_time = x.exit_time
+    ORDER BY e.entry_time DESC
+    LIMIT %s OFFSET %s
+"""
+
+
+def entry_exit_queries(filters: Mapping[str, Any]) -> Tuple[str, List[Any], str, List[Any]]:
+    """
+    The /data1 page query and its count query for the given filters.
+
+    Returns:
+        (page query, its parameters without LIMIT/OFFSET, count query, its parameters)
+    """
+    # WHERE clause for entries: fixed predicates plus the requested filters,
+    # all passed as parameters.
+    where = compile_filters(filters, Where(ENTRY_DIRECTION, "category != 'pedestrian'", "license_plate != '-'"))
+    exits_where = Where(EXIT_DIRECTION)
+    if filters.get("end_date"):
+        exits_where.add("timestamp <= %s::timestamptz", filters["end_date"])
+    query = ENTRY_EXIT_SQL.format(where=where, exits_where=exits_where)
+    count_query = f"SELECT COUNT(*) AS total FROM parking_vehicles {where}"
+    return query, where.params + exits_where.params, count_query, where.params
+
+
+# ---------------------------------------
+# Analytics page (/stats/enhanced-stats)
+# ---------------------------------------
+# Non-pedestrian events between %(start)s and %(end)s (both inclusive). Hours,
+# days and weekdays are taken in the database session timezone.
+ENHANCED_STATS_WHERE = """
+    WHERE timestamp >= %(start)s::timestamptz
+      AND timestamp <= %(end)s::timestamptz
+      AND category != 'pedestrian'
+"""
+
+ENHANCED_STATS_SQL: Dict[str, str] = {
+    # Category counts, entries/exits per category and (summed) overall.
+    "categories": f"""
+        SELECT
+            category,
+            COUNT(*) AS count,
+            COUNT(*) FILTER (WHERE {ENTRY_DIRECTION}) AS entry,
+            COUNT(*) FILTER (WHERE {EXIT_DIRECTION}) AS exit
+        FROM parking
+        {ENHANCED_STATS_WHERE}
+        GROUP BY category
+    """,
+    # Events per %(bucket)s interval; bins are aligned to the Unix epoch (UTC).
+    "timeline": f"""
+        SELECT date_bin(%(bucket)s::interval, timestamp, TIMESTAMPTZ '1970-01-01 00:00:00+00') AS time,
+               COUNT(*) AS activity
+        FROM parking
+        {ENHANCED_STATS_WHERE}
+        GROUP BY 1
+        ORDER BY 1
+    """,
+    # Weekday x hour cells; the hourly trend and busiest hour are summed from them.
+    "heatmap": f"""
+        SELECT
+            EXTRACT(DOW FROM timestamp::TIMESTAMP) AS day_of_week,
+            EXTRACT(HOUR FROM timestamp::TIMESTAMP) AS hour,
+            COUNT(*) AS count
+        FROM parking
+        {ENHANCED_STATS_WHERE}
+        GROUP BY day_of_week, hour
+        ORDER BY day_of_week, hour
+    """,
+    # Gate and color counts by id, then named from their dimension tables.
+    "gates": f"""
+        SELECT g.name AS gate, s.count
+        FROM (SELECT gate_id, COUNT(*) AS count FROM parking {ENHANCED_STATS_WHERE} GROUP BY gate_id) s
+        LEFT JOIN parking_gates g ON g.id = s.gate_id
+    """,
+    "colors": f"""
+        SELECT c.name AS color, s.count
+        FROM (SELECT color_id, COUNT(*) AS count FROM parking {ENHANCED_STATS_WHERE} GROUP BY color_id) s
+        LEFT JOIN parking_colors c ON c.id = s.color_id
+    """,
+    "zones": f"SELECT zone::text AS zone, COUNT(*) AS count FROM parking {ENHANCED_STATS_WHERE} GROUP BY zone",
+    "days": f"""
+        SELECT DATE(timestamp) AS day, COUNT(*) AS count
+        FROM parking
+        {ENHANCED_STATS_WHERE}
+        GROUP BY day
+        ORDER BY day
+    """,
+}
+
+GMT_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+
+def parse_timestamp(timestamp_str):
+    """Parse GMT timestamp into a GMT-formatted string."""
+    try:
+        dt = datetime.strptime(timestamp_str, GMT_FORMAT)
+        return dt.strftime(GMT_FORMAT)
+    except ValueError:
+        raise ValueError(f"Unsupported timestamp format: {timestamp_str}")
+
+
+def enhanced_stats_period(start_date_str: Optional[str], end_date_str: Optional[str], time_range: str,
+                          now: Optional[datetime] = None) -> Tuple[str, str]:
+    """
+    The (start, end) GMT strings for /stats/enhanced-stats: the given dates,
+    else the current day/week/month for time_range, else the last 30 days.
+    """
+    # Current UTC time
+    now = now or datetime.utcnow()
+
+    # Parse dates or set defaults
+    start_date = parse_timestamp(start_date_str) if start_date_str else (now - timedelta(days=30)).strftime(GMT_FORMAT)
+    end_date = parse_timestamp(end_date_str) if end_date_str else now.strftime(GMT_FORMAT)
+
+    # Adjust dates based on time_range if no explicit dates provided
+    if not start_date_str and not end_date_str:
+        if time_range == 'today':
+            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0).strftime(GMT_FORMAT)
+            end_date = now.strftime(GMT_FORMAT)
+        elif time_range == 'week':
+            start_date = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0).strftime(GMT_FORMAT)
+            end_date = now.strftime(GMT_FORMAT)
+        elif time_range == 'month':
+            start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).strftime(GMT_FORMAT)
+            end_date = now.strftime(GMT_FORMAT)
+    return start_date, end_date
+
+
+# zone_activity_timeline resolutions (bucket=...), in seconds.
+TIMELINE_BUCKETS: Dict[str, int] = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400}
+# Widths bucket=auto picks from; longer ranges use whole days.
+AUTO_BUCKET_WIDTHS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400)
+TIMELINE_MAX_POINTS: int = int(os.environ.get("TIMELINE_MAX_POINTS", 500))
+# With LTTB downsampling, bucket=auto bins this much finer than max_points and
+# LTTB then keeps the points that preserve the shape of the curve.
+LTTB_OVERSAMPLING = 8
+
+
+def timeline_bucket_seconds(bucket: str, start_date: str, end_date: str,
+                            max_points: int = TIMELINE_MAX_POINTS, lttb: bool = False) -> int:
+    """
+    The zone_activity_timeline bin width for a bucket parameter ("auto", "1m",
+    "5m", "1h" or "1d") and a period given as GMT strings. "auto" picks the
+    finest width that keeps the timeline within max_points (times
+    LTTB_OVERSAMPLING when the result is downsampled afterwards).
+    """
+    if bucket != "auto":
+        return TIMELINE_BUCKETS[bucket]
+    span = (datetime.strptime(end_date, GMT_FORMAT) - datetime.strptime(start_date, GMT_FORMAT)).total_seconds()
+    # A span of n widths can touch n + 1 epoch-aligned bins.
+    points = max(max_points * (LTTB_OVERSAMPLING if lttb else 1) - 1, 1)
+    needed = span / points
+    for width in AUTO_BUCKET_WIDTHS:
+        if width >= needed:
+            return width
+    return math.ceil(needed / 86400) * 86400
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps when reducing
+    the series to `threshold` points (the first and last are always kept).
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket, the third corner of the triangle.
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+        best, best_area = -1, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def downsample_timeline(timeline: List[Dict[str, Any]], max_points: int) -> List[Dict[str, Any]]:
+    """Reduce a zone_activity_timeline to at most max_points points with LTTB."""
+    if len(timeline) <= max_points:
+        return timeline
+    xs = [datetime.strptime(point["time"], GMT_FORMAT).timestamp() for point in timeline]
+    ys = [point["activity"] for point in timeline]
+    return [timeline[i] for i in lttb(xs, ys, max_points)]
+
+
+def build_enhanced_stats(rows: Mapping[str, Sequence[Mapping[str, Any]]]) -> Dict[str, Any]:
+    """Assemble the `stats` object of /stats/enhanced-stats from the ENHANCED_STATS_SQL results."""
+    categories = rows["categories"]
+    hourly_trend: Dict[int, int] = {}
+    for row in rows["heatmap"]:
+        hour = int(row["hour"])
+        hourly_trend[hour] = hourly_trend.get(hour, 0) + row["count"]
+    hourly_trend = dict(sorted(hourly_trend.items()))
+    return {
+        "entry_exit_counts": {"entry": sum(row["entry"] for row in categories),
+                              "exit": sum(row["exit"] for row in categories)},
+        "zone_activity_timeline": [
+            {"time": row["time"].strftime(GMT_FORMAT) if isinstance(row["time"], datetime) else str(row["time"]),
+             "activity": row["activity"]}
+            for row in rows["timeline"]
+        ],
+        "total_events": sum(row["count"] for row in categories),
+        "busiest_hour": max(hourly_trend, key=hourly_trend.get) if hourly_trend else None,
+        "category_counts": category_counts(categories),
+        "gate_usage": {row["gate"]: row["count"] for row in rows["gates"]},
+        "hourly_trend": hourly_trend,
+        "color_distribution": {row["color"]: row["count"] for row in rows["colors"]},
+        "zone_counts": {row["zone"]: row["count"] for row in rows["zones"]},
+        "entry_exit_by_category": {row["category"]: {"entry": row["entry"], "exit": row["exit"]}
+                                   for row in categories},
+        "daily_trend": {str(row["day"]): row["count"] for row in rows["days"]},
+        "heatmap_data": [
+            {"day_of_week": int(row["day_of_week"]), "hour": int(row["hour"]), "count": row["count"]}
+            for row in rows["heatmap"]
+        ],
+    }
+
+
+def category_counts(rows: Sequence[Mapping[str, Any]]) -> Dict[str, int]:
+    """Counts per category from ENHANCED_STATS_SQL["categories"] rows."""
+    return {row["category"]: row["count"] for row in rows}
+
+
+def calculate_previous_period(start_date, end_date, time_range):
+    try:
+        start = datetime.strptime(start_date, GMT_FORMAT)
+        end = datetime.strptime(end_date, GMT_FORMAT)
+
+        if time_range == 'today':
+            delta = end - start
+            prev_start = start - delta
+            prev_end = end - delta
+        elif time_range == 'week':
+            prev_start = start - timedelta(weeks=1)
+            prev_end = end - timedelta(weeks=1)
+        elif time_range == 'month':
+            prev_start = start.replace(month=start.month-1 if start.month > 1 else 12, year=start.year-1 if start.month == 1 else start.year)
+            prev_end = end.replace(month=end.month-1 if end.month > 1 else 12, year=end.year-1 if end.month == 1 else end.year)
+        else:  # custom
+            delta = end - start
+            prev_start = start - delta
+            prev_end = end - delta
+
+        return prev_start.strftime(GMT_FORMAT), prev_end.strftime(GMT_FORMAT)
+    except ValueError as e:
+        logger.error(f"Date parsing error: {str(e)}")
+        now = datetime.utcnow()
+        default_start = now - timedelta(days=30)
+        return default_start.strftime(GMT_FORMAT), now.strftime(GMT_FORMAT)
+
+
+def calculate_percentage_changes(current_counts, previous_counts):
+    percentage_changes = {}
+    all_categories = set(list(current_counts.keys()) + list(previous_counts.keys()))
+
+    for category in all_categories:
+        current = current_counts.get(category, 0)
+        previous = previous_counts.get(category, 0)
+        if previous == 0:
+            change = 0 if current == 0 else 100
+        else:
+            change = ((current - previous) / previous) * 100
+        percentage_changes[category] = round(change, 2)
+
+    return percentage_changes
@@ -0,0 +1,84 @@
+# tabular.py
+"""
+Compact responses for the endpoints that return many rows (/data, /data1 and
+/stats/duration-stats in raw mode).
+
+By default these answer with a JSON array of objects, which repeats every
+column name on every row. With ?format=columnar they answer with
+
+    {"columns": ["insertion_id", "license_plate", ...],
+     "rows": [["a1b2", "KA01AB1234", ...], ...]}
+
+instead, built straight from the tuples of the cursor. A client that sends
+`Accept: application/vnd.apache.arrow.stream` gets the same table as an Arrow
+IPC stream; envelope fields such as /data1's paging go into the schema
+metadata. pyarrow is only imported when an Arrow response is asked for.
+"""
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+# Values of the `format` query parameter.
+RECORDS = "records"
+COLUMNAR = "columnar"
+RESPONSE_FORMATS = (RECORDS, COLUMNAR)
+
+# Chosen by the Accept header rather than by `format`.
+ARROW = "arrow"
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+
+class Table(NamedTuple):
+    """A result set as its column names and its row tuples."""
+    columns: List[str]
+    rows: List[Tuple[Any, ...]]
+
+    def records(self) -> List[Dict[str, Any]]:
+        """The rows as dicts, the shape of the default responses."""
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+    def add_records(self, records: Sequence[Mapping[str, Any]]) -> None:
+        """Append dict rows (e.g. from the Parquet archive); columns they lack are None."""
+        self.rows.extend(tuple(record.get(column) for column in self.columns) for record in records)
+
+    def columnar(self) -> Dict[str, Any]:
+        return {"columns": self.columns, "rows": [list(row) for row in self.rows]}
+
+
+def response_format(fmt: Optional[str], accept: Optional[str]) -> str:
+    """
+    RECORDS, COLUMNAR or ARROW for a request's `format` parameter and Accept
+    header. Raises ValueError for an unknown format.
+    """
+    fmt = (fmt or RECORDS).lower()
+    if fmt not in RESPONSE_FORMATS:
+        raise ValueError(f"Invalid format. Use one of: {', '.join(RESPONSE_FORMATS)}.")
+    media_types = {media_range.split(";")[0].strip().lower() for media_range in (accept or "").split(",")}
+    return ARROW if ARROW_STREAM_MIMETYPE in media_types else fmt
+
+
+def fetch_table(cur: Any) -> Table:
+    """The result of a tuple cursor's last execute."""
+    return Table([column[0] for column in cur.description], cur.fetchall())
+
+
+def _arrow_column(values: Sequence[Any]) -> Any:
+    import pyarrow as pa
+
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Types Arrow does not infer (UUID, mixed values) are sent as text, as in the JSON responses.
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+
+def arrow_stream(table: Table, metadata: Optional[Mapping[str, Any]] = None) -> bytes:
+    """The table as an Arrow IPC stream of one record batch; `metadata` values become strings."""
+    import pyarrow as pa
+
+    columns = list(zip(*table.rows)) or [()] * len(table.columns)
+    batch = pa.RecordBatch.from_arrays([_arrow_column(values) for values in columns], names=table.columns)
+    if metadata:
+        batch = batch.replace_schema_metadata({key: str(value) for key, value in metadata.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,162 @@
+# test_replicas.py
+"""
+Tests for the read routing of replicas.py.
+
+The pick() tests need no database. The LAG_SQL checks run against the
+primary given by the usual DB_* environment variables, and against a
+streaming standby when TEST_DB_REPLICA holds its libpq connection string
+("host=localhost port=5433"); each is skipped when its server is unreachable.
+
+    python -m pytest endpoint/test_replicas.py
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+import pytest
+
+from db import PooledConnection
+from replicas import LAG_SQL, Replica, ReplicaRouter, replica_settings
+
+
+def _unreachable(**settings: Any) -> PooledConnection:
+    raise psycopg2.OperationalError("connection refused")
+
+
+def replica(name: str, lag: Optional[float], healthy: bool = True) -> Replica:
+    r = Replica({"host": name}, _unreachable)
+    r.healthy = healthy
+    r.lag = lag
+    return r
+
+
+def router(*replicas: Replica, max_lag: float = 10) -> ReplicaRouter:
+    # Replicas are attached after construction, so no checker thread starts
+    # and overwrites the states the tests set.
+    r = ReplicaRouter(primary=None, max_lag=max_lag)  # type: ignore[arg-type]
+    r.replicas = list(replicas)
+    return r
+
+
+def picks(r: ReplicaRouter, n: int = 4, **kwargs: Any) -> List[Optional[str]]:
+    return [getattr(r.pick(**kwargs), "name", None) for _ in range(n)]
+
+
+def test_round_robin_over_replicas_within_the_lag_limit() -> None:
+    r = router(replica("a", 0.0), replica("b", 10.0), replica("c", 10.5))
+    assert picks(r) == ["a:5432", "b:5432", "a:5432", "b:5432"]
+
+
+def test_no_replica_within_the_limit_reads_from_the_primary() -> None:
+    r = router(replica("a", 11.0), replica("b", 60.0))
+    assert picks(r) == [None] * 4
+
+
+def test_max_lag_tightens_the_limit() -> None:
+    r = router(replica("a", 0.5), replica("b", 3.0))
+    assert picks(r, max_lag=1) == ["a:5432"] * 4
+    assert picks(r, max_lag=0.1) == [None] * 4
+
+
+def test_max_lag_cannot_loosen_the_limit() -> None:
+    r = router(replica("a", 30.0), max_lag=10)
+    assert picks(r, max_lag=60) == [None] * 4
+
+
+def test_fresh_reads_from_the_primary() -> None:
+    r = router(replica("a", 0.0))
+    assert picks(r, fresh=True) == [None] * 4
+
+
+def test_replica_marked_down_is_skipped() -> None:
+    a, b = replica("a", 0.0), replica("b", 0.0)
+    r = router(a, b)
+    a.mark_down(psycopg2.OperationalError("server closed the connection"))
+    assert (a.healthy, a.lag) == (False, None)
+    assert picks(r) == ["b:5432"] * 4
+
+
+def test_unknown_lag_is_skipped() -> None:
+    r = router(replica("a", None), replica("b", 2.0))
+    assert picks(r) == ["b:5432"] * 4
+    assert picks(router(replica("a", None))) == [None] * 4
+
+
+class FakePool:
+    def __init__(self, conn: Any = None, error: Optional[Exception] = None) -> None:
+        self.conn = conn
+        self.error = error
+
+    def getconn(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.conn
+
+    def closeall(self) -> None:
+        pass
+
+
+def test_getconn_falls_back_to_the_primary_when_the_replica_refuses() -> None:
+    a = replica("a", 0.0)
+    a.pool = FakePool(error=psycopg2.OperationalError("connection refused"))  # type: ignore[assignment]
+    r = router(a)
+    r.primary = FakePool("primary")  # type: ignore[assignment]
+    assert r.getconn() == "primary"
+    assert not a.healthy
+    assert r.getconn(fresh=True) == "primary"
+
+
+# ---- LAG_SQL against real servers --------------------------------------
+
+def primary_settings() -> Dict[str, Any]:
+    return {
+        "dbname": os.environ.get("DB_NAME", "flow"),
+        "user": os.environ.get("DB_USER", "postgres"),
+        "password": os.environ.get("DB_PASSWORD"),
+        "host": os.environ.get("DB_HOST", "db"),
+        "port": os.environ.get("DB_PORT", 5432),
+    }
+
+
+def connect(**settings: Any) -> PooledConnection:
+    return psycopg2.connect(connection_factory=PooledConnection, connect_timeout=3, **settings)
+
+
+def lag_of(settings: Dict[str, Any]) -> Any:
+    try:
+        conn = connect(**settings)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"server not reachable: {e}")
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(LAG_SQL)
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_lag_sql_on_the_primary_is_zero() -> None:
+    assert lag_of(primary_settings()) == 0
+
+
+@pytest.mark.skipif(not os.environ.get("TEST_DB_REPLICA"), reason="TEST_DB_REPLICA is not set")
+def test_lag_sql_on_a_standby() -> None:
+    settings = replica_settings(os.environ["TEST_DB_REPLICA"], primary_settings())[0]
+    lag = lag_of(settings)
+    with connect(**settings) as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_is_in_recovery(), (SELECT status FROM pg_stat_wal_receiver)")
+        in_recovery, status = cur.fetchone()
+    conn.close()
+    assert in_recovery, "TEST_DB_REPLICA is not a standby"
+    if status == "streaming":
+        # Caught up (0) or behind by the age of its last replayed transaction.
+        assert lag is None or lag >= 0
+    else:
+        # Disconnected: never 0 once anything was replayed, however idle the primary.
+        assert lag is None or lag > 0
+
+    r = Replica(settings, connect)
+    r.check()
+    assert r.healthy
+    assert r.lag == (None if lag is None else pytest.approx(float(lag), abs=5))
@@ -97,6 +97,15 @@ def safe_serialize(obj):
         return obj.isoformat()
     return obj
 
+def direction_mask(df, direction):
+    """
+    Rows of one direction ('in' or 'out'): the direction column stored at ingest
+    when the export has it, else the gate name suffix of older exports.
+    """
+    if 'direction' in df.columns:
+        return df['direction'].eq(direction)
+    return df['gate'].str.endswith(f'_{direction}', na=False)
+
 def merge_entries_exits(df):
     """
     Optimized merge of entry and exit records with robust null handling.
@@ -107,9 +116,9 @@ def merge_entries_exits(df):
     df['datetime_utc'] = pd.to_datetime(df['timestamp'], utc=True, errors='coerce')
     df = df.dropna(subset=['datetime_utc'])
     
-    # Separate entries and exits based on the gate suffix
-    mask_in = df['gate'].str.endswith('_in', na=False)
-    mask_out = df['gate'].str.endswith('_out', na=False)
+    # Separate entries and exits by direction
+    mask_in = direction_mask(df, 'in')
+    mask_out = direction_mask(df, 'out')
     
     entries = df[mask_in].copy()
     exits = df[mask_out].copy()
@@ -463,7 +472,7 @@ async def get_enhanced_stats(
     # Add new stats calculations
     entry_exit_by_category = (
         filtered_df
-        .assign(entry_type=lambda df: df['gate'].str.contains('_in').map({True: 'entry', False: 'exit'}))
+        .assign(entry_type=lambda df: direction_mask(df, 'in').map({True: 'entry', False: 'exit'}))
         .groupby(['category', 'entry_type'])
         .size()
         .unstack(fill_value=0)
@@ -506,8 +515,8 @@ async def get_enhanced_stats(
     # Build the stats dictionary
     stats = {
         "entry_exit_counts": {
-            "entry": filtered_df[filtered_df['gate'].str.contains('_in', case=False)].shape[0],
-            "exit": filtered_df[filtered_df['gate'].str.contains('_out', case=False)].shape[0]
+            "entry": filtered_df[direction_mask(filtered_df, 'in')].shape[0],
+            "exit": filtered_df[direction_mask(filtered_df, 'out')].shape[0]
         },
         "zone_activity_timeline": zone_activity_timeline,
         "total_events": len(filtered_df),
@@ -574,12 +583,12 @@ async def get_recent_entries():
     if pd.api.types.is_datetime64_any_dtype(df['datetime_utc']):
         recent_entries = df[
             (df['datetime_utc'] >= ten_minutes_ago) &
-            (df['gate'].str.contains('_in'))
+            (direction_mask(df, 'in'))
         ]
     else:
         # Fallback if datetime conversion failed
         print("Warning: Using timestamp string comparison for recent entries")
-        recent_entries = df[df['gate'].str.contains('_in')]
+        recent_entries = df[direction_mask(df, 'in')]
     
     return {"count": len(recent_entries)}
 
@@ -591,12 +600,12 @@ async def get_recent_exits():
     if pd.api.types.is_datetime64_any_dtype(df['datetime_utc']):
         recent_exits = df[
             (df['datetime_utc'] >= ten_minutes_ago) &
-            (df['gate'].str.contains('_out'))
+            (direction_mask(df, 'out'))
         ]
     else:
         # Fallback if datetime conversion failed
         print("Warning: Using timestamp string comparison for recent exits")
-        recent_exits = df[df['gate'].str.contains('_out')]
+        recent_exits = df[direction_mask(df, 'out')]
     
     return {"count": len(recent_exits)}
 
@@ -737,13 +746,13 @@ async def get_today_entries():
     if pd.api.types.is_datetime64_any_dtype(df['datetime_utc']):
         today_entries = df[
             (df['datetime_utc'].dt.date == today_utc) &
-            (df['gate'].str.contains('_in'))
+            (direction_mask(df, 'in'))
         ]
     else:
         today_str = today_utc.strftime('%Y-%m-%d')
         today_entries = df[
             (df['timestamp'].str.startswith(today_str)) &
-            (df['gate'].str.contains('_in'))
+            (direction_mask(df, 'in'))
         ]
     
     return {"count": len(today_entries)}
@@ -756,13 +765,13 @@ async def get_today_exits():
     if pd.api.types.is_datetime64_any_dtype(df['datetime_utc']):
         today_exits = df[
             (df['datetime_utc'].dt.date == today_utc) &
-            (df['gate'].str.contains('_out'))
+            (direction_mask(df, 'out'))
         ]
     else:
         today_str = today_utc.strftime('%Y-%m-%d')
         today_exits = df[
             (df['timestamp'].str.startswith(today_str)) &
-            (df['gate'].str.contains('_out'))
+            (direction_mask(df, 'out'))
         ]
     
     return {"count": len(today_exits)}
@@ -931,23 +940,23 @@ async def get_trends():
     # Calculate today's counts
     today_entries = df[
         (df['datetime_utc'].dt.date == today) &
-        (df['gate'].str.contains('_in'))
+        (direction_mask(df, 'in'))
     ].shape[0]
     
     today_exits = df[
         (df['datetime_utc'].dt.date == today) &
-        (df['gate'].str.contains('_out'))
+        (direction_mask(df, 'out'))
     ].shape[0]
     
     # Calculate yesterday's counts
     yesterday_entries = df[
         (df['datetime_utc'].dt.date == yesterday) &
-        (df['gate'].str.contains('_in'))
+        (direction_mask(df, 'in'))
     ].shape[0]
     
     yesterday_exits = df[
         (df['datetime_utc'].dt.date == yesterday) &
-        (df['gate'].str.contains('_out'))
+        (direction_mask(df, 'out'))
     ].shape[0]
     
     # Calculate percentage changes
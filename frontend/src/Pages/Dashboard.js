@@ -31,26 +31,29 @@ function Dashboard() {
 
     const navigate = useNavigate();
 
+    const showParkingData = (result) => {
+        const dataArray = Array.isArray(result) ? result : (result.data || []);
+
+        if (!dataArray.length) {
+            console.warn('Received empty data array');
+            setParkingData([]);
+            setTotalPages(0);
+            return;
+        }
+
+        const sortedData = dataArray.sort((a, b) => {
+            const dateA = new Date(a.timestamp);
+            const dateB = new Date(b.timestamp);
+            return dateB - dateA;
+        });
+        setParkingData(sortedData);
+        setTotalPages(result.total_pages || 1);
+    };
+
     const fetchData = async (page, search = '') => {
         setIsLoading(true);
         try {
-            const result = await parkingService.getParkingDataDashboard(page, 10, search);
-            const dataArray = Array.isArray(result) ? result : (result.data || []);
-
-            if (!dataArray.length) {
-                console.warn('Received empty data array');
-                setParkingData([]);
-                setTotalPages(0);
-                return;
-            }
-
-            const sortedData = dataArray.sort((a, b) => {
-                const dateA = new Date(a.timestamp);
-                const dateB = new Date(b.timestamp);
-                return dateB - dateA;
-            });
-            setParkingData(sortedData);
-            setTotalPages(result.total_pages || 1);
+            showParkingData(await parkingService.getParkingDataDashboard(page, 10, search));
         } catch (error) {
             console.error('Error in component:', error);
             setParkingData([]);
@@ -59,21 +62,27 @@ function Dashboard() {
         setIsLoading(false);
     };
 
-    const fetchStatistics = async () => {
-        try {
-            const entriesRes = await parkingService.getTodayEntries();
-            const exitsRes = await parkingService.getTodayExits();
-            setEnteredCount(entriesRes.count);
-            setExitedCount(exitsRes.count);
-        } catch (error) {
-            console.error('Error fetching statistics:', error);
-        }
+    const calculateTrend = (todayCount, yesterdayCount) => {
+        if (yesterdayCount === 0) return '0%';
+        const change = todayCount - yesterdayCount;
+        const percentage = ((change / yesterdayCount) * 100).toFixed(0);
+        return `${change >= 0 ? '+' : ''}${percentage}%`;
     };
 
-    // Combined fetch function for periodic refresh
+    // Periodic refresh: table page, counters and trends in one request
     const fetchAllData = async () => {
-        await fetchData(1, ''); // Fetch recent vehicle activity (page 1, no search)
-        await fetchStatistics(); // Fetch stats
+        try {
+            const summary = await parkingService.getDashboardSummary(1, 10); // page 1, no search
+            showParkingData(summary.data);
+            setEnteredCount(summary.today_entries.count);
+            setExitedCount(summary.today_exits.count);
+            setTrends({
+                entry_trend: calculateTrend(summary.trends.todays_entries.count, summary.trends.yesterdays_entries.count),
+                exit_trend: calculateTrend(summary.trends.todays_exits.count, summary.trends.yesterdays_exits.count)
+            });
+        } catch (error) {
+            console.error('Error fetching dashboard summary:', error);
+        }
     };
 
     // Initial fetch on mount and when currentPage/searchTerm changes
@@ -92,11 +101,6 @@ function Dashboard() {
         }
     }, [searchTerm]);
 
-    // Initial stats fetch on mount
-    useEffect(() => {
-        fetchStatistics();
-    }, []);
-
     const calculateStats = (data) => {
         const categories = {};
         const hourCounts = {};
@@ -134,31 +138,6 @@ function Dashboard() {
         calculateStats(parkingData);
     }, [parkingData, enteredCount, exitedCount]);
 
-    useEffect(() => {
-        const fetchTrends = async () => {
-            try {
-                const response = await parkingService.getTrends();
-                const entryTrend = calculateTrend(response.todays_entries.count, response.yesterdays_entries.count);
-                const exitTrend = calculateTrend(response.todays_exits.count, response.yesterdays_exits.count);
-                setTrends({
-                    entry_trend: entryTrend,
-                    exit_trend: exitTrend
-                });
-            } catch (error) {
-                console.error('Error fetching trends:', error);
-            }
-        };
-
-        const calculateTrend = (todayCount, yesterdayCount) => {
-            if (yesterdayCount === 0) return '0%';
-            const change = todayCount - yesterdayCount;
-            const percentage = ((change / yesterdayCount) * 100).toFixed(0);
-            return `${change >= 0 ? '+' : ''}${percentage}%`;
-        };
-
-        fetchTrends();
-    }, []);
-
     const handleSearch = (event) => {
         setSearchTerm(event.target.value);
         setCurrentPage(1);
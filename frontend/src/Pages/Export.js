@@ -7,6 +7,7 @@ const Export = () => {
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [showFiltersModal, setShowFiltersModal] = useState(false);
   const [recordCount, setRecordCount] = useState(0);
+  const [recordCountExact, setRecordCountExact] = useState(true);
   const [exportTab, setExportTab] = useState('Full Database');
   const [fileFormat, setFileFormat] = useState('.csv');
   const [fileName, setFileName] = useState('');
@@ -33,16 +34,15 @@ const Export = () => {
     setIsLoading(true);
     setError(null);
     try {
-      const response = await axios.get('/api/data1', {
+      const response = await axios.get('/api/count', {
         params: {
           ...convertFiltersToParams(filterOptions),
-          page: 1,
-          page_size: 1,
-          export_type: exportTab,
+          scope: 'export',
           search: filterOptions.search || '',
         },
       });
-      setRecordCount(response.data.total_records || 0);
+      setRecordCount(response.data.count || 0);
+      setRecordCountExact(response.data.exact !== false);
     } catch (error) {
       console.error('Error fetching record count:', error);
       setError('Failed to fetch record count');
@@ -105,21 +105,26 @@ const Export = () => {
     setIsLoading(true);
     setError(null);
     try {
-      const exportResponse = await axios.get('/api/export', {
-        params: {
-          ...convertFiltersToParams(filterOptions),
-          file_format: fileFormat.replace('.', ''),
-          export_type: exportTab,
-          file_name: fileName || `export_${new Date().toISOString().replace(/[:.]/g, '-')}`,
-        },
+      // Queue the export as a background job and poll until the file is ready
+      const { data: queuedJob } = await axios.post('/api/exports', {
+        ...convertFiltersToParams(filterOptions),
+        file_format: fileFormat.replace('.', ''),
+      });
+      let job = queuedJob;
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = (await axios.get(`/api/exports/${job.id}`)).data;
+      }
+      if (job.status !== 'done') {
+        throw new Error(job.error || 'Export job failed');
+      }
+
+      const exportResponse = await axios.get(`/api/exports/${job.id}/download`, {
         responseType: 'blob',
       });
   
       const blob = new Blob([exportResponse.data], {
-        type:
-          fileFormat === '.csv'
-            ? 'text/csv'
-            : 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        type: exportResponse.headers['content-type'],
       });
   
       const url = window.URL.createObjectURL(blob);
@@ -137,6 +142,7 @@ const Export = () => {
         const logResponse = await axios.post('/api/log-export', {
           fileName: fileName || 'export',
           format: fileFormat,
+          jobId: job.id,
           exportType: exportTab,
           filters: filterOptions,
           recordCount,
@@ -161,15 +167,15 @@ const Export = () => {
 
   const handleLogDownload = async (log) => {
     try {
-      const response = await axios.get(`/api/download-export/${log.id}`, {
+      const downloadUrl = log.jobId
+        ? `/api/exports/${log.jobId}/download`
+        : `/api/download-export/${log.id}`;
+      const response = await axios.get(downloadUrl, {
         responseType: 'blob',
       });
 
       const blob = new Blob([response.data], {
-        type:
-          log.format === '.csv'
-            ? 'text/csv'
-            : 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        type: response.headers['content-type'],
       });
 
       const url = window.URL.createObjectURL(blob);
@@ -353,7 +359,7 @@ const Export = () => {
 
             <div className="modal-content">
               <div className="record-count">
-                <span>No. of Records: {recordCount}</span>
+                <span>No. of Records: {recordCountExact ? '' : '~'}{recordCount}</span>
                 {isLoading && <span className="loading">Loading...</span>}
               </div>
               {error && <div className="error">{error}</div>}
@@ -377,6 +383,8 @@ const Export = () => {
                 >
                   <option value=".xlsx">.xlsx</option>
                   <option value=".csv">.csv</option>
+                  <option value=".parquet">.parquet</option>
+                  <option value=".arrow">.arrow</option>
                 </select>
               </div>
             </div>
@@ -61,6 +61,29 @@ class ParkingService {
     }
   }
 
+  // Dashboard table page plus today's counters and trends in one request
+  async getDashboardSummary(
+    page,
+    pageSize = 10,
+    searchTerm = "",
+  ) {
+    try {
+      const queryParams = new URLSearchParams({
+        page: page,
+        page_size: pageSize,
+        ...(searchTerm && { search: searchTerm }),
+      });
+
+      const response = await fetch(`/api/dashboard/summary?${queryParams}`);
+      if (!response.ok)
+        throw new Error(`HTTP error! status: ${response.status}`);
+      return await response.json();
+    } catch (error) {
+      console.error("Error fetching dashboard summary:", error);
+      throw error;
+    }
+  }
+
   // Get specific parking record by ID
   async getParkingRecordById(id) {
     try {
@@ -0,0 +1,3 @@
+-- Range scans on timestamp for the stats endpoints, /data and /export.
+-- Built concurrently so the ingester can keep writing while it is created.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS parking_timestamp_idx ON parking (timestamp);
@@ -0,0 +1,5 @@
+-- Prefix matches on license_plate (the license_prefix filter compiles to
+-- license_plate LIKE 'MH%'). text_pattern_ops makes LIKE prefixes indexable
+-- regardless of the database collation.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS parking_license_plate_prefix_idx
+    ON parking (license_plate text_pattern_ops);
@@ -0,0 +1,72 @@
+-- Distinct category/color/gate values with their row counts, for the
+-- /filters/* endpoints. Kept up to date by statement-level triggers on
+-- parking, so every writer (the webhook ingester, bulk loads, retention
+-- deletes) maintains it and the endpoints never scan parking itself.
+-- Each statement also sends NOTIFY parking_dimensions so the endpoint can
+-- drop its in-process copy.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS parking_dimension_counts (
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count BIGINT NOT NULL,
+    PRIMARY KEY (dimension, value)
+);
+
+-- One function serves both triggers; PL/pgSQL only plans the branch that
+-- runs, so each branch can name its own transition table. Rows are upserted
+-- in key order so concurrent ingest transactions lock them consistently.
+CREATE OR REPLACE FUNCTION parking_dimension_counts_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO parking_dimension_counts AS d (dimension, value, count)
+        SELECT dim.dimension, dim.value, -COUNT(*)
+        FROM old_rows r
+        CROSS JOIN LATERAL (VALUES ('category', r.category), ('color', r.color), ('gate', r.gate))
+            AS dim (dimension, value)
+        WHERE dim.value IS NOT NULL
+        GROUP BY dim.dimension, dim.value
+        ORDER BY dim.dimension, dim.value
+        ON CONFLICT (dimension, value) DO UPDATE SET count = d.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO parking_dimension_counts AS d (dimension, value, count)
+        SELECT dim.dimension, dim.value, COUNT(*)
+        FROM new_rows r
+        CROSS JOIN LATERAL (VALUES ('category', r.category), ('color', r.color), ('gate', r.gate))
+            AS dim (dimension, value)
+        WHERE dim.value IS NOT NULL
+        GROUP BY dim.dimension, dim.value
+        ORDER BY dim.dimension, dim.value
+        ON CONFLICT (dimension, value) DO UPDATE SET count = d.count + EXCLUDED.count;
+    END IF;
+    PERFORM pg_notify('parking_dimensions', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Block writers while the triggers are installed and the table is backfilled,
+-- so no row is counted twice or missed.
+LOCK TABLE parking IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS parking_dimension_counts_insert ON parking;
+CREATE TRIGGER parking_dimension_counts_insert
+    AFTER INSERT ON parking
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION parking_dimension_counts_apply();
+
+DROP TRIGGER IF EXISTS parking_dimension_counts_delete ON parking;
+CREATE TRIGGER parking_dimension_counts_delete
+    AFTER DELETE ON parking
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION parking_dimension_counts_apply();
+
+TRUNCATE parking_dimension_counts;
+INSERT INTO parking_dimension_counts (dimension, value, count)
+SELECT dim.dimension, dim.value, COUNT(*)
+FROM parking p
+CROSS JOIN LATERAL (VALUES ('category', p.category), ('color', p.color), ('gate', p.gate))
+    AS dim (dimension, value)
+WHERE dim.value IS NOT NULL
+GROUP BY dim.dimension, dim.value;
+
+COMMIT;
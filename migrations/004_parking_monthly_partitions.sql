@@ -0,0 +1,158 @@
+-- Convert parking into a table range-partitioned by month on timestamp.
+--
+-- Months are UTC calendar months, partitions are named parking_pYYYY_MM and
+-- rows outside every partition land in parking_default. The existing rows are copied into the new partitions in a
+-- single transaction, so stop the webhook ingester while this runs.
+--
+-- A partitioned table's primary key has to include the partition key, so the
+-- key becomes (insertion_id, timestamp), which also makes timestamp NOT NULL.
+--
+-- Maintenance afterwards is one call, made periodically by the ingester:
+--   SELECT parking_maintain_partitions(months_ahead, retention_months);
+-- It creates the partitions for the coming months and, when retention_months
+-- is > 0, detaches partitions that ended more than retention_months ago into
+-- the `archive` schema (no DELETEs).
+BEGIN;
+
+LOCK TABLE parking IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE parking RENAME TO parking_unpartitioned;
+DROP TRIGGER IF EXISTS parking_dimension_counts_insert ON parking_unpartitioned;
+DROP TRIGGER IF EXISTS parking_dimension_counts_delete ON parking_unpartitioned;
+ALTER INDEX IF EXISTS parking_pkey RENAME TO parking_unpartitioned_pkey;
+ALTER INDEX IF EXISTS parking_timestamp_idx RENAME TO parking_unpartitioned_timestamp_idx;
+ALTER INDEX IF EXISTS parking_license_plate_prefix_idx RENAME TO parking_unpartitioned_license_plate_prefix_idx;
+
+CREATE TABLE parking (
+    insertion_id TEXT NOT NULL,
+    license_plate TEXT,
+    category TEXT,
+    color TEXT,
+    timestamp TIMESTAMP WITH TIME ZONE,
+    gate TEXT,
+    zone TEXT,
+    description TEXT
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE parking_default PARTITION OF parking DEFAULT;
+
+CREATE SCHEMA IF NOT EXISTS archive;
+
+-- Create the partition for the month containing month_start (idempotent).
+-- Rows for that month that already sit in parking_default are moved into it
+-- first, since a partition cannot be attached while the default partition
+-- still holds rows in its range.
+CREATE OR REPLACE FUNCTION parking_create_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month_start)::date;
+    name TEXT := format('parking_p%s', to_char(first_day, 'YYYY_MM'));
+    lower_bound TIMESTAMPTZ := first_day::timestamp AT TIME ZONE 'UTC';
+    upper_bound TIMESTAMPTZ := (first_day + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC';
+BEGIN
+    IF to_regclass(format('public.%I', name)) IS NOT NULL THEN
+        RETURN name;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE parking INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM parking_default WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved', lower_bound, upper_bound, name);
+    EXECUTE format('ALTER TABLE parking ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   name, lower_bound, upper_bound);
+    RETURN name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detach partitions whose month ended more than retention_months ago and move
+-- them to the archive schema. Their rows are subtracted from
+-- parking_dimension_counts, since detaching does not fire DELETE triggers.
+CREATE OR REPLACE FUNCTION parking_detach_expired_partitions(retention_months INTEGER)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    cutoff TIMESTAMPTZ := (date_trunc('month', now() AT TIME ZONE 'UTC')
+                           - make_interval(months => retention_months)) AT TIME ZONE 'UTC';
+    part RECORD;
+BEGIN
+    FOR part IN
+        SELECT c.relname AS name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'parking'::regclass
+          AND c.relname ~ '^parking_p[0-9]{4}_[0-9]{2}$'
+          AND (to_date(substr(c.relname, 10), 'YYYY_MM') + INTERVAL '1 month')::timestamp
+              AT TIME ZONE 'UTC' <= cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format($sql$
+            INSERT INTO parking_dimension_counts AS d (dimension, value, count)
+            SELECT dim.dimension, dim.value, -COUNT(*)
+            FROM %I r
+            CROSS JOIN LATERAL (VALUES ('category', r.category), ('color', r.color), ('gate', r.gate))
+                AS dim (dimension, value)
+            WHERE dim.value IS NOT NULL
+            GROUP BY dim.dimension, dim.value
+            ORDER BY dim.dimension, dim.value
+            ON CONFLICT (dimension, value) DO UPDATE SET count = d.count + EXCLUDED.count
+        $sql$, part.name);
+        EXECUTE format('ALTER TABLE parking DETACH PARTITION %I', part.name);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archive', part.name);
+        PERFORM pg_notify('parking_dimensions', 'DETACH');
+        RETURN NEXT part.name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Periodic maintenance: partitions for this month and the next months_ahead
+-- months, then retention (skipped when retention_months <= 0). Serialised with
+-- an advisory lock so concurrent callers do not race.
+CREATE OR REPLACE FUNCTION parking_maintain_partitions(months_ahead INTEGER DEFAULT 3,
+                                                       retention_months INTEGER DEFAULT 0)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    this_month DATE := date_trunc('month', now() AT TIME ZONE 'UTC')::date;
+    i INTEGER;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('parking_maintain_partitions'));
+    FOR i IN 0..months_ahead LOOP
+        PERFORM parking_create_partition((this_month + make_interval(months => i))::date);
+    END LOOP;
+    IF retention_months > 0 THEN
+        RETURN QUERY SELECT format('archive.%s', name)
+                     FROM parking_detach_expired_partitions(retention_months) AS name;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for every month that has data, plus the coming months.
+DO $$
+BEGIN
+    PERFORM parking_create_partition(month::date)
+    FROM generate_series(
+        date_trunc('month', (SELECT MIN(timestamp) FROM parking_unpartitioned) AT TIME ZONE 'UTC'),
+        date_trunc('month', (SELECT MAX(timestamp) FROM parking_unpartitioned) AT TIME ZONE 'UTC'),
+        INTERVAL '1 month'
+    ) AS month;
+    PERFORM parking_maintain_partitions(3, 0);
+END;
+$$;
+
+INSERT INTO parking SELECT * FROM parking_unpartitioned;
+DROP TABLE parking_unpartitioned;
+
+-- Indexes on the parent are created on every current and future partition.
+ALTER TABLE parking ADD PRIMARY KEY (insertion_id, timestamp);
+CREATE INDEX parking_timestamp_idx ON parking (timestamp);
+CREATE INDEX parking_license_plate_prefix_idx ON parking (license_plate text_pattern_ops);
+
+-- Re-create the dimension count triggers (migration 003) on the new table.
+CREATE TRIGGER parking_dimension_counts_insert
+    AFTER INSERT ON parking
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION parking_dimension_counts_apply();
+CREATE TRIGGER parking_dimension_counts_delete
+    AFTER DELETE ON parking
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION parking_dimension_counts_apply();
+
+COMMIT;
+
+ANALYZE parking;
@@ -0,0 +1,40 @@
+-- Explicit entry/exit direction and vehicle class on every parking row.
+--
+-- Direction used to be inferred from the gate name suffix (gate LIKE '%\_in'),
+-- which no index can serve and which breaks for gates named differently. The
+-- webhook ingester now sets both columns from its gate registry
+-- (backend/gates.json); this migration fills them in for the existing rows
+-- from the old naming convention, ganajan_<vehicle_class>_<in|out>.
+--
+-- The backfill rewrites every row, so stop the webhook ingester while it runs
+-- and expect the table to need the VACUUM at the end.
+BEGIN;
+
+DO $$
+BEGIN
+    CREATE TYPE parking_direction AS ENUM ('in', 'out');
+EXCEPTION WHEN duplicate_object THEN
+    NULL;
+END;
+$$;
+
+ALTER TABLE parking
+    ADD COLUMN IF NOT EXISTS direction parking_direction,
+    ADD COLUMN IF NOT EXISTS vehicle_class TEXT;
+
+UPDATE parking
+SET direction = CASE
+        WHEN gate LIKE '%\_in' THEN 'in'::parking_direction
+        WHEN gate LIKE '%\_out' THEN 'out'::parking_direction
+    END,
+    vehicle_class = substring(gate FROM '([^_]+)_(?:in|out)$')
+WHERE direction IS NULL;
+
+COMMIT;
+
+-- Entry/exit counts over a time range (today's entries, /data1's entries and
+-- exits) read just the rows of one direction. A partitioned table cannot be
+-- indexed CONCURRENTLY; the index is built on every partition in turn.
+CREATE INDEX IF NOT EXISTS parking_direction_timestamp_idx ON parking (direction, timestamp);
+
+VACUUM (ANALYZE) parking;
@@ -0,0 +1,188 @@
+-- Pedestrian detections move out of parking into parking_detections.
+--
+-- Pedestrians are most of what the cameras report, yet nearly every query
+-- filters them out (category != 'pedestrian'). The webhook ingester now
+-- writes them to parking_detections, partitioned by month like parking, so
+-- the vehicle queries (exports, /data1, /dashboard/data, the analytics and
+-- today's vehicle counts) scan and index vehicle rows only. CHECK
+-- constraints on both tables let the planner skip the table a category
+-- filter rules out.
+--
+-- Queries over every event (/data, /count, /test, the category and duration
+-- statistics) read the parking_events view, the UNION ALL of both tables.
+-- The dashboard's entry/exit totals count pedestrians from parking_footfall,
+-- entries and exits per 15 minutes, which a statement trigger keeps up to
+-- date. Detaching expired partitions does not fire it, so the footfall of
+-- months moved to the `archive` schema is kept.
+--
+-- The existing pedestrian rows are moved in one transaction, so stop the
+-- webhook ingester while this runs.
+BEGIN;
+
+LOCK TABLE parking IN ACCESS EXCLUSIVE MODE;
+
+CREATE TABLE IF NOT EXISTS parking_detections (LIKE parking INCLUDING DEFAULTS)
+    PARTITION BY RANGE (timestamp);
+CREATE TABLE IF NOT EXISTS parking_detections_default PARTITION OF parking_detections DEFAULT;
+
+CREATE TABLE IF NOT EXISTS parking_footfall (
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    category TEXT NOT NULL,
+    direction parking_direction NOT NULL,
+    count BIGINT NOT NULL,
+    PRIMARY KEY (bucket, category, direction)
+);
+
+-- Entries and exits per 15-minute bucket, which any site's midnight falls on.
+-- Same shape as parking_dimension_counts_apply (migration 003).
+CREATE OR REPLACE FUNCTION parking_footfall_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO parking_footfall AS f (bucket, category, direction, count)
+        SELECT date_bin('15 minutes', r.timestamp, TIMESTAMPTZ '2000-01-01 00:00:00+00'),
+               r.category, r.direction, -COUNT(*)
+        FROM old_rows r
+        WHERE r.category IS NOT NULL AND r.direction IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (bucket, category, direction) DO UPDATE SET count = f.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO parking_footfall AS f (bucket, category, direction, count)
+        SELECT date_bin('15 minutes', r.timestamp, TIMESTAMPTZ '2000-01-01 00:00:00+00'),
+               r.category, r.direction, COUNT(*)
+        FROM new_rows r
+        WHERE r.category IS NOT NULL AND r.direction IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (bucket, category, direction) DO UPDATE SET count = f.count + EXCLUDED.count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS parking_footfall_insert ON parking_detections;
+CREATE TRIGGER parking_footfall_insert
+    AFTER INSERT ON parking_detections
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION parking_footfall_apply();
+DROP TRIGGER IF EXISTS parking_footfall_delete ON parking_detections;
+CREATE TRIGGER parking_footfall_delete
+    AFTER DELETE ON parking_detections
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION parking_footfall_apply();
+
+-- The filter options (migration 003) keep counting pedestrians.
+DROP TRIGGER IF EXISTS parking_dimension_counts_insert ON parking_detections;
+CREATE TRIGGER parking_dimension_counts_insert
+    AFTER INSERT ON parking_detections
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION parking_dimension_counts_apply();
+DROP TRIGGER IF EXISTS parking_dimension_counts_delete ON parking_detections;
+CREATE TRIGGER parking_dimension_counts_delete
+    AFTER DELETE ON parking_detections
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION parking_dimension_counts_apply();
+
+-- Monthly partitions of either table (parking_pYYYY_MM,
+-- parking_detections_pYYYY_MM), as parking_create_partition did for parking
+-- alone in migration 004.
+CREATE OR REPLACE FUNCTION parking_create_table_partition(parent TEXT, month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month_start)::date;
+    name TEXT := format('%s_p%s', parent, to_char(first_day, 'YYYY_MM'));
+    lower_bound TIMESTAMPTZ := first_day::timestamp AT TIME ZONE 'UTC';
+    upper_bound TIMESTAMPTZ := (first_day + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC';
+BEGIN
+    IF to_regclass(format('public.%I', name)) IS NOT NULL THEN
+        RETURN name;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', name, parent);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved', parent || '_default', lower_bound, upper_bound, name);
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent, name, lower_bound, upper_bound);
+    RETURN name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The partition of parking for the month (returned) and of parking_detections.
+CREATE OR REPLACE FUNCTION parking_create_partition(month_start DATE) RETURNS TEXT AS $$
+BEGIN
+    PERFORM parking_create_table_partition('parking_detections', month_start);
+    RETURN parking_create_table_partition('parking', month_start);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Migration 004's retention, for the partitions of both tables.
+CREATE OR REPLACE FUNCTION parking_detach_expired_partitions(retention_months INTEGER)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    cutoff TIMESTAMPTZ := (date_trunc('month', now() AT TIME ZONE 'UTC')
+                           - make_interval(months => retention_months)) AT TIME ZONE 'UTC';
+    part RECORD;
+BEGIN
+    FOR part IN
+        SELECT c.relname AS name, i.inhparent::regclass::text AS parent
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent IN ('parking'::regclass, 'parking_detections'::regclass)
+          AND c.relname ~ '^parking_(detections_)?p[0-9]{4}_[0-9]{2}$'
+          AND (to_date(right(c.relname, 7), 'YYYY_MM') + INTERVAL '1 month')::timestamp
+              AT TIME ZONE 'UTC' <= cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format($sql$
+            INSERT INTO parking_dimension_counts AS d (dimension, value, count)
+            SELECT dim.dimension, dim.value, -COUNT(*)
+            FROM %I r
+            CROSS JOIN LATERAL (VALUES ('category', r.category), ('color', r.color), ('gate', r.gate))
+                AS dim (dimension, value)
+            WHERE dim.value IS NOT NULL
+            GROUP BY dim.dimension, dim.value
+            ORDER BY dim.dimension, dim.value
+            ON CONFLICT (dimension, value) DO UPDATE SET count = d.count + EXCLUDED.count
+        $sql$, part.name);
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', part.parent, part.name);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archive', part.name);
+        PERFORM pg_notify('parking_dimensions', 'DETACH');
+        RETURN NEXT part.name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A detections partition for every month parking has one for.
+DO $$
+BEGIN
+    PERFORM parking_create_table_partition('parking_detections', to_date(right(c.relname, 7), 'YYYY_MM'))
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'parking'::regclass
+      AND c.relname ~ '^parking_p[0-9]{4}_[0-9]{2}$';
+END;
+$$;
+
+WITH moved AS (
+    DELETE FROM parking WHERE category = 'pedestrian' RETURNING *
+)
+INSERT INTO parking_detections SELECT * FROM moved;
+
+ALTER TABLE parking ADD CONSTRAINT parking_vehicle_check CHECK (category <> 'pedestrian');
+ALTER TABLE parking_detections ADD CONSTRAINT parking_detections_pedestrian_check CHECK (category = 'pedestrian');
+
+-- The indexes /data and /count need when they read through parking_events.
+-- license_plate is nearly always '-', which btree deduplication keeps small.
+ALTER TABLE parking_detections ADD PRIMARY KEY (insertion_id, timestamp);
+CREATE INDEX IF NOT EXISTS parking_detections_timestamp_idx ON parking_detections (timestamp);
+CREATE INDEX IF NOT EXISTS parking_detections_license_plate_prefix_idx
+    ON parking_detections (license_plate text_pattern_ops);
+
+CREATE OR REPLACE VIEW parking_events AS
+    SELECT * FROM parking
+    UNION ALL
+    SELECT * FROM parking_detections;
+
+COMMIT;
+
+VACUUM (ANALYZE) parking;
+ANALYZE parking_detections;
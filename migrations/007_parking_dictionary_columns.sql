@@ -0,0 +1,204 @@
+-- Dictionary-encoded color, gate and description; integer zone.
+--
+-- These columns hold a handful of distinct values (the gate names, "ZONE 2 -
+-- Table", a few colors) repeated as text on every row. They become SMALLINT
+-- ids into parking_colors, parking_gates and parking_descriptions
+-- (color_id, gate_id, description_id), and zone, the numeric cube id, an
+-- INTEGER; a zone that is not a number is stored as NULL. Rows get narrower
+-- and GROUP BY gate or color works on integers.
+--
+-- category stays text: its values are as short as an id, and the CHECK
+-- constraints of migration 006 on it are what let the planner skip
+-- parking_detections for vehicle-only filters.
+--
+-- Queries that return or filter on the decoded columns read the views
+-- parking_vehicles (parking) and parking_events (both tables), which have
+-- the old columns in the old order. Writers store ids: the webhook ingester
+-- keeps the dimension tables cached and adds new values as it meets them.
+--
+-- Every row is rewritten, including partitions detached to the `archive`
+-- schema and not yet moved to Parquet, so stop the webhook ingester while
+-- this runs.
+BEGIN;
+
+LOCK TABLE parking, parking_detections IN ACCESS EXCLUSIVE MODE;
+
+CREATE TABLE IF NOT EXISTS parking_colors (
+    id SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS parking_gates (
+    id SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS parking_descriptions (
+    id SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+-- Recreated below with the decoded columns.
+DROP VIEW IF EXISTS parking_events;
+
+CREATE FUNCTION pg_temp.color_id(value TEXT) RETURNS SMALLINT AS $$
+    SELECT id FROM parking_colors WHERE name = value
+$$ LANGUAGE sql STABLE;
+CREATE FUNCTION pg_temp.gate_id(value TEXT) RETURNS SMALLINT AS $$
+    SELECT id FROM parking_gates WHERE name = value
+$$ LANGUAGE sql STABLE;
+CREATE FUNCTION pg_temp.description_id(value TEXT) RETURNS SMALLINT AS $$
+    SELECT id FROM parking_descriptions WHERE name = value
+$$ LANGUAGE sql STABLE;
+
+-- Both parents (which recurse to their partitions) and the detached
+-- partitions still in the archive schema, each rewritten once.
+DO $$
+DECLARE
+    target TEXT;
+BEGIN
+    FOR target IN
+        SELECT 'parking'
+        UNION ALL
+        SELECT 'parking_detections'
+        UNION ALL
+        SELECT format('archive.%I', c.relname)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attname = 'color' AND NOT a.attisdropped
+        WHERE n.nspname = 'archive'
+          AND c.relkind = 'r'
+          AND c.relname ~ '^parking_(detections_)?p[0-9]{4}_[0-9]{2}$'
+    LOOP
+        EXECUTE format($sql$
+            INSERT INTO parking_colors (name)
+            SELECT DISTINCT color FROM %1$s WHERE color IS NOT NULL ORDER BY 1
+            ON CONFLICT (name) DO NOTHING;
+            INSERT INTO parking_gates (name)
+            SELECT DISTINCT gate FROM %1$s WHERE gate IS NOT NULL ORDER BY 1
+            ON CONFLICT (name) DO NOTHING;
+            INSERT INTO parking_descriptions (name)
+            SELECT DISTINCT description FROM %1$s WHERE description IS NOT NULL ORDER BY 1
+            ON CONFLICT (name) DO NOTHING;
+            ALTER TABLE %1$s
+                ALTER COLUMN color TYPE SMALLINT USING pg_temp.color_id(color),
+                ALTER COLUMN gate TYPE SMALLINT USING pg_temp.gate_id(gate),
+                ALTER COLUMN zone TYPE INTEGER USING CASE WHEN zone ~ '^[0-9]{1,9}$' THEN zone::integer END,
+                ALTER COLUMN description TYPE SMALLINT USING pg_temp.description_id(description);
+            ALTER TABLE %1$s RENAME COLUMN color TO color_id;
+            ALTER TABLE %1$s RENAME COLUMN gate TO gate_id;
+            ALTER TABLE %1$s RENAME COLUMN description TO description_id;
+        $sql$, target);
+    END LOOP;
+END;
+$$;
+
+ALTER TABLE parking
+    ADD CONSTRAINT parking_color_id_fkey FOREIGN KEY (color_id) REFERENCES parking_colors (id),
+    ADD CONSTRAINT parking_gate_id_fkey FOREIGN KEY (gate_id) REFERENCES parking_gates (id),
+    ADD CONSTRAINT parking_description_id_fkey FOREIGN KEY (description_id) REFERENCES parking_descriptions (id);
+ALTER TABLE parking_detections
+    ADD CONSTRAINT parking_detections_color_id_fkey FOREIGN KEY (color_id) REFERENCES parking_colors (id),
+    ADD CONSTRAINT parking_detections_gate_id_fkey FOREIGN KEY (gate_id) REFERENCES parking_gates (id),
+    ADD CONSTRAINT parking_detections_description_id_fkey
+        FOREIGN KEY (description_id) REFERENCES parking_descriptions (id);
+
+-- The filter options (migration 003) keep their color and gate names.
+CREATE OR REPLACE FUNCTION parking_dimension_counts_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO parking_dimension_counts AS d (dimension, value, count)
+        SELECT dim.dimension, dim.value, -COUNT(*)
+        FROM old_rows r
+        LEFT JOIN parking_colors c ON c.id = r.color_id
+        LEFT JOIN parking_gates g ON g.id = r.gate_id
+        CROSS JOIN LATERAL (VALUES ('category', r.category), ('color', c.name), ('gate', g.name))
+            AS dim (dimension, value)
+        WHERE dim.value IS NOT NULL
+        GROUP BY dim.dimension, dim.value
+        ORDER BY dim.dimension, dim.value
+        ON CONFLICT (dimension, value) DO UPDATE SET count = d.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO parking_dimension_counts AS d (dimension, value, count)
+        SELECT dim.dimension, dim.value, COUNT(*)
+        FROM new_rows r
+        LEFT JOIN parking_colors c ON c.id = r.color_id
+        LEFT JOIN parking_gates g ON g.id = r.gate_id
+        CROSS JOIN LATERAL (VALUES ('category', r.category), ('color', c.name), ('gate', g.name))
+            AS dim (dimension, value)
+        WHERE dim.value IS NOT NULL
+        GROUP BY dim.dimension, dim.value
+        ORDER BY dim.dimension, dim.value
+        ON CONFLICT (dimension, value) DO UPDATE SET count = d.count + EXCLUDED.count;
+    END IF;
+    PERFORM pg_notify('parking_dimensions', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Migration 006's retention, subtracting the decoded names.
+CREATE OR REPLACE FUNCTION parking_detach_expired_partitions(retention_months INTEGER)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    cutoff TIMESTAMPTZ := (date_trunc('month', now() AT TIME ZONE 'UTC')
+                           - make_interval(months => retention_months)) AT TIME ZONE 'UTC';
+    part RECORD;
+BEGIN
+    FOR part IN
+        SELECT c.relname AS name, i.inhparent::regclass::text AS parent
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent IN ('parking'::regclass, 'parking_detections'::regclass)
+          AND c.relname ~ '^parking_(detections_)?p[0-9]{4}_[0-9]{2}$'
+          AND (to_date(right(c.relname, 7), 'YYYY_MM') + INTERVAL '1 month')::timestamp
+              AT TIME ZONE 'UTC' <= cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format($sql$
+            INSERT INTO parking_dimension_counts AS d (dimension, value, count)
+            SELECT dim.dimension, dim.value, -COUNT(*)
+            FROM %I r
+            LEFT JOIN parking_colors c ON c.id = r.color_id
+            LEFT JOIN parking_gates g ON g.id = r.gate_id
+            CROSS JOIN LATERAL (VALUES ('category', r.category), ('color', c.name), ('gate', g.name))
+                AS dim (dimension, value)
+            WHERE dim.value IS NOT NULL
+            GROUP BY dim.dimension, dim.value
+            ORDER BY dim.dimension, dim.value
+            ON CONFLICT (dimension, value) DO UPDATE SET count = d.count + EXCLUDED.count
+        $sql$, part.name);
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', part.parent, part.name);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archive', part.name);
+        PERFORM pg_notify('parking_dimensions', 'DETACH');
+        RETURN NEXT part.name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The vehicle rows and every event, with the columns (and column order) the
+-- tables had before this migration. parking_events joins the names onto the
+-- UNION ALL of both tables, not onto each table, so that /data's ORDER BY
+-- timestamp LIMIT still merges the timestamp indexes of both. The left joins
+-- on the dimensions' primary keys are removed when a query uses none of
+-- their columns.
+CREATE OR REPLACE VIEW parking_vehicles AS
+    SELECT p.insertion_id, p.license_plate, p.category, c.name AS color, p.timestamp,
+           g.name AS gate, p.zone::text AS zone, d.name AS description, p.direction, p.vehicle_class
+    FROM parking p
+    LEFT JOIN parking_colors c ON c.id = p.color_id
+    LEFT JOIN parking_gates g ON g.id = p.gate_id
+    LEFT JOIN parking_descriptions d ON d.id = p.description_id;
+
+CREATE OR REPLACE VIEW parking_events AS
+    SELECT p.insertion_id, p.license_plate, p.category, c.name AS color, p.timestamp,
+           g.name AS gate, p.zone::text AS zone, d.name AS description, p.direction, p.vehicle_class
+    FROM (
+        SELECT * FROM parking
+        UNION ALL
+        SELECT * FROM parking_detections
+    ) p
+    LEFT JOIN parking_colors c ON c.id = p.color_id
+    LEFT JOIN parking_gates g ON g.id = p.gate_id
+    LEFT JOIN parking_descriptions d ON d.id = p.description_id;
+
+COMMIT;
+
+VACUUM (ANALYZE) parking, parking_detections, parking_colors, parking_gates, parking_descriptions;